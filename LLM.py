@@ -1,16 +1,64 @@
+from __future__ import annotations
 import json
-import boto3
+import random
+import time
+from typing import TYPE_CHECKING
 
 # Calling env variables
-import os
 from dotenv import load_dotenv
+import llm_cache
+import telemetry
+from resources import get_bedrock
+
+if TYPE_CHECKING:
+    import boto3
 
 load_dotenv()
 
-bedrock_runtime =  boto3.client( 
-                                service_name = 'bedrock-runtime', 
-                                region_name='us-east-1', 
-                            )     
+def __getattr__(name):
+    # Compatibilidad: 'LLM.bedrock_runtime' se crea en el primer acceso (ver resources.get_bedrock)
+    if name == "bedrock_runtime":
+        return get_bedrock()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+                       
+# Codigos de error de Bedrock que indican limitacion de tasa (reintentables)
+THROTTLING_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    Indica si la excepcion corresponde a un error de limitacion de tasa de Bedrock.
+    Se inspecciona error.response['Error']['Code'] (formato de botocore.ClientError).
+    """
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") in THROTTLING_CODES
+
+def call_with_backoff(fn, *args, max_retries: int = 6, base_delay: float = 0.5, max_delay: float = 20.0, **kwargs):
+    """
+    Ejecuta fn(*args, **kwargs) reintentando ante errores de limitacion de tasa,
+    con backoff exponencial y jitter completo (espera aleatoria en [0, base_delay * 2^intento]).
+
+    Args:
+        fn: Funcion a ejecutar (por ejemplo call_differences).
+        max_retries (int): Numero maximo de reintentos.
+        base_delay (float): Espera base en segundos.
+        max_delay (float): Tope de espera por reintento en segundos.
+
+    Returns:
+        El resultado de fn.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == max_retries or not is_throttling_error(e):
+                raise
+            telemetry.inc("llm_retries_total")
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
                        
 def claude_body(prompt : str, query : str):
         
@@ -29,64 +77,210 @@ def claude_body(prompt : str, query : str):
     })
     
 
-def embed_body(chunk_message : str):
-    return json.dumps({
-        'inputText' : chunk_message,
-        
-    })
+def embed_body(chunk_message : str, dimensions : int = None):
+    body = {'inputText' : chunk_message}
+    if dimensions is not None:
+        # Titan v2: 256, 512 o 1024 dimensiones, vectores normalizados
+        body['dimensions'] = dimensions
+        body['normalize'] = True
+    return json.dumps(body)
+
+
+def invoke_cached(bedrock : boto3.client, body : str, model_id : str, use_cache : bool = True):
+    """
+    Llama a invoke_model consultando antes la cache persistente de respuestas (llm_cache).
+    La clave incluye el modelo y el cuerpo completo (prompt, mensaje y parametros de generacion).
+
+    Args:
+        bedrock: Cliente de Bedrock.
+        body (str): Cuerpo JSON de la peticion.
+        model_id (str): Identificador del modelo.
+        use_cache (bool): False para ignorar la cache en esta llamada.
+
+    Returns:
+        dict: Respuesta decodificada del modelo.
+    """
+    cache = llm_cache.get_response_cache() if use_cache and llm_cache.ENABLED else None
+    if cache is not None:
+        key = cache.make_key(model_id, body)
+        cached = cache.get(key)
+        if cached is not None:
+            telemetry.annotate(cached=True)
+            return cached
+
+    response = bedrock.invoke_model(
+        body = body,
+        modelId = model_id,
+        contentType = 'application/json',
+        accept = 'application/json'
+    )    
+    result = json.loads(response['body'].read().decode('utf-8'))
+
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
+def _record_usage(span, model_id: str, usage: dict, cached: bool = False) -> None:
+    """
+    Registra en el span y en los contadores los tokens informados en 'usage' de la respuesta.
+    """
+    input_tokens = usage.get("input_tokens", 0)
+    output_tokens = usage.get("output_tokens", 0)
+    span.set(input_tokens=input_tokens, output_tokens=output_tokens)
+    telemetry.inc("llm_calls_total", model=model_id, cached=str(cached).lower())
+    if not cached:
+        telemetry.inc("llm_input_tokens_total", input_tokens, model=model_id)
+        telemetry.inc("llm_output_tokens_total", output_tokens, model=model_id)
+
+
+def _traced_invoke(name: str, bedrock : boto3.client, body : str, model_id : str, use_cache : bool):
+    """
+    invoke_cached medido como el span 'name' (latencia, tokens de entrada/salida y si vino de la cache).
+    """
+    with telemetry.span(name, model=model_id) as span:
+        result = invoke_cached(bedrock, body, model_id, use_cache)
+        if isinstance(span, telemetry.Span):
+            _record_usage(span, model_id, result.get("usage", {}), cached=span.attrs.get("cached", False))
+    return result
 
 
 # Llamada al LLM
 def claude_call( bedrock : boto3.client, 
                 user_message : str, 
                 query : str,
-                model_id = 'anthropic.claude-3-5-sonnet-20240620-v1:0'):
+                model_id = 'anthropic.claude-3-5-sonnet-20240620-v1:0',
+                use_cache : bool = True):
     
     body = claude_body(user_message, query=query)
 
-    response = bedrock.invoke_model(
+    return _traced_invoke("llm.claude_call", bedrock, body, model_id, use_cache)
+
+
+# Llamada al LLM con respuesta en streaming
+def claude_stream(bedrock : boto3.client,
+                  user_message : str,
+                  query : str,
+                  model_id = 'anthropic.claude-3-5-sonnet-20240620-v1:0',
+                  use_cache : bool = True,
+                  stats : dict = None):
+    """
+    Igual que claude_call pero con invoke_model_with_response_stream: devuelve un generador
+    que entrega los fragmentos de texto a medida que el modelo los genera.
+
+    Si la respuesta esta en la cache (llm_cache) se entrega completa de una vez; al terminar
+    el stream, la respuesta completa se guarda en la cache con el formato de invoke_model.
+
+    Args:
+        bedrock: Cliente de Bedrock.
+        user_message (str): Prompt de sistema.
+        query (str): Mensaje del usuario.
+        model_id (str): Identificador del modelo.
+        use_cache (bool): False para ignorar la cache en esta llamada.
+        stats (dict): Si se indica, se completa con ttft (segundos hasta el primer fragmento),
+            duration, input_tokens, output_tokens, tokens_per_s y cached.
+
+    Yields:
+        str: Fragmentos de texto de la respuesta.
+    """
+    stats = {} if stats is None else stats
+    body = claude_body(user_message, query=query)
+    inicio = time.perf_counter()
+    # start_span: el span no pasa a ser el actual mientras el generador entrega fragmentos
+    span = telemetry.start_span("llm.claude_stream", model=model_id)
+    try:
+        yield from _stream_response(bedrock, body, model_id, use_cache, stats, inicio)
+    finally:
+        if isinstance(span, telemetry.Span) and stats:
+            span.set(**{key: stats[key] for key in ("ttft", "cached") if key in stats})
+            _record_usage(span, model_id, stats, cached=stats.get("cached", False))
+        span.end()
+
+
+def _stream_response(bedrock : boto3.client, body : str, model_id : str, use_cache : bool, stats : dict, inicio : float):
+    """
+    Cuerpo de claude_stream: consulta la cache, llama a invoke_model_with_response_stream y completa 'stats'.
+    """
+    cache = llm_cache.get_response_cache() if use_cache and llm_cache.ENABLED else None
+    if cache is not None:
+        key = cache.make_key(model_id, body)
+        cached = cache.get(key)
+        if cached is not None:
+            usage = cached.get("usage", {})
+            stats.update(ttft=time.perf_counter() - inicio, duration=time.perf_counter() - inicio,
+                         input_tokens=usage.get("input_tokens", 0), output_tokens=usage.get("output_tokens", 0),
+                         tokens_per_s=0.0, cached=True)
+            yield cached['content'][0]['text']
+            return
+
+    response = call_with_backoff(
+        bedrock.invoke_model_with_response_stream,
         body = body,
         modelId = model_id,
         contentType = 'application/json',
         accept = 'application/json'
-    )    
+    )
+    partes = []
+    usage = {"input_tokens": 0, "output_tokens": 0}
+    ttft = None
+    for event in response['body']:
+        chunk = event.get('chunk')
+        if not chunk:
+            continue
+        data = json.loads(chunk['bytes'])
+        if data['type'] == 'message_start':
+            usage["input_tokens"] = data['message'].get('usage', {}).get('input_tokens', 0)
+        elif data['type'] == 'content_block_delta' and data['delta'].get('type') == 'text_delta':
+            if ttft is None:
+                ttft = time.perf_counter() - inicio
+            partes.append(data['delta']['text'])
+            yield data['delta']['text']
+        elif data['type'] == 'message_delta':
+            usage["output_tokens"] = data.get('usage', {}).get('output_tokens', 0)
+
+    duration = time.perf_counter() - inicio
+    ttft = duration if ttft is None else ttft
+    generacion = duration - ttft
+    stats.update(ttft=ttft, duration=duration, input_tokens=usage["input_tokens"],
+                 output_tokens=usage["output_tokens"],
+                 tokens_per_s=usage["output_tokens"] / generacion if generacion > 0 else 0.0, cached=False)
 
-    return json.loads(response['body'].read().decode('utf-8'))
+    if cache is not None:
+        cache.put(key, {"content": [{"type": "text", "text": "".join(partes)}], "usage": usage})
 
 
 
 # Llamada al modelo de embedding
-def embed_call(bedrock : boto3.client, chunk_message : str):
+def embed_call(bedrock : boto3.client, chunk_message : str,
+               model_id : str = "amazon.titan-embed-text-v2:0",
+               dimensions : int = None):
     
-    model_id = "amazon.titan-embed-text-v2:0"
-    body = embed_body(chunk_message)
-
-    response = bedrock.invoke_model(
-        body = body,
-        modelId = model_id,
-        contentType = 'application/json',
-        accept = 'application/json'        
-    )    
+    body = embed_body(chunk_message, dimensions)
 
-    return json.loads(response['body'].read().decode('utf-8'))
+    with telemetry.span("llm.embed_call", model=model_id) as span:
+        response = bedrock.invoke_model(
+            body = body,
+            modelId = model_id,
+            contentType = 'application/json',
+            accept = 'application/json'        
+        )    
+        result = json.loads(response['body'].read().decode('utf-8'))
+        if isinstance(span, telemetry.Span):
+            # Titan informa los tokens de entrada en 'inputTextTokenCount'
+            _record_usage(span, model_id, {"input_tokens": result.get("inputTextTokenCount", 0)})
+    return result
  
 def call_differences(bedrock : boto3.client, 
                      user_message : str, 
                      query : str,
-                     model_id = 'anthropic.claude-3-5-sonnet-20240620-v1:0'):
+                     model_id = 'anthropic.claude-3-5-sonnet-20240620-v1:0',
+                     use_cache : bool = True):
     
     body = claude_body(user_message, query=query)
 
-    response = bedrock.invoke_model(
-        body = body,
-        modelId = model_id,
-        contentType = 'application/json',
-        accept = 'application/json'
-    )    
-
-    return json.loads(response['body'].read().decode('utf-8'))
+    return _traced_invoke("llm.call_differences", bedrock, body, model_id, use_cache)
 
 
 if __name__ == "__main__":
-    print(claude_call(bedrock_runtime, "Hello", "How are you?"))
-    print(embed_call(bedrock_runtime, "Hello, how are you?"))
\ No newline at end of file
+    print(claude_call(get_bedrock(), "Hello", "How are you?"))
+    print(embed_call(get_bedrock(), "Hello, how are you?"))
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""
+Cache semantica de respuestas de RAG.
+
+Las preguntas se repiten con otras palabras ("¿Que diferencias hay en las secciones
+Antecedentes...?" y la misma pregunta con la numeracion de las secciones). Antes de enrutar la
+pregunta (rag.answer_question) se codifica la pregunta normalizada con el proveedor de
+embeddings y se busca la respuesta guardada mas cercana en la tabla 'answer_cache' (indice
+HNSW con distancia coseno, ver db/answer_cache_db.py). Si la similitud coseno supera el umbral
+se devuelve esa respuesta sin recuperar contexto ni llamar al LLM.
+
+Para no confundir "seccion 5.1" con "seccion 5.2" (embeddings casi iguales), si ambas preguntas
+mencionan numeros de seccion estos deben coincidir.
+
+Cada entrada recuerda los documentos de los que salio su contexto; al reingresar los chunks o
+las diferencias de un documento (db/embedding_db.py, db/difference_db.py) se eliminan las
+entradas que dependen de el.
+
+Variables de entorno:
+    ANSWER_CACHE            "0" desactiva la cache.
+    ANSWER_CACHE_THRESHOLD  Similitud coseno minima para reutilizar una respuesta (por defecto 0.92).
+    ANSWER_CACHE_EF_SEARCH  Candidatos del indice HNSW en la busqueda (por defecto 400, ver db/answer_cache_db.py).
+"""
+import os
+import re
+import threading
+import time
+
+import telemetry
+from db.answer_cache_db import (create_answer_cache_table, lookup_answer, insert_answer, record_hit,
+                                answer_cache_totals)
+from db.encoding import encode_query
+from parser.Parser_pdf2 import remove_connector_words, normalize_text
+
+ENABLED = os.getenv("ANSWER_CACHE", "1") != "0"
+THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+
+_NUMEROS = re.compile(r'\d+(?:\.\d+)*')
+
+
+def normalize_question(question: str) -> str:
+    """
+    Pregunta normalizada como en la recuperacion (sin conectores, minusculas, sin tildes) y
+    sin signos de puntuacion sueltos.
+    """
+    texto = normalize_text(remove_connector_words(question))
+    texto = re.sub(r'(?<!\d)\.|\.(?!\d)|[¿?¡!,;:]', ' ', texto)
+    return " ".join(texto.split())
+
+
+def question_numbers(question: str) -> str:
+    """
+    Numeros de seccion mencionados en la pregunta, ordenados ("5.1,7"); "" si no hay.
+    """
+    return ",".join(sorted(set(_NUMEROS.findall(question))))
+
+
+class SemanticCache:
+    """
+    Cache semantica de respuestas con contadores de aciertos y latencia ahorrada del proceso.
+
+    Args:
+        threshold (float): Similitud coseno minima para reutilizar una respuesta.
+        enabled (bool): Si es False lookup no encuentra nada y store no guarda.
+    """
+    def __init__(self, threshold: float = THRESHOLD, enabled: bool = ENABLED):
+        self.threshold = threshold
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.lookup_seconds = 0.0
+        self._tabla_creada = False
+        self._lock = threading.Lock()
+
+    def _asegurar_tabla(self, conn) -> None:
+        if not self._tabla_creada:
+            create_answer_cache_table(conn)
+            self._tabla_creada = True
+
+    def lookup(self, conn, question: str) -> dict:
+        """
+        Busca una respuesta para 'question'.
+
+        Returns:
+            dict: answer (None si no hay acierto), similarity, y la clave de la pregunta
+            (normalized, numbers, embedding) para pasarla a store.
+        """
+        normalized = normalize_question(question)
+        clave = {"normalized": normalized, "numbers": question_numbers(normalized), "answer": None,
+                 "similarity": None}
+        if not self.enabled:
+            return clave
+        inicio = time.perf_counter()
+        with telemetry.span("answer_cache.lookup") as span:
+            self._asegurar_tabla(conn)
+            clave["embedding"] = encode_query(normalized)
+            fila = lookup_answer(conn, clave["embedding"], clave["numbers"])
+            if fila is not None:
+                clave["similarity"] = float(fila[3])
+            if fila is not None and fila[3] >= self.threshold:
+                record_hit(conn, fila[0])
+                clave["answer"], clave["latency"] = fila[1], float(fila[2] or 0.0)
+            span.set(hit=clave["answer"] is not None, similarity=clave["similarity"])
+        duracion = time.perf_counter() - inicio
+        with self._lock:
+            self.lookup_seconds += duracion
+            if clave["answer"] is not None:
+                self.hits += 1
+                self.saved_seconds += max(clave["latency"] - duracion, 0.0)
+            else:
+                self.misses += 1
+        telemetry.inc("answer_cache_lookups_total", result="hit" if clave["answer"] is not None else "miss")
+        return clave
+
+    def store(self, conn, question: str, clave: dict, answer: str, compare: bool, documents, latency: float) -> None:
+        """
+        Guarda la respuesta generada para la pregunta de 'clave' (devuelta por lookup).
+
+        Args:
+            documents (set): Documentos usados como contexto (None si no se conocen).
+            latency (float): Segundos que tomo generar la respuesta.
+        """
+        if not self.enabled or not answer or "embedding" not in clave:
+            return
+        insert_answer(conn, question, clave["normalized"], clave["numbers"], answer, compare, documents, latency,
+                      clave["embedding"])
+
+    def stats(self, conn=None) -> dict:
+        """
+        Aciertos, fallos, tasa de aciertos y segundos ahorrados desde que se creo la cache y,
+        si se pasa 'conn', los totales acumulados en la tabla.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "lookup_ms_avg": self.lookup_seconds / total * 1000 if total else 0.0,
+            }
+        if conn is not None and self.enabled:
+            self._asegurar_tabla(conn)
+            stats["table"] = answer_cache_totals(conn)
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache() -> SemanticCache:
+    """
+    Cache semantica compartida por el proceso.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache()
+    return _cache
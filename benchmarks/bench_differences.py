@@ -0,0 +1,80 @@
+"""
+Compara el diffing por secciones contra un Bedrock simulado:
+  - secuencial vs concurrente (max_in_flight);
+  - secciones completas vs diff local por oraciones (solo se envian las oraciones cambiadas
+    y las secciones sin cambios no llaman al LLM).
+
+Uso:
+    python -m benchmarks.bench_differences --sections 40 --latency 0.3 --throttle-rate 0.1 --max-in-flight 8 --changed 0.1
+"""
+import argparse
+import os
+import random
+import re
+import time
+
+# Las respuestas simuladas no deben guardarse en la cache persistente del LLM
+os.environ.setdefault("LLM_CACHE", "0")
+
+from benchmarks.fakes import FakeBedrock
+from parser.Chunking_loading import chunk_text_indexes_differences
+from parser.differences import NO_DIFFERENCES
+
+
+def build_texts(n_sections: int, changed: float = 1.0, sentences: int = 8, seed: int = 0) -> tuple[str, str, list[str], list[bool]]:
+    """
+    Dos versiones de un documento de 'n_sections' secciones; en una fraccion 'changed' de las
+    secciones se modifica una oracion.
+    """
+    rng = random.Random(seed)
+    indices = [f"{i}. seccion numero {i}" for i in range(1, n_sections + 1)]
+    cambiadas = [rng.random() < changed for _ in indices]
+    partes1, partes2 = [], []
+    for i, (idx, cambiada) in enumerate(zip(indices, cambiadas)):
+        oraciones = [f"la oracion {j} de la seccion {i} describe el servicio con detalle suficiente." for j in range(sentences)]
+        partes1.append(idx + " " + " ".join(oraciones))
+        if cambiada:
+            oraciones[sentences // 2] = f"la oracion {sentences // 2} de la seccion {i} describe el servicio modificado."
+        partes2.append(idx + " " + " ".join(oraciones))
+    return " ".join(partes1), " ".join(partes2), indices, cambiadas
+
+
+def responder(body: dict) -> str:
+    # La respuesta incluye el numero de seccion para verificar que se conserva el orden
+    return re.search(r"de la seccion (\d+)", body["system"]).group(1)
+
+
+def run(max_in_flight: int, texto1: str, texto2: str, indices: list[str], cambiadas: list[bool],
+        latency: float, throttle_rate: float, local_diff: bool):
+    fake = FakeBedrock(latency=latency, throttle_rate=throttle_rate, responses=responder)
+    inicio = time.perf_counter()
+    markers, differences = chunk_text_indexes_differences(texto1, texto2, indices, max_in_flight=max_in_flight,
+                                                          bedrock=fake, local_diff=local_diff)
+    duracion = time.perf_counter() - inicio
+    esperado = [str(i) if (cambiada or not local_diff) else NO_DIFFERENCES for i, cambiada in enumerate(cambiadas)]
+    assert differences == esperado, "el orden de las secciones no se conservo"
+    print(f"max_in_flight={max_in_flight:>3}  local_diff={str(local_diff):<5}  {duracion:7.2f}s  llamadas={fake.calls}  "
+          f"throttled={fake.throttled}  max_concurrentes={fake.max_in_flight}  tokens_entrada={fake.input_tokens}")
+    return duracion, fake
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--throttle-rate", type=float, default=0.1)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--changed", type=float, default=0.1, help="Fraccion de secciones modificadas")
+    args = parser.parse_args()
+
+    texto1, texto2, indices, cambiadas = build_texts(args.sections, args.changed)
+    secuencial, _ = run(1, texto1, texto2, indices, cambiadas, args.latency, args.throttle_rate, local_diff=False)
+    concurrente, completo = run(args.max_in_flight, texto1, texto2, indices, cambiadas, args.latency, args.throttle_rate,
+                                local_diff=False)
+    local, diff_local = run(args.max_in_flight, texto1, texto2, indices, cambiadas, args.latency, args.throttle_rate,
+                            local_diff=True)
+    print(f"speedup concurrencia: {secuencial / concurrente:.1f}x")
+    print(f"diff local: llamadas {completo.calls} -> {diff_local.calls}, "
+          f"tokens de entrada {completo.input_tokens} -> {diff_local.input_tokens} "
+          f"({completo.input_tokens / max(diff_local.input_tokens, 1):.1f}x), "
+          f"tiempo {concurrente:.2f}s -> {local:.2f}s")
@@ -0,0 +1,269 @@
+"""
+Benchmark de extremo a extremo sin AWS ni Postgres.
+
+Bedrock se reemplaza por FakeBedrock (latencia y respuestas configurables), el modelo de
+embeddings por FakeEncoder y la base de datos por el backend NumpyVectorStore en un directorio
+temporal. Se mide cada etapa de la ingesta (main.parser_uniformizador) y de la ruta de
+consulta de rag.py:
+
+  ingesta:  extraccion, eliminar_indice, normalizacion, chunking, diferencias, embedding, insercion
+  consulta: enrutamiento, embedding, recuperacion, llm
+
+Los resultados (mediana de --repeat ejecuciones) se guardan en JSON y se pueden comparar
+con una ejecucion anterior: las etapas mas lentas que la linea base (mas de --tolerance y
+mas de --min-delta-ms) se marcan como regresion y el proceso termina con codigo 1.
+
+Uso:
+    python -m benchmarks.bench_e2e --output bench_e2e.json
+    python -m benchmarks.bench_e2e --baseline bench_e2e.json --tolerance 0.2
+    python -m benchmarks.bench_e2e data/tdr_v4.pdf data/tdr_v6.pdf --llm-latency 0.3 --encode-latency 0.002
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Las respuestas simuladas no deben guardarse en la cache persistente del LLM
+os.environ.setdefault("LLM_CACHE", "0")
+
+import resources
+import telemetry
+from benchmarks.fakes import FakeBedrock, FakeEncoder
+from db.numpy_store import NumpyVectorStore
+from db.embedding_db import create_embedding_table, insert_embedding_chunks
+from db.difference_db import create_difference_table, insert_differences_chunks
+from LLM import claude_call
+from parser.Parser_pdf2 import extraer_texto, eliminar_indice, remove_connector_words, remove_pagination_words
+from parser.Chunking_loading import chunk_document, chunk_text_indexes_differences
+from parser.sections import SectionTable
+
+INGEST_STAGES = ["extraccion", "eliminar_indice", "normalizacion", "chunking", "diferencias", "embedding", "insercion"]
+QUERY_STAGES = ["enrutamiento", "embedding", "recuperacion", "llm"]
+
+
+class StageTimer:
+    """
+    Acumula el tiempo de cada etapa (segundos).
+    """
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - inicio)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+
+class TimedEncoder:
+    """
+    Envuelve un codificador y acumula el tiempo de encode, para separar el calculo de
+    embeddings del resto de la etapa que lo llama (insercion, recuperacion).
+    """
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.seconds = 0.0
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.encoder.get_sentence_embedding_dimension()
+
+    def encode(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return self.encoder.encode(*args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - inicio
+
+    def take(self) -> float:
+        seconds, self.seconds = self.seconds, 0.0
+        return seconds
+
+
+def run_ingest(pdf1: str, pdf2: str, store: NumpyVectorStore, bedrock: FakeBedrock, encoder: TimedEncoder) -> dict:
+    """
+    Mismas etapas que main.parser_uniformizador (modo completo), sin escribir archivos de salida.
+    """
+    with telemetry.span("ingest", benchmark=True):
+        return _run_ingest(pdf1, pdf2, store, bedrock, encoder)
+
+
+def _run_ingest(pdf1: str, pdf2: str, store: NumpyVectorStore, bedrock: FakeBedrock, encoder: TimedEncoder) -> dict:
+    timer = StageTimer()
+    name1 = os.path.basename(pdf1).split(".")[0]
+    name2 = os.path.basename(pdf2).split(".")[0]
+
+    with timer.stage("extraccion"):
+        texto1, titulo1 = extraer_texto(pdf1)
+        texto2, titulo2 = extraer_texto(pdf2)
+    with timer.stage("eliminar_indice"):
+        texto1, indexes1 = eliminar_indice(texto1, titulo1)
+        texto2, indexes2 = eliminar_indice(texto2, titulo2)
+    with timer.stage("normalizacion"):
+        texto1 = remove_pagination_words(remove_connector_words(texto1))
+        texto2 = remove_pagination_words(remove_connector_words(texto2))
+    with timer.stage("chunking"):
+        table1 = SectionTable(texto1, indexes1)
+        table2 = SectionTable(texto2, indexes2)
+        chunks1, indexes1_, _, spans1 = chunk_document(table1)
+        chunks2, indexes2_, _, spans2 = chunk_document(table2)
+    indexes_diff = sorted(set(indexes1).intersection(indexes2))
+    # Como main.py: index.txt con los indices comunes (lo usa el enrutador de la ruta de consulta)
+    with open("index.txt", "w", encoding="utf-8") as f:
+        for index in indexes_diff:
+            f.write(f"{index}\n")
+    with timer.stage("diferencias"):
+        indexes_diff_, differences = chunk_text_indexes_differences(texto1, texto2, indexes_diff, bedrock=bedrock,
+                                                                    table1=table1, table2=table2)
+
+    encoder.take()
+    inicio = time.perf_counter()
+    create_embedding_table(store)
+    create_difference_table(store)
+    insert_embedding_chunks(store, chunks1, indexes1_, name1, spans=spans1)
+    insert_embedding_chunks(store, chunks2, indexes2_, name2, spans=spans2)
+    insert_differences_chunks(store, differences, chunks1, indexes_diff_)
+    total = time.perf_counter() - inicio
+    embedding = encoder.take()
+    timer.add("embedding", embedding)
+    timer.add("insercion", total - embedding)
+
+    counts = {"chunks": len(chunks1) + len(chunks2), "sections": len(indexes_diff), "llm_calls": bedrock.calls}
+    return {"stages": timer.stages, "counts": counts}
+
+
+def run_queries(queries: list[str], store: NumpyVectorStore, bedrock: FakeBedrock, encoder: TimedEncoder) -> dict:
+    """
+    Ruta de rag.answer_question por etapas, para cada pregunta.
+    """
+    import rag
+
+    timer = StageTimer()
+    latencias = []
+    for query in queries:
+        inicio = time.perf_counter()
+        encoder.take()
+        with telemetry.span("rag.answer_question", benchmark=True):
+            with timer.stage("enrutamiento"):
+                compare, list_indexes = rag.route_query(query, local_router=True)
+            antes = time.perf_counter()
+            prompt = (rag.prompt_differences if compare else rag.prompt_QA)(query, store, list_indexes)
+            embedding = encoder.take()
+            timer.add("embedding", embedding)
+            timer.add("recuperacion", time.perf_counter() - antes - embedding)
+            with timer.stage("llm"):
+                claude_call(bedrock, prompt, query, use_cache=False)
+        latencias.append(time.perf_counter() - inicio)
+    latencias.sort()
+    return {
+        "stages": timer.stages,
+        "latency": {"p50": statistics.median(latencias),
+                    "p95": latencias[max(0, int(len(latencias) * 0.95) - 1)],
+                    "max": latencias[-1]},
+        "counts": {"queries": len(queries)},
+    }
+
+
+def _median_stages(runs: list[dict], stages: list[str]) -> dict:
+    return {stage: statistics.median(run["stages"].get(stage, 0.0) for run in runs) for stage in stages}
+
+
+def run(pdf1: str, pdf2: str, repeat: int, llm_latency: float, encode_latency: float, dim: int) -> dict:
+    from Questions import Querys
+
+    ingestas, consultas = [], []
+    for _ in range(repeat):
+        bedrock = FakeBedrock(latency=llm_latency)
+        encoder = TimedEncoder(FakeEncoder(dim=dim, latency_per_text=encode_latency))
+        resources.set_resource("bedrock", bedrock)
+        resources.set_resource("embedding_model", encoder)
+        with tempfile.TemporaryDirectory() as directorio:
+            store = NumpyVectorStore(directorio)
+            ingestas.append(run_ingest(pdf1, pdf2, store, bedrock, encoder))
+            consultas.append(run_queries(Querys, store, bedrock, encoder))
+            store.close()
+    resources.reset()
+
+    ingest = _median_stages(ingestas, INGEST_STAGES)
+    query = _median_stages(consultas, QUERY_STAGES)
+    return {
+        "config": {"pdfs": [pdf1, pdf2], "repeat": repeat, "llm_latency": llm_latency,
+                   "encode_latency": encode_latency, "dim": dim,
+                   "python": platform.python_version(), "platform": platform.platform()},
+        "ingest": {**ingest, "total": sum(ingest.values())},
+        "query": {**query, "total": sum(query.values())},
+        "query_latency": {key: statistics.median(c["latency"][key] for c in consultas) for key in ("p50", "p95", "max")},
+        "counts": {**ingestas[-1]["counts"], **consultas[-1]["counts"]},
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list[str]:
+    """
+    Imprime la comparacion con la linea base y devuelve las etapas con regresion.
+    """
+    regresiones = []
+    print(f"\n{'etapa':<28} {'base (ms)':>10} {'actual (ms)':>12} {'cambio':>8}")
+    for seccion in ("ingest", "query", "query_latency"):
+        for stage, actual in result[seccion].items():
+            base = baseline.get(seccion, {}).get(stage)
+            if base is None or stage == "max":
+                # El maximo de una sola pregunta es demasiado ruidoso para comparar
+                continue
+            delta_ms = (actual - base) * 1000
+            cambio = (actual / base - 1) if base > 0 else 0.0
+            regresion = cambio > tolerance and delta_ms > min_delta_ms
+            if regresion:
+                regresiones.append(f"{seccion}.{stage}")
+            print(f"{seccion + '.' + stage:<28} {base * 1000:10.1f} {actual * 1000:12.1f} {cambio:+8.1%}"
+                  f"{'  REGRESION' if regresion else ''}")
+    return regresiones
+
+
+def report(result: dict) -> None:
+    for seccion in ("ingest", "query"):
+        print(f"{seccion}:")
+        for stage, seconds in result[seccion].items():
+            print(f"  {stage:<18} {seconds * 1000:10.1f} ms")
+    latency = result["query_latency"]
+    print(f"latencia por pregunta: p50={latency['p50'] * 1000:.1f} ms  p95={latency['p95'] * 1000:.1f} ms  "
+          f"max={latency['max'] * 1000:.1f} ms")
+    print(f"conteos: {result['counts']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdfs", nargs="*", default=["data/tdr_v4.pdf", "data/tdr_v6.pdf"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Segundos por llamada a Bedrock simulada")
+    parser.add_argument("--encode-latency", type=float, default=0.0, help="Segundos por texto codificado")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--baseline", help="Resultados JSON anteriores con los que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Aumento relativo tolerado por etapa")
+    parser.add_argument("--min-delta-ms", type=float, default=10.0, help="Aumento absoluto minimo para marcar regresion")
+    args = parser.parse_args()
+    if len(args.pdfs) != 2:
+        parser.error("se necesitan exactamente dos PDFs")
+
+    result = run(args.pdfs[0], args.pdfs[1], args.repeat, args.llm_latency, args.encode_latency, args.dim)
+    report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Resultados guardados en {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regresiones = compare(result, baseline, args.tolerance, args.min_delta_ms)
+        if regresiones:
+            print(f"Regresiones: {', '.join(regresiones)}")
+            sys.exit(1)
@@ -0,0 +1,105 @@
+"""
+Latencia de retrieve_knn_QA a medida que crece la tabla 'chunks', con y sin indices.
+
+Carga filas sinteticas (vectores aleatorios normalizados y etiquetas de seccion) en una
+base de datos Postgres local con pgvector y pg_trgm, en una tabla de trabajo que
+reemplaza temporalmente a 'chunks' (se usa un esquema aparte para no tocar los datos).
+
+Uso:
+    python -m benchmarks.bench_knn --sizes 10000 100000 1000000 --queries 50
+    python -m benchmarks.bench_knn --index ivfflat --probes 20
+"""
+import argparse
+import io
+import statistics
+import time
+
+import numpy as np
+
+import resources
+from benchmarks.fakes import FakeEncoder
+from db.connection import create_conn
+from db.indexes import create_search_indexes, maintain_search_indexes
+from parser.Chunking_loading import retrieve_knn_QA
+
+SCHEMA = "bench_knn"
+SECCIONES = [f"{i}.{j}. seccion {i} apartado {j}" for i in range(1, 30) for j in range(1, 6)]
+
+
+def load_rows(conn, n_from: int, n_to: int, dim: int, rng) -> None:
+    """
+    Agrega filas [n_from, n_to) con COPY.
+    """
+    cur = conn.cursor()
+    buffer = io.StringIO()
+    for start in range(n_from, n_to, 50000):
+        stop = min(start + 50000, n_to)
+        vectors = rng.standard_normal((stop - start, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        buffer.seek(0)
+        buffer.truncate()
+        for i, vector in enumerate(vectors):
+            seccion = SECCIONES[(start + i) % len(SECCIONES)]
+            buffer.write(f"doc\t{{\"{seccion}\"}}\tchunk {start + i}\t[{','.join(f'{x:.5f}' for x in vector)}]\n")
+        buffer.seek(0)
+        cur.copy_expert("COPY chunks (name, indexes, text, embedding) FROM STDIN", buffer)
+    conn.commit()
+    cur.close()
+
+
+def time_queries(conn, queries: list[str], list_indexes) -> list[float]:
+    latencias = []
+    for query in queries:
+        inicio = time.perf_counter()
+        retrieve_knn_QA(conn, query, list_indexes, k=5)
+        latencias.append(time.perf_counter() - inicio)
+    return latencias
+
+
+def main(sizes: list[int], n_queries: int, dim: int, index_type: str, ef_search: int, probes: int) -> None:
+    resources.set_resource("embedding_model", FakeEncoder(dim))
+    conn = create_conn()
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+    cur.execute(f"SET search_path TO {SCHEMA}, public;")
+    cur.execute(f"CREATE TABLE chunks (id SERIAL PRIMARY KEY, name TEXT, indexes TEXT, text TEXT, embedding VECTOR({dim}));")
+    conn.commit()
+
+    import db.indexes
+    db.indexes.HNSW_EF_SEARCH, db.indexes.IVFFLAT_PROBES = ef_search, probes
+
+    rng = np.random.default_rng(0)
+    queries = [f"consulta numero {i} sobre plazos y seguros" for i in range(n_queries)]
+    filtro = [SECCIONES[3]]
+    cargadas = 0
+    print(f"{'filas':>10} {'modo':<14} {'sin indice p50':>15} {'con indice p50':>15} {'p95':>9}")
+    for size in sizes:
+        load_rows(conn, cargadas, size, dim, rng)
+        cargadas = size
+        cur.execute("ANALYZE chunks;")
+        for nombre, list_indexes in [("todas", []), ("por seccion", filtro)]:
+            cur.execute(f"DROP INDEX IF EXISTS chunks_embedding_{index_type}; DROP INDEX IF EXISTS chunks_indexes_trgm;")
+            conn.commit()
+            sin_indice = time_queries(conn, queries, list_indexes)
+            create_search_indexes(conn, "chunks", index_type=index_type)
+            maintain_search_indexes(conn, "chunks", index_type=index_type)
+            con_indice = time_queries(conn, queries, list_indexes)
+            con_indice.sort()
+            print(f"{size:>10} {nombre:<14} {statistics.median(sin_indice) * 1000:>12.2f} ms "
+                  f"{statistics.median(con_indice) * 1000:>12.2f} ms {con_indice[int(len(con_indice) * 0.95) - 1] * 1000:>6.2f} ms")
+
+    cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE;")
+    conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--index", choices=["hnsw", "ivfflat"], default="hnsw")
+    parser.add_argument("--ef-search", type=int, default=40)
+    parser.add_argument("--probes", type=int, default=10)
+    args = parser.parse_args()
+    main(args.sizes, args.queries, args.dim, args.index, args.ef_search, args.probes)
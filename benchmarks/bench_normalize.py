@@ -0,0 +1,103 @@
+"""
+Normalizacion de texto: funciones originales de Parser_pdf2 frente a TextNormalizer
+(parser/normalizer.py) sobre el texto de los PDFs de data/.
+
+Se verifica que la salida sea identica (tambien la de TextNormalizer.stream sobre las
+paginas) y se mide cada paso: normalize_text, remove_connector_words y remove_pagination_words.
+
+Uso:
+    python -m benchmarks.bench_normalize
+    python -m benchmarks.bench_normalize --repeat 20 data/tdr_v4.pdf
+"""
+import argparse
+import re
+import statistics
+import time
+import unicodedata
+
+from parser.Parser_pdf2 import extraer_paginas
+from parser.normalizer import TextNormalizer
+
+
+# Implementacion original (referencia)
+def legacy_remove_connector_words(texto: str, connector_words: dict = None) -> str:
+    if connector_words is None:
+        connector_words = {"y", "o", "ni", "pero", "sino", "aunque",
+                           "ademas", "tampoco", "sin", "embargo", "no obstante", "aun", "de"}
+    pattern = r'\b(' + '|'.join(re.escape(word) for word in connector_words) + r')\b'
+    texto_sin_conectores = re.sub(pattern, '', texto, flags=re.IGNORECASE)
+    texto_sin_conectores = re.sub(r'\s+', ' ', texto_sin_conectores)
+    return texto_sin_conectores.strip()
+
+
+def legacy_normalize_text(texto: str) -> str:
+    texto = texto.lower()
+    texto = unicodedata.normalize('NFKD', texto)
+    texto = texto.encode('ASCII', 'ignore').decode('utf-8')
+    return texto
+
+
+def legacy_remove_pagination_words(texto: str) -> str:
+    texto = re.sub(r'\bpagina\d+de\d+\b', '', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'\bp a g i n a\d+d e\d+\b', '', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'\b\w*\d+de\d+\w*\b', '', texto, flags=re.IGNORECASE)
+    texto = re.sub(r'\s+', ' ', texto).strip()
+    return texto
+
+
+def _medir(fn, texto: str, repeat: int) -> tuple[float, str]:
+    tiempos = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        salida = fn(texto)
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), salida
+
+
+def main(pdfs: list[str], repeat: int) -> None:
+    normalizer = TextNormalizer()
+    for pdf in pdfs:
+        paginas = [pagina + "\n" for pagina in extraer_paginas(pdf)]
+        crudo = "".join(paginas)
+        print(f"{pdf}: {len(paginas)} paginas, {len(crudo)} caracteres")
+
+        pasos = [
+            ("normalize_text", legacy_normalize_text, normalizer.normalize, crudo),
+        ]
+        normalizado = legacy_normalize_text(crudo)
+        sin_conectores = legacy_remove_connector_words(normalizado)
+        pasos += [
+            ("remove_connector_words", legacy_remove_connector_words, normalizer.remove_connectors, normalizado),
+            ("remove_pagination_words", legacy_remove_pagination_words, normalizer.remove_pagination, sin_conectores),
+            ("conectores + paginacion", lambda t: legacy_remove_pagination_words(legacy_remove_connector_words(t)),
+             normalizer.clean, normalizado),
+            # Texto sin normalizar (mayusculas, tildes): los patrones son insensibles a mayusculas
+            ("conectores + paginacion (crudo)",
+             lambda t: legacy_remove_pagination_words(legacy_remove_connector_words(t)), normalizer.clean, crudo),
+        ]
+
+        total_antes = total_despues = 0.0
+        for nombre, legacy, nuevo, entrada in pasos:
+            t_antes, esperado = _medir(legacy, entrada, repeat)
+            t_despues, salida = _medir(nuevo, entrada, repeat)
+            assert salida == esperado, f"{nombre}: la salida difiere de la implementacion original"
+            if not nombre.startswith("conectores"):
+                total_antes += t_antes
+                total_despues += t_despues
+            print(f"  {nombre:<32} {t_antes * 1000:8.2f} ms -> {t_despues * 1000:8.2f} ms  "
+                  f"(x{t_antes / t_despues:.1f})")
+        print(f"  {'total (3 pasos)':<32} {total_antes * 1000:8.2f} ms -> {total_despues * 1000:8.2f} ms  "
+              f"(x{total_antes / total_despues:.1f})")
+
+        esperado = legacy_remove_pagination_words(legacy_remove_connector_words(normalizado))
+        t_stream, salida = _medir(lambda _: "".join(normalizer.stream(paginas)), None, repeat)
+        assert salida == esperado, "stream: la salida difiere de la implementacion original"
+        print(f"  {'stream (normalize + clean)':<32} {t_stream * 1000:8.2f} ms  (salida identica)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdfs", nargs="*", default=["data/tdr_v4.pdf", "data/tdr_v6.pdf"])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    main(args.pdfs, args.repeat)
@@ -0,0 +1,117 @@
+"""
+Recall y latencia de la busqueda compacta con re-ranking (db/quantization.py) frente a la
+busqueda exacta actual de retrieve_knn_QA.
+
+Se genera un corpus sintetico (textos agrupados por temas, con frecuencias de palabras tipo
+Zipf, codificados con FakeEncoder) en un NumpyVectorStore temporal. Para cada configuracion
+(modo, PCA y factor de re-ranking) se ejecutan las mismas preguntas con retrieve_knn_QA y
+se mide:
+  - recall@k: fraccion de los k resultados exactos que tambien devuelve la configuracion;
+  - latencia p50/p95 por pregunta;
+  - memoria de los codigos compactos frente a la matriz float32 completa.
+
+Uso:
+    python -m benchmarks.bench_quantization --rows 50000 --queries 200
+    python -m benchmarks.bench_quantization --modes half int8 binary --pca 0 64 --rerank 4 20
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+import resources
+from benchmarks.fakes import FakeEncoder
+from db.numpy_store import NumpyVectorStore
+from db.quantization import Quantizer
+from parser.Chunking_loading import retrieve_knn_QA
+
+
+VOCABULARIO = np.array([f"palabra{i}" for i in range(5000)])
+TEMAS = 50
+
+
+def synthetic_text(rng, temas: np.ndarray, n_palabras: int) -> str:
+    """
+    Texto de un tema: la mayoria de las palabras salen del vocabulario del tema (Zipf) y el
+    resto del vocabulario general, de modo que los vectores forman grupos como los de un
+    corpus real (y no una nube isotropa).
+    """
+    tema = temas[rng.integers(len(temas))]
+    propias = int(n_palabras * 0.7)
+    pesos = 1.0 / np.arange(1, len(tema) + 1)
+    palabras = list(rng.choice(tema, propias, p=pesos / pesos.sum()))
+    palabras += list(rng.choice(VOCABULARIO, n_palabras - propias))
+    return " ".join(palabras)
+
+
+def build_corpus(store: NumpyVectorStore, rows: int, encoder: FakeEncoder, temas: np.ndarray, rng) -> None:
+    """
+    Carga 'rows' chunks sinteticos de 30 palabras.
+    """
+    for inicio in range(0, rows, 10000):
+        n = min(10000, rows - inicio)
+        textos = [synthetic_text(rng, temas, 30) for _ in range(n)]
+        store.insert("chunks", [{"name": "doc", "indexes": "{}", "text": texto} for texto in textos],
+                     encoder.encode(textos))
+
+
+def run_queries(store: NumpyVectorStore, queries: list[str], k: int) -> tuple[list, list[float]]:
+    resultados, latencias = [], []
+    for query in queries:
+        inicio = time.perf_counter()
+        filas = retrieve_knn_QA(store, query, [], k=k)
+        latencias.append(time.perf_counter() - inicio)
+        resultados.append({fila[2] for fila in filas})
+    return resultados, latencias
+
+
+def main(rows: int, n_queries: int, dim: int, k: int, modes: list[str], pcas: list[int], reranks: list[int]) -> None:
+    encoder = FakeEncoder(dim)
+    resources.set_resource("embedding_model", encoder)
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directorio:
+        # Vocabulario de cada tema: 200 palabras al azar
+        temas = np.stack([rng.choice(VOCABULARIO, 200, replace=False) for _ in range(TEMAS)])
+        build_corpus(NumpyVectorStore(directorio), rows, encoder, temas, rng)
+        queries = [synthetic_text(rng, temas, 8) for _ in range(n_queries)]
+
+        exacto = NumpyVectorStore(directorio, Quantizer("none"))
+        referencia, latencias = run_queries(exacto, queries, k)
+        completa = exacto.table("chunks").vectors.nbytes
+        latencias.sort()
+        print(f"filas={rows} dim={dim} k={k} preguntas={n_queries}")
+        print(f"{'configuracion':<28} {'recall@k':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} {'memoria':>12} {'ajuste (s)':>11}")
+        print(f"{'exacta (float32)':<28} {1.0:>9.3f} {statistics.median(latencias) * 1000:>9.2f} "
+              f"{latencias[int(len(latencias) * 0.95) - 1] * 1000:>9.2f} {completa / 2**20:>9.1f} MB {'-':>11}")
+
+        for mode in modes:
+            for pca in pcas:
+                for rerank in reranks:
+                    quantizer = Quantizer(mode, pca, rerank)
+                    store = NumpyVectorStore(directorio, quantizer)
+                    inicio = time.perf_counter()
+                    compactos = store.table("chunks").quantized(quantizer)
+                    ajuste = time.perf_counter() - inicio
+                    resultados, latencias = run_queries(store, queries, k)
+                    latencias.sort()
+                    recall = statistics.mean(len(r & e) / len(e) for r, e in zip(resultados, referencia) if e)
+                    nombre = f"{mode}" + (f"+pca{pca}" if pca else "") + f" x{rerank}"
+                    print(f"{nombre:<28} {recall:>9.3f} {statistics.median(latencias) * 1000:>9.2f} "
+                          f"{latencias[int(len(latencias) * 0.95) - 1] * 1000:>9.2f} "
+                          f"{compactos.nbytes / 2**20:>9.1f} MB {ajuste:>11.2f}")
+    resources.reset()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["half", "int8", "binary"], choices=["none", "half", "int8", "binary"])
+    parser.add_argument("--pca", type=int, nargs="+", default=[0, 96], help="Dimensiones tras PCA (0 = sin PCA)")
+    parser.add_argument("--rerank", type=int, nargs="+", default=[4, 20], help="Factores de re-ranking")
+    args = parser.parse_args()
+    main(args.rows, args.queries, args.dim, args.k, args.modes, args.pca, args.rerank)
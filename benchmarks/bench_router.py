@@ -0,0 +1,75 @@
+"""
+Precision y latencia del enrutador local (router.route) sobre Questions.Querys.
+
+Las etiquetas esperadas estan anotadas a mano contra index.txt. Sin --with-llm no se
+usa el LLM de respaldo: las preguntas con confianza baja cuentan como "fallback".
+
+Uso:
+    python -m benchmarks.bench_router
+    python -m benchmarks.bench_router --with-llm      # mide tambien la ruta con LLM de respaldo
+"""
+import argparse
+import statistics
+import time
+
+from Questions import Querys
+from router import route, DEFAULT_THRESHOLD
+
+# (es comparacion, rutas de seccion esperadas)
+ESPERADO = [
+    (True, ["5.1"]),
+    (True, ["1", "2", "3"]),
+    (True, ["1", "3"]),
+    (True, ["3"]),
+    (False, []),
+    (False, ["5.1"]),
+    (False, ["anexo a"]),
+    (True, []),
+    (True, []),
+    (False, ["5"]),
+]
+
+
+def _ruta(titulo: str) -> str:
+    primera = titulo.split(" ")[0].rstrip(".")
+    return " ".join(titulo.split(" ")[:2]) if primera == "anexo" else primera
+
+
+def main(with_llm: bool, threshold: float, repeat: int) -> None:
+    fallback_compare = fallback_indexes = None
+    if with_llm:
+        from rag import is_comparison, get_indexes
+        fallback_compare, fallback_indexes = is_comparison, get_indexes
+
+    aciertos_compare = aciertos_indexes = fallbacks = 0
+    latencias = []
+    for query, (compare_esperado, rutas_esperadas) in zip(Querys, ESPERADO):
+        for _ in range(repeat):
+            inicio = time.perf_counter()
+            decision = route(query, threshold=threshold,
+                             fallback_compare=fallback_compare, fallback_indexes=fallback_indexes)
+            latencias.append(time.perf_counter() - inicio)
+        bajo_umbral = min(decision["confidence"].values()) < threshold
+        fallbacks += bajo_umbral
+        ok_compare = decision["compare"] == compare_esperado
+        ok_indexes = sorted(_ruta(t) for t in decision["indexes"]) == sorted(rutas_esperadas)
+        aciertos_compare += ok_compare
+        aciertos_indexes += ok_indexes
+        print(f"{'ok' if ok_compare else 'X '} {'ok' if ok_indexes else 'X '} {'LLM' if bajo_umbral else '   '} "
+              f"{query[:70]:<70} -> {decision['compare']}, {[_ruta(t) for t in decision['indexes']]}")
+
+    n = len(ESPERADO)
+    latencias.sort()
+    print()
+    print(f"compare: {aciertos_compare}/{n}  secciones: {aciertos_indexes}/{n}  bajo umbral (LLM): {fallbacks}/{n}")
+    print(f"latencia p50={statistics.median(latencias) * 1000:.2f} ms  "
+          f"p95={latencias[int(len(latencias) * 0.95) - 1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--with-llm", action="store_true")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.with_llm, args.threshold, args.repeat)
@@ -0,0 +1,62 @@
+"""
+Mide el costo de importar en frio cada punto de entrada del proyecto.
+
+Cada modulo se importa en un proceso nuevo de Python (sin cache de modulos),
+varias veces, y se reporta la mediana del tiempo de importacion y la memoria
+maxima residente del proceso.
+
+Uso:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --repeat 5 main rag
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+ENTRY_POINTS = ["main", "rag", "LLM", "parser.Parser_pdf2", "parser.Chunking_loading", "db.embedding_db"]
+
+CHILD = """
+import json, resource, sys, time
+inicio = time.perf_counter()
+import {module}
+duracion = time.perf_counter() - inicio
+loaded = [name for name in ("sentence_transformers", "torch", "spacy", "boto3") if name in sys.modules]
+print(json.dumps({{"seconds": duracion, "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "heavy": loaded}}))
+"""
+
+
+def measure(module: str, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", CHILD.format(module=module)],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return {"module": module, "error": result.stderr.strip().splitlines()[-1]}
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {
+        "module": module,
+        "median_ms": statistics.median(r["seconds"] for r in runs) * 1000,
+        "max_rss_mb": max(r["max_rss_mb"] for r in runs),
+        "heavy_modules": runs[-1]["heavy"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Imprime los resultados en JSON")
+    args = parser.parse_args()
+
+    results = [measure(module, args.repeat) for module in args.modules]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            if "error" in r:
+                print(f"{r['module']:<28} ERROR: {r['error']}")
+            else:
+                print(f"{r['module']:<28} {r['median_ms']:8.1f} ms  {r['max_rss_mb']:7.1f} MB  "
+                      f"pesados: {', '.join(r['heavy_modules']) or '-'}")
@@ -0,0 +1,179 @@
+"""
+Dobles locales para ejecutar el pipeline sin AWS.
+
+FakeBedrock imita la interfaz de boto3.client('bedrock-runtime') usada en LLM.py:
+simula latencia, errores de limitacion de tasa (ThrottlingException) y devuelve
+respuestas predefinidas, tambien en streaming (invoke_model_with_response_stream).
+Las peticiones de Titan Embeddings ('inputText') devuelven vectores de FakeEncoder.
+
+FakeEncoder imita la parte de SentenceTransformer que usa el proyecto (encode,
+get_sentence_embedding_dimension) con vectores deterministas derivados del texto.
+"""
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+
+import numpy as np
+
+
+class FakeThrottlingError(Exception):
+    """
+    Error con el mismo formato que botocore.exceptions.ClientError para ThrottlingException.
+    """
+    def __init__(self, operation: str = "InvokeModel"):
+        super().__init__(f"An error occurred (ThrottlingException) when calling the {operation} operation: Rate exceeded")
+        self.response = {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}
+
+
+class FakeBedrock:
+    """
+    Cliente Bedrock simulado.
+
+    Args:
+        latency (float): Segundos que tarda cada llamada.
+        throttle_rate (float): Probabilidad de que una llamada falle con ThrottlingException.
+        responses: Texto fijo de respuesta, o funcion (body: dict) -> str.
+        seed (int): Semilla para reproducir la secuencia de errores.
+        token_latency (float): Segundos entre fragmentos en invoke_model_with_response_stream.
+    """
+    def __init__(self, latency: float = 0.2, throttle_rate: float = 0.0, responses=None, seed: int = 0,
+                 token_latency: float = 0.0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.throttle_rate = throttle_rate
+        self.responses = responses if responses is not None else "Respuesta simulada."
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._encoders = {}
+
+    def _answer(self, body: dict) -> str:
+        if callable(self.responses):
+            return self.responses(body)
+        return self.responses
+
+    def invoke_model(self, body, modelId, contentType="application/json", accept="application/json"):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            throttled = self._rng.random() < self.throttle_rate
+        try:
+            time.sleep(self.latency)
+            if throttled:
+                with self._lock:
+                    self.throttled += 1
+                raise FakeThrottlingError()
+            body = json.loads(body)
+            if "inputText" in body:
+                payload = self._embedding(body)
+                return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+            text = self._answer(body)
+            usage = {"input_tokens": len(json.dumps(body)) // 4, "output_tokens": len(text) // 4}
+            with self._lock:
+                self.input_tokens += usage["input_tokens"]
+                self.output_tokens += usage["output_tokens"]
+            payload = {"content": [{"type": "text", "text": text}], "usage": usage}
+            return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _embedding(self, body: dict) -> dict:
+        """
+        Respuesta de Titan Text Embeddings v2 (1024 dimensiones salvo que se pida 'dimensions').
+        """
+        dim = body.get("dimensions", 1024)
+        with self._lock:
+            encoder = self._encoders.get(dim)
+            if encoder is None:
+                encoder = self._encoders[dim] = FakeEncoder(dim)
+            tokens = len(body["inputText"]) // 4
+            self.input_tokens += tokens
+        return {"embedding": encoder.encode(body["inputText"]).tolist(), "inputTextTokenCount": tokens}
+
+    def invoke_model_with_response_stream(self, body, modelId, contentType="application/json", accept="application/json"):
+        """
+        Version en streaming: 'latency' es el tiempo hasta el primer evento y cada palabra de la
+        respuesta se entrega como un content_block_delta separado por 'token_latency' segundos.
+        """
+        with self._lock:
+            self.calls += 1
+            throttled = self._rng.random() < self.throttle_rate
+        if throttled:
+            with self._lock:
+                self.throttled += 1
+            raise FakeThrottlingError("InvokeModelWithResponseStream")
+        body = json.loads(body)
+        text = self._answer(body)
+        usage = {"input_tokens": len(json.dumps(body)) // 4, "output_tokens": len(text) // 4}
+        with self._lock:
+            self.input_tokens += usage["input_tokens"]
+            self.output_tokens += usage["output_tokens"]
+
+        def event(data: dict) -> dict:
+            return {"chunk": {"bytes": json.dumps(data).encode("utf-8")}}
+
+        def events():
+            time.sleep(self.latency)
+            yield event({"type": "message_start", "message": {"usage": {"input_tokens": usage["input_tokens"]}}})
+            yield event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+            for i, palabra in enumerate(text.split(" ")):
+                if i:
+                    time.sleep(self.token_latency)
+                yield event({"type": "content_block_delta", "index": 0,
+                             "delta": {"type": "text_delta", "text": palabra if i == 0 else " " + palabra}})
+            yield event({"type": "content_block_stop", "index": 0})
+            yield event({"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+                         "usage": {"output_tokens": usage["output_tokens"]}})
+            yield event({"type": "message_stop"})
+
+        return {"body": events()}
+
+
+class FakeEncoder:
+    """
+    Codificador determinista: cada texto se convierte en un vector normalizado a partir de
+    sus palabras (textos con palabras en comun quedan cerca).
+
+    Args:
+        dim (int): Dimension de los vectores.
+        latency_per_text (float): Segundos simulados por texto codificado.
+    """
+    def __init__(self, dim: int = 384, latency_per_text: float = 0.0):
+        self.dim = dim
+        self.latency_per_text = latency_per_text
+        self._words = {}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._words.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector = self._words[word] = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vector += self._word_vector(word)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True, **kwargs):
+        single = isinstance(sentences, str)
+        textos = [sentences] if single else list(sentences)
+        if self.latency_per_text:
+            time.sleep(self.latency_per_text * len(textos))
+        matrix = np.stack([self._vector(t) for t in textos]) if textos else np.zeros((0, self.dim), dtype=np.float32)
+        return matrix[0] if single else matrix
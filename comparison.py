@@ -1,24 +1,234 @@
-from bert_score import score
-import sqlite3
+"""
+Evaluacion de las respuestas de RAG con BERTScore.
+
+Compara la respuesta de RAG (candidata, 'rag_answer') con la respuesta de referencia
+('gpt_answer') de cada fila de la tabla 'comparison' y guarda precision, recall y F1 en la
+columna 'bert_metrics' (JSON). Las filas ya evaluadas se omiten salvo con --force.
+
+A diferencia de llamar a bert_score.score por fila:
+  - el modelo y el tokenizador se cargan una vez por proceso;
+  - los embeddings se calculan en lotes de --batch-size textos ordenados por longitud (menos
+    relleno) y el emparejamiento greedy tambien se hace por lotes;
+  - los embeddings de las respuestas de referencia se guardan en disco (una entrada por
+    modelo, capa y texto) y se reutilizan entre ejecuciones;
+  - las filas se pueden repartir entre --workers procesos;
+  - bert_metrics se actualiza con un solo UPDATE en una transaccion.
+
+Variables de entorno:
+    BERTSCORE_CACHE_PATH  Directorio de la cache de embeddings de referencia (por defecto .cache/bertscore).
+
+Uso:
+    python comparison.py
+    python comparison.py --workers 4 --batch-size 128 --force
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+from bert_score.utils import lang2model, model2layers, get_model, get_tokenizer, get_bert_embedding, greedy_cos_idf
+from torch.nn.utils.rnn import pad_sequence
+
 from db.connection import create_conn
+from db.comparison_db import get_comparisons_to_score, update_bert_metrics
+
+DEFAULT_CACHE_PATH = os.getenv("BERTSCORE_CACHE_PATH", os.path.join(".cache", "bertscore"))
+
+# Modelo del proceso (se carga una vez por proceso, ver _cargar_modelo)
+_modelo = None
+
+
+def _cargar_modelo(model_type: str, num_layers: int, device: str, threads: int = None) -> None:
+    global _modelo
+    if threads:
+        torch.set_num_threads(threads)
+    tokenizer = get_tokenizer(model_type)
+    model = get_model(model_type, num_layers)
+    model.to(device)
+    # Sin idf: todos los tokens pesan 1 salvo [CLS] y [SEP] (como bert_score.score)
+    idf_dict = defaultdict(lambda: 1.0)
+    idf_dict[tokenizer.sep_token_id] = 0
+    idf_dict[tokenizer.cls_token_id] = 0
+    _modelo = {"model": model, "tokenizer": tokenizer, "idf_dict": idf_dict, "device": device,
+               "model_type": model_type, "num_layers": num_layers}
+
+
+class ReferenceCache:
+    """
+    Embeddings por token (y pesos idf) de las respuestas de referencia en disco, un archivo
+    .npz por texto. La clave incluye el modelo y la capa.
+
+    Args:
+        path (str): Directorio de la cache.
+        model_type (str): Modelo de BERTScore.
+        num_layers (int): Capa usada.
+    """
+    def __init__(self, path: str, model_type: str, num_layers: int):
+        self.path = os.path.join(path, f"{model_type.replace('/', '_')}_L{num_layers}")
+        os.makedirs(self.path, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _archivo(self, texto: str) -> str:
+        return os.path.join(self.path, hashlib.sha256(texto.encode("utf-8")).hexdigest() + ".npz")
+
+    def get(self, texto: str):
+        archivo = self._archivo(texto)
+        if not os.path.exists(archivo):
+            self.misses += 1
+            return None
+        self.hits += 1
+        with np.load(archivo) as datos:
+            return torch.from_numpy(datos["emb"]), torch.from_numpy(datos["idf"])
+
+    def put(self, texto: str, emb: torch.Tensor, idf: torch.Tensor) -> None:
+        archivo = self._archivo(texto)
+        # Escritura atomica: varios procesos pueden guardar el mismo texto a la vez
+        temporal = f"{archivo}.{os.getpid()}.tmp.npz"
+        np.savez(temporal, emb=emb.numpy(), idf=idf.numpy())
+        os.replace(temporal, archivo)
+
+
+def _embeddings(textos: list[str], batch_size: int) -> dict:
+    """
+    Embedding por token (sin relleno) e idf de cada texto, en lotes ordenados por longitud.
+    """
+    stats = {}
+    textos = sorted(set(textos), key=lambda t: len(t.split(" ")), reverse=True)
+    for inicio in range(0, len(textos), batch_size):
+        lote = textos[inicio:inicio + batch_size]
+        embs, masks, idf = get_bert_embedding(lote, _modelo["model"], _modelo["tokenizer"], _modelo["idf_dict"],
+                                              device=_modelo["device"])
+        embs, masks, idf = embs.cpu(), masks.cpu(), idf.cpu()
+        for i, texto in enumerate(lote):
+            n = masks[i].sum().item()
+            stats[texto] = (embs[i, :n], idf[i, :n])
+    return stats
+
+
+def _pad(stats: list) -> tuple:
+    """
+    Rellena un lote de (embedding, idf) al formato de greedy_cos_idf (embeddings, mascara, idf).
+    """
+    device = _modelo["device"]
+    emb = [e.to(device) for e, _ in stats]
+    idf = [i.to(device) for _, i in stats]
+    lens = torch.tensor([e.size(0) for e in emb], dtype=torch.long)
+    mask = (torch.arange(int(lens.max())).expand(len(lens), -1) < lens.unsqueeze(1)).to(device)
+    return pad_sequence(emb, batch_first=True, padding_value=2.0), mask, pad_sequence(idf, batch_first=True)
+
+
+def score_rows(rows: list, batch_size: int = 64, cache_path: str = DEFAULT_CACHE_PATH) -> tuple[list, dict]:
+    """
+    BERTScore de cada fila (id, referencia, candidata) con el modelo del proceso.
+
+    Returns:
+        tuple: ([(id, precision, recall, f1)], {"cache_hits", "cache_misses"}).
+    """
+    cache = ReferenceCache(cache_path, _modelo["model_type"], _modelo["num_layers"])
+    referencias = {}
+    for _, referencia, _ in rows:
+        if referencia not in referencias:
+            referencias[referencia] = cache.get(referencia)
+    nuevas = [texto for texto, stats in referencias.items() if stats is None]
+    for texto, (emb, idf) in _embeddings(nuevas, batch_size).items():
+        cache.put(texto, emb, idf)
+        referencias[texto] = (emb, idf)
+    candidatas = _embeddings([candidata for _, _, candidata in rows], batch_size)
+
+    # Emparejamiento por lotes de filas de longitud parecida
+    ordenadas = sorted(rows, key=lambda row: candidatas[row[2]][0].size(0), reverse=True)
+    resultados = []
+    with torch.no_grad():
+        for inicio in range(0, len(ordenadas), batch_size):
+            lote = ordenadas[inicio:inicio + batch_size]
+            P, R, F1 = greedy_cos_idf(*_pad([referencias[row[1]] for row in lote]),
+                                      *_pad([candidatas[row[2]] for row in lote]))
+            resultados += [(row[0], float(p), float(r), float(f)) for row, p, r, f in
+                           zip(lote, P.cpu(), R.cpu(), F1.cpu())]
+    return resultados, {"cache_hits": cache.hits, "cache_misses": cache.misses}
+
+
+def evaluate(rows: list, model_type: str, num_layers: int, device: str, batch_size: int = 64, workers: int = 1,
+             cache_path: str = DEFAULT_CACHE_PATH) -> tuple[list, dict]:
+    """
+    BERTScore de las filas, en este proceso o repartidas entre 'workers' procesos (cada uno
+    carga el modelo una vez y usa cpu_count / workers hilos).
+
+    Args:
+        rows (list): Tuplas (id, referencia, candidata).
+        model_type (str): Modelo de BERTScore.
+        num_layers (int): Capa usada.
+        device (str): "cpu" o "cuda".
+        batch_size (int): Textos por lote.
+        workers (int): Procesos.
+        cache_path (str): Directorio de la cache de referencias.
+
+    Returns:
+        tuple: ([(id, precision, recall, f1)], contadores de la cache de referencias).
+    """
+    workers = max(1, min(workers, len(rows)))
+    if workers == 1:
+        _cargar_modelo(model_type, num_layers, device)
+        return score_rows(rows, batch_size, cache_path)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # Reparto intercalado: cada proceso recibe filas de todas las longitudes
+    shards = [rows[i::workers] for i in range(workers)]
+    resultados, contadores = [], {"cache_hits": 0, "cache_misses": 0}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_cargar_modelo,
+                             initargs=(model_type, num_layers, device, threads)) as executor:
+        for parcial, cuenta in executor.map(score_rows, shards, [batch_size] * workers, [cache_path] * workers):
+            resultados += parcial
+            for clave in contadores:
+                contadores[clave] += cuenta[clave]
+    return resultados, contadores
+
+
+def main(batch_size: int = 64, workers: int = 1, force: bool = False, lang: str = "en", model_type: str = None,
+         num_layers: int = None, device: str = None, cache_path: str = DEFAULT_CACHE_PATH) -> None:
+    model_type = model_type or lang2model[lang.lower()]
+    num_layers = num_layers or model2layers[model_type]
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+
+    conn = create_conn()
+    try:
+        rows = get_comparisons_to_score(conn, force=force)
+        if not rows:
+            print("No hay comparaciones pendientes de evaluar (use --force para recalcular).")
+            return
+        inicio = time.perf_counter()
+        resultados, contadores = evaluate(rows, model_type, num_layers, device, batch_size, workers, cache_path)
+        duracion = time.perf_counter() - inicio
+        update_bert_metrics(conn, [
+            (row_id, json.dumps({"precision": p, "recall": r, "f1": f, "model": model_type, "num_layers": num_layers}))
+            for row_id, p, r, f in resultados
+        ])
+    finally:
+        conn.close()
+
+    for row_id, p, r, f in sorted(resultados):
+        print(f"Row {row_id}: Precision {p:.4f}  Recall {r:.4f}  F1 {f:.4f}")
+    print(f"{len(resultados)} filas evaluadas en {duracion:.2f}s ({len(resultados) / duracion:.1f} filas/s, "
+          f"workers={workers}, batch_size={batch_size}, {model_type} L{num_layers}); "
+          f"referencias en cache: {contadores['cache_hits']}/{contadores['cache_hits'] + contadores['cache_misses']}; "
+          f"F1 medio {sum(f for *_, f in resultados) / len(resultados):.4f}")
+
 
-conn = create_conn()
-cursor = conn.cursor()
-
-# Query to fetch gpt_answer and rag_answer from the comparison table
-query = "SELECT gpt_answer, rag_answer FROM comparison"
-cursor.execute(query)
-rows = cursor.fetchall()
-
-# Compare answers using BERTScore
-for idx, (gpt_answer, rag_answer) in enumerate(rows):
-    if gpt_answer and rag_answer:  # Ensure both answers are not None
-        P, R, F1 = score([gpt_answer], [rag_answer], lang="en", verbose=False)
-        print(f"Row {idx + 1}:")
-        print(f"  Precision: {P.item():.4f}")
-        print(f"  Recall: {R.item():.4f}")
-        print(f"  F1 Score: {F1.item():.4f}")
-        print()
-
-# Close the database connection
-conn.close()
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=1, help="Procesos entre los que se reparten las filas")
+    parser.add_argument("--force", action="store_true", help="Volver a evaluar las filas que ya tienen bert_metrics")
+    parser.add_argument("--lang", default="en", help="Idioma para elegir el modelo por defecto de BERTScore")
+    parser.add_argument("--model-type", help="Modelo de BERTScore (por defecto el de --lang)")
+    parser.add_argument("--num-layers", type=int, help="Capa del modelo (por defecto la recomendada)")
+    parser.add_argument("--device", help="cpu o cuda (por defecto cuda si esta disponible)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Directorio de la cache de referencias")
+    args = parser.parse_args()
+    main(args.batch_size, args.workers, args.force, args.lang, args.model_type, args.num_layers, args.device,
+         args.cache)
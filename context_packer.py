@@ -0,0 +1,175 @@
+"""
+Armado del contexto de los prompts de RAG con un presupuesto de tokens.
+
+Los chunks recuperados (retrieve_knn_QA) se solapan 25 palabras con sus vecinos y a veces
+se repiten entre versiones del documento. pack_chunks:
+  1. Une los chunks del mismo documento cuyos rangos de palabras (start_word, end_word) se
+     solapan o son contiguos, sin repetir el texto compartido.
+  2. Descarta duplicados exactos y casi duplicados (shingles de palabras contenidos en un
+     fragmento mejor rankeado).
+  3. Si se fija un presupuesto de tokens, elige los fragmentos por orden de relevancia hasta
+     completarlo (el ultimo se recorta si queda espacio suficiente).
+  4. Los ordena por seccion (numeracion del indice) y posicion en el documento.
+
+pack_texts aplica los pasos 2 y 3 a textos sin posicion (por ejemplo las diferencias).
+
+Variables de entorno:
+    RAG_CONTEXT_TOKENS     Presupuesto de tokens del contexto (por defecto 0: sin limite, el contexto
+                           conserva todo el texto recuperado sin duplicados).
+    RAG_CHARS_PER_TOKEN    Caracteres por token para estimar el tamanho del texto.
+    RAG_NEAR_DUPLICATE     Fraccion de shingles compartidos a partir de la cual dos textos son casi duplicados.
+"""
+import os
+import re
+
+import telemetry
+
+CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "0"))
+CHARS_PER_TOKEN = float(os.getenv("RAG_CHARS_PER_TOKEN", "4"))
+NEAR_DUPLICATE = float(os.getenv("RAG_NEAR_DUPLICATE", "0.8"))
+SEPARATOR = "\n---\n"
+
+# Palabras por shingle para detectar casi duplicados
+_SHINGLE = 5
+# Tokens minimos para incluir un fragmento recortado al final del presupuesto
+_MIN_TOKENS_RECORTE = 40
+_NUMERACION = re.compile(r'(\d+(?:\.\d+)*)')
+
+
+def estimate_tokens(texto: str) -> int:
+    """
+    Estimacion de la cantidad de tokens de un texto (caracteres / RAG_CHARS_PER_TOKEN).
+    """
+    return int(len(texto) / CHARS_PER_TOKEN + 0.5)
+
+
+def _shingles(palabras: list[str]) -> set:
+    if len(palabras) < _SHINGLE:
+        return {tuple(palabras)}
+    return {tuple(palabras[i:i + _SHINGLE]) for i in range(len(palabras) - _SHINGLE + 1)}
+
+
+def _section_key(indexes) -> tuple:
+    """
+    Clave de orden de la seccion de un chunk a partir de su primer marcador ("5.4.2. ..." ->
+    (5, 4, 2)); los chunks sin numeracion van al final.
+    """
+    match = _NUMERACION.search(str(indexes or ""))
+    if match is None:
+        return (float("inf"),)
+    return tuple(int(parte) for parte in match.group(1).split("."))
+
+
+def _merge_neighbors(fragmentos: list[dict]) -> list[dict]:
+    """
+    Une los fragmentos del mismo documento cuyos rangos de palabras se solapan o se tocan.
+    El fragmento unido conserva el mejor rango de relevancia y los indices del primero.
+    """
+    con_rango = [f for f in fragmentos if f["start"] is not None and f["end"] is not None]
+    resultado = [f for f in fragmentos if f["start"] is None or f["end"] is None]
+    con_rango.sort(key=lambda f: (f["name"], f["start"]))
+    actual = None
+    for fragmento in con_rango:
+        if actual is not None and fragmento["name"] == actual["name"] and fragmento["start"] <= actual["end"]:
+            if fragmento["end"] > actual["end"]:
+                actual["palabras"] += fragmento["palabras"][actual["end"] - fragmento["start"]:]
+                actual["end"] = fragmento["end"]
+            actual["rank"] = min(actual["rank"], fragmento["rank"])
+            actual["merged"] += 1
+            continue
+        actual = dict(fragmento, palabras=list(fragmento["palabras"]), merged=1)
+        resultado.append(actual)
+    return resultado
+
+
+def _deduplicate(fragmentos: list[dict], threshold: float) -> list[dict]:
+    """
+    Recorre los fragmentos de mejor a peor rango y descarta los que repiten (exactamente o en
+    mas de 'threshold' de sus shingles) el texto de uno ya aceptado.
+    """
+    aceptados, vistos, shingles_aceptados = [], set(), set()
+    for fragmento in sorted(fragmentos, key=lambda f: f["rank"]):
+        clave = " ".join(fragmento["palabras"])
+        if clave in vistos:
+            continue
+        shingles = _shingles(fragmento["palabras"])
+        if shingles and len(shingles & shingles_aceptados) / len(shingles) >= threshold:
+            continue
+        vistos.add(clave)
+        shingles_aceptados |= shingles
+        aceptados.append(fragmento)
+    return aceptados
+
+
+def _fit_budget(fragmentos: list[dict], budget: int, separator: str) -> list[dict]:
+    """
+    Toma los fragmentos (ya ordenados por relevancia) mientras entren en 'budget' tokens; el
+    primero que no entra se recorta por palabras si quedan al menos _MIN_TOKENS_RECORTE.
+    Con budget <= 0 no hay limite.
+    """
+    if budget <= 0:
+        return list(fragmentos)
+    elegidos, usados = [], 0
+    costo_separador = estimate_tokens(separator)
+    for fragmento in fragmentos:
+        costo = estimate_tokens(" ".join(fragmento["palabras"])) + (costo_separador if elegidos else 0)
+        if usados + costo <= budget:
+            elegidos.append(fragmento)
+            usados += costo
+            continue
+        restante = budget - usados - (costo_separador if elegidos else 0)
+        if restante >= _MIN_TOKENS_RECORTE:
+            palabras, tokens = [], 0
+            for palabra in fragmento["palabras"]:
+                tokens += estimate_tokens(palabra + " ")
+                if tokens > restante:
+                    break
+                palabras.append(palabra)
+            elegidos.append(dict(fragmento, palabras=palabras, truncated=True))
+        break
+    return elegidos
+
+
+def pack_chunks(rows: list, budget: int = None, separator: str = SEPARATOR,
+                threshold: float = NEAR_DUPLICATE) -> str:
+    """
+    Contexto a partir de las filas de retrieve_knn_QA (name, indexes, text, distance,
+    text_similarity[, start_word, end_word]), en orden de relevancia.
+
+    Args:
+        rows (list): Filas recuperadas, de la mas a la menos relevante.
+        budget (int): Presupuesto de tokens (por defecto RAG_CONTEXT_TOKENS; 0 = sin limite).
+        separator (str): Separador entre fragmentos.
+        threshold (float): Fraccion de shingles repetidos para considerar un casi duplicado.
+
+    Returns:
+        str: Contexto para el prompt.
+    """
+    budget = CONTEXT_TOKENS if budget is None else budget
+    fragmentos = [{"rank": rank, "name": row[0], "indexes": row[1], "palabras": row[2].split(),
+                   "start": row[5] if len(row) > 6 else None, "end": row[6] if len(row) > 6 else None}
+                  for rank, row in enumerate(rows)]
+    unidos = _merge_neighbors(fragmentos)
+    elegidos = _fit_budget(_deduplicate(unidos, threshold), budget, separator)
+    elegidos.sort(key=lambda f: (_section_key(f["indexes"]), f["name"],
+                                 f["start"] if f["start"] is not None else f["rank"]))
+    context = separator.join(" ".join(f["palabras"]) for f in elegidos)
+    telemetry.annotate(context_rows=len(rows), context_passages=len(elegidos),
+                       context_tokens=estimate_tokens(context))
+    return context
+
+
+def pack_texts(texts: list[str], budget: int = None, separator: str = SEPARATOR,
+               threshold: float = NEAR_DUPLICATE) -> str:
+    """
+    Contexto a partir de textos sin posicion (en orden de relevancia): sin duplicados y
+    dentro del presupuesto de tokens, manteniendo el orden.
+    """
+    budget = CONTEXT_TOKENS if budget is None else budget
+    fragmentos = [{"rank": rank, "texto": texto, "palabras": texto.split()} for rank, texto in enumerate(texts)]
+    elegidos = _fit_budget(_deduplicate(fragmentos, threshold), budget, separator)
+    # Los textos completos se conservan tal cual (saltos de linea de las diferencias)
+    context = separator.join(" ".join(f["palabras"]) if f.get("truncated") else f["texto"] for f in elegidos)
+    telemetry.annotate(context_rows=len(texts), context_passages=len(elegidos),
+                       context_tokens=estimate_tokens(context))
+    return context
@@ -0,0 +1,176 @@
+"""
+Ingesta de un corpus con varias versiones de un documento (v4 -> v5 -> v6 ...).
+
+Se trabaja en dos etapas:
+  1. Cada documento se extrae, normaliza y divide en chunks una sola vez, repartiendo los
+     documentos entre un pool de procesos (ver main.preparar_documento).
+  2. Se comparan los pares pedidos (por defecto, versiones consecutivas) reutilizando los
+     artefactos de la etapa 1: cada documento se inserta una vez en 'chunks' con su nombre y
+     version, y cada par en 'differences' con su identificador ("nombre1:nombre2") y versiones.
+
+Uso:
+    python corpus.py data/
+    python corpus.py data/tdr_v4.pdf data/tdr_v5.pdf data/tdr_v6.pdf --pair 4:6 --pair 5:6
+    python corpus.py data/ --incremental --workers 3 --salida salidas/
+"""
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from main import (nombre_documento, preparar_documento, guardar_documento, common_indexes,
+                  upsert_documento, upsert_diferencias_par)
+from db.embedding_db import create_embedding_table, insert_embedding_chunks
+from db.difference_db import create_difference_table
+from db.connection import create_conn
+from db.encoding import start_encoder_pool, stop_encoder_pool, DEFAULT_WORKERS
+from db.indexes import maintain_search_indexes
+import telemetry
+
+# Version al final del nombre del archivo: "tdr_v6" -> "6", "tdr_v6.1" -> "6.1"
+VERSION_PATTERN = re.compile(r'v(\d+(?:\.\d+)*)$', re.IGNORECASE)
+
+
+def version_documento(pdf_path: str, posicion: int) -> str:
+    """
+    Version del documento segun el nombre del archivo; si no la tiene, su posicion (1, 2, ...).
+    """
+    match = VERSION_PATTERN.search(nombre_documento(pdf_path))
+    return match.group(1) if match else str(posicion + 1)
+
+def _clave_version(version: str) -> tuple:
+    return tuple(int(parte) for parte in version.split("."))
+
+def listar_documentos(entradas: list[str]) -> list[str]:
+    """
+    Rutas de los PDFs a procesar. Un directorio se expande a sus PDFs ordenados por version;
+    los archivos indicados explicitamente conservan su orden.
+    """
+    if len(entradas) == 1 and os.path.isdir(entradas[0]):
+        directorio = entradas[0]
+        rutas = sorted(os.path.join(directorio, archivo) for archivo in os.listdir(directorio)
+                       if archivo.lower().endswith(".pdf"))
+        return sorted(rutas, key=lambda ruta: _clave_version(version_documento(ruta, 0)))
+    return list(entradas)
+
+def resolver_pares(docs: list[dict], pares: list[str] = None) -> list[tuple[dict, dict]]:
+    """
+    Pares de documentos a comparar. Cada par es "A:B", donde A y B son el nombre o la version
+    de un documento. Sin pares se comparan las versiones consecutivas.
+    """
+    if not pares:
+        return list(zip(docs, docs[1:]))
+    por_clave = {}
+    for doc in docs:
+        por_clave.setdefault(doc["name"], doc)
+        por_clave.setdefault(doc["version"], doc)
+    resultado = []
+    for par in pares:
+        claves = par.split(":")
+        if len(claves) != 2 or any(clave not in por_clave for clave in claves):
+            raise ValueError(f"Par no valido: {par} (documentos: {', '.join(doc['name'] for doc in docs)})")
+        resultado.append((por_clave[claves[0]], por_clave[claves[1]]))
+    return resultado
+
+def preparar_corpus(rutas: list[str], aligned: bool = False, workers: int = None) -> list[dict]:
+    """
+    Etapa 1: prepara cada documento una sola vez. Hay un solo nivel de procesos: con varios
+    workers los documentos se reparten entre procesos y cada uno extrae sus paginas sin pool
+    propio; con uno, los documentos se preparan en orden y la extraccion de paginas usa todos
+    los nucleos (ver extraer_paginas).
+    """
+    workers = min(workers or os.cpu_count() or 1, len(rutas))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            docs = list(executor.map(preparar_documento, rutas, [aligned] * len(rutas), [1] * len(rutas)))
+    else:
+        docs = [preparar_documento(ruta, aligned=aligned) for ruta in rutas]
+    for posicion, doc in enumerate(docs):
+        doc["version"] = version_documento(doc["path"], posicion)
+    return docs
+
+@telemetry.traced("ingest.corpus")
+def ingesta_corpus(rutas: list[str], pares: list[str] = None, incremental: bool = False,
+                   workers: int = None, salida: str = None) -> None:
+    """
+    Procesa un corpus de versiones de un documento:
+      - Etapa 1: extraccion, normalizacion y chunking de cada documento (una vez por documento).
+      - Etapa 2: insercion de los chunks de cada documento y comparacion de cada par pedido.
+
+    Args:
+        rutas (list[str]): Rutas de los PDFs (ver listar_documentos).
+        pares (list[str]): Pares "A:B" a comparar (nombre o version); por defecto, los consecutivos.
+        incremental (bool): Solo se reprocesan los chunks y secciones que cambiaron (ver main.ingesta_incremental).
+        workers (int): Procesos de la etapa 1.
+        salida (str): Directorio donde guardar el texto, los chunks y las secciones de cada documento.
+
+    Returns:
+        None
+    """
+    if len(rutas) < 2:
+        raise ValueError("Se necesitan al menos dos documentos")
+    telemetry.annotate(documents=len(rutas), incremental=incremental)
+
+    with telemetry.span("ingest.preparacion", documents=len(rutas)):
+        docs = preparar_corpus(rutas, aligned=incremental, workers=workers)
+    seleccion = resolver_pares(docs, pares)
+    print(f"Documentos: {', '.join(doc['name'] + ' (v' + doc['version'] + ')' for doc in docs)}")
+    print(f"Pares a comparar: {', '.join(a['name'] + ':' + b['name'] for a, b in seleccion)}")
+
+    if salida:
+        os.makedirs(salida, exist_ok=True)
+        for doc in docs:
+            guardar_documento(doc, os.path.join(salida, doc["name"]))
+
+    # Union de los indices comunes de los pares (la usa el enrutador de rag.py)
+    indexes_pares = [common_indexes(doc1, doc2) for doc1, doc2 in seleccion]
+    with open('index.txt', 'w', encoding='utf-8') as f:
+        for index in sorted(set().union(*indexes_pares)):
+            f.write(f"{index}\n")
+
+    # Solo se insertan los documentos que participan en algun par
+    usados = [doc for doc in docs if any(doc is a or doc is b for a, b in seleccion)]
+
+    pool = start_encoder_pool(DEFAULT_WORKERS) if DEFAULT_WORKERS > 0 else None
+    conn = create_conn()
+    try:
+        create_embedding_table(conn)
+        create_difference_table(conn)
+        with telemetry.span("ingest.insercion", documents=len(usados)):
+            for doc in usados:
+                if incremental:
+                    upsert_documento(conn, doc, pool=pool, version=doc["version"])
+                else:
+                    insert_embedding_chunks(conn, doc["chunks"], doc["chunk_indexes"], doc["name"], pool=pool,
+                                            spans=doc["spans"], version=doc["version"])
+        for (doc1, doc2), indexes_diff in zip(seleccion, indexes_pares):
+            with telemetry.span("ingest.diferencias", pair=f"{doc1['name']}:{doc2['name']}",
+                                sections=len(indexes_diff)):
+                upsert_diferencias_par(conn, doc1, doc2, indexes_diff, pool=pool,
+                                       versions=(doc1["version"], doc2["version"]), incremental=incremental)
+        with telemetry.span("ingest.indices"):
+            maintain_search_indexes(conn, "chunks")
+            maintain_search_indexes(conn, "differences")
+    finally:
+        conn.close()
+        if pool is not None:
+            stop_encoder_pool(pool)
+
+    print(f"Proceso completado: {len(usados)} documentos y {len(seleccion)} pares.")
+    if salida:
+        print("Texto, chunks y secciones de cada documento en:", salida)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingesta de varias versiones de un documento")
+    parser.add_argument("entradas", nargs="+", help="Directorio con los PDFs o lista de PDFs (en orden de version)")
+    parser.add_argument("--pair", action="append", dest="pares", metavar="A:B",
+                        help="Par a comparar, por nombre o version (se puede repetir). Por defecto, los consecutivos")
+    parser.add_argument("--workers", type=int, help="Procesos para preparar los documentos")
+    parser.add_argument("--incremental", action="store_true", help="Solo reprocesar lo que cambio")
+    parser.add_argument("--salida", help="Directorio donde guardar el texto y los chunks de cada documento")
+    args = parser.parse_args()
+    try:
+        ingesta_corpus(listar_documentos(args.entradas), args.pares, incremental=args.incremental,
+                       workers=args.workers, salida=args.salida)
+    except ValueError as e:
+        parser.error(str(e))
@@ -0,0 +1,172 @@
+import os
+import numpy as np
+from db.encoding import vector_literals, embedding_dimension, check_embedding_dimension
+from db.indexes import HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH
+from db.numpy_store import NumpyVectorStore
+
+# Candidatos que recorre el indice HNSW en la busqueda de la cache. El filtro por numeros de
+# seccion se aplica despues del indice: con pocos candidatos, si los mas cercanos son de otra
+# seccion la busqueda no devuelve nada aunque haya una entrada valida por encima del umbral
+ANSWER_CACHE_EF_SEARCH = int(os.getenv("ANSWER_CACHE_EF_SEARCH", "400"))
+
+# Respuesta en cache mas cercana a la pregunta (distancia coseno, indice HNSW vector_cosine_ops).
+# Si la pregunta menciona numeros de seccion, solo se comparan entradas sin numeros o con los mismos.
+LOOKUP_SQL = """
+    SELECT id, answer, latency, 1 - (embedding <=> %(query_embedding)s::vector) AS similarity
+    FROM answer_cache
+    WHERE numbers = %(numbers)s OR numbers = '' OR %(numbers)s = ''
+    ORDER BY embedding <=> %(query_embedding)s::vector
+    LIMIT 1;
+"""
+
+
+def create_answer_cache_table(conn, embedding_dim=None):
+    """
+    Crea la tabla 'answer_cache' (cache semantica de respuestas, ver answer_cache.py).
+
+    Cada entrada guarda la pregunta normalizada, su embedding, la respuesta, el tiempo que
+    tomo generarla y los documentos cuyos chunks o diferencias se usaron como contexto
+    ('documents'; NULL si no se conocen, en cuyo caso cualquier ingesta invalida la entrada).
+
+    Args:
+        conn: Conexión a la base de datos.
+        embedding_dim (int): Dimensión del embedding a almacenar (por defecto, la del proveedor de embeddings).
+
+    Returns:
+        None
+    """
+    if isinstance(conn, NumpyVectorStore):
+        return
+    embedding_dim = embedding_dimension(embedding_dim)
+    cur = conn.cursor()
+    cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            id SERIAL PRIMARY KEY,
+            question TEXT,
+            normalized TEXT,
+            numbers TEXT,
+            answer TEXT,
+            compare BOOLEAN,
+            documents TEXT[],
+            latency REAL,
+            hits INTEGER DEFAULT 0,
+            created_at TIMESTAMPTZ DEFAULT now(),
+            last_hit_at TIMESTAMPTZ,
+            embedding VECTOR({embedding_dim})
+        );
+    """)
+    check_embedding_dimension(cur, "answer_cache", embedding_dim)
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS answer_cache_embedding_hnsw ON answer_cache
+        USING hnsw (embedding vector_cosine_ops) WITH (m = {int(HNSW_M)}, ef_construction = {int(HNSW_EF_CONSTRUCTION)});
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS answer_cache_documents_gin ON answer_cache USING gin (documents);")
+    conn.commit()
+    cur.close()
+
+def lookup_answer(conn, query_embedding, numbers):
+    """
+    Entrada de la cache mas parecida a la pregunta.
+
+    Args:
+        conn: Conexión a la base de datos.
+        query_embedding (np.ndarray): Embedding de la pregunta normalizada.
+        numbers (str): Numeros de seccion de la pregunta (ver answer_cache.question_numbers).
+
+    Returns:
+        tuple: (id, answer, latency, similarity) o None si la cache esta vacia.
+    """
+    if isinstance(conn, NumpyVectorStore):
+        return conn.lookup_answer(query_embedding, numbers)
+    cur = conn.cursor()
+    ef_search = max(ANSWER_CACHE_EF_SEARCH, HNSW_EF_SEARCH)
+    cur.execute(f"SET hnsw.ef_search = {int(ef_search)}; " + LOOKUP_SQL,
+                {"query_embedding": np.asarray(query_embedding).tolist(), "numbers": numbers})
+    row = cur.fetchone()
+    cur.close()
+    return row
+
+def insert_answer(conn, question, normalized, numbers, answer, compare, documents, latency, embedding):
+    """
+    Guarda una respuesta en la cache.
+
+    Args:
+        conn: Conexión a la base de datos.
+        question (str): Pregunta original.
+        normalized (str): Pregunta normalizada (la que se codifico).
+        numbers (str): Numeros de seccion de la pregunta.
+        answer (str): Respuesta generada.
+        compare (bool): Si la pregunta se respondio con las diferencias.
+        documents (list): Documentos usados como contexto (None si no se conocen).
+        latency (float): Segundos que tomo generar la respuesta.
+        embedding (np.ndarray): Embedding de la pregunta normalizada.
+    """
+    row = {"question": question, "normalized": normalized, "numbers": numbers, "answer": answer,
+           "compare": compare, "documents": sorted(documents) if documents is not None else None,
+           "latency": latency}
+    if isinstance(conn, NumpyVectorStore):
+        conn.insert_answer(row, embedding)
+        return
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO answer_cache (question, normalized, numbers, answer, compare, documents, latency, embedding)
+        VALUES (%(question)s, %(normalized)s, %(numbers)s, %(answer)s, %(compare)s, %(documents)s, %(latency)s,
+                %(embedding)s::vector)
+    """, dict(row, embedding=vector_literals(embedding)[0]))
+    conn.commit()
+    cur.close()
+
+def record_hit(conn, entry_id) -> None:
+    """
+    Cuenta un acierto de la entrada 'entry_id' (para las estadisticas acumuladas).
+    """
+    if isinstance(conn, NumpyVectorStore):
+        conn.record_answer_hit(entry_id)
+        return
+    cur = conn.cursor()
+    cur.execute("UPDATE answer_cache SET hits = hits + 1, last_hit_at = now() WHERE id = %s;", (entry_id,))
+    conn.commit()
+    cur.close()
+
+def invalidate_answers(conn, documents=None) -> int:
+    """
+    Elimina las respuestas en cache que dependen de los documentos indicados (y las de
+    documentos desconocidos). Se llama al reingresar chunks o diferencias.
+
+    Args:
+        conn: Conexión a la base de datos.
+        documents (list): Nombres de los documentos reingresados; None elimina toda la cache.
+
+    Returns:
+        int: Cantidad de entradas eliminadas.
+    """
+    if isinstance(conn, NumpyVectorStore):
+        return conn.invalidate_answers(documents)
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('answer_cache') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        cur.close()
+        return 0
+    if documents is None:
+        cur.execute("DELETE FROM answer_cache;")
+    else:
+        cur.execute("DELETE FROM answer_cache WHERE documents IS NULL OR documents && %s::text[];",
+                    (sorted(documents),))
+    eliminadas = cur.rowcount
+    conn.commit()
+    cur.close()
+    return eliminadas
+
+def answer_cache_totals(conn) -> dict:
+    """
+    Estadisticas acumuladas de la tabla: entradas, aciertos y segundos de generacion ahorrados
+    (suma de hits * latency).
+    """
+    if isinstance(conn, NumpyVectorStore):
+        return conn.answer_cache_totals()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0), COALESCE(SUM(hits * latency), 0) FROM answer_cache;")
+    entries, hits, saved = cur.fetchone()
+    cur.close()
+    return {"entries": entries, "hits": int(hits), "saved_seconds": float(saved)}
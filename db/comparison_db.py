@@ -1,8 +1,7 @@
 from psycopg2.extensions import register_adapter, AsIs
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from db.connection import model
 from psycopg2.extras import execute_values
+from db.numpy_store import NumpyVectorStore
 
 def addapt_numpy_float64(numpy_float64):
     return AsIs(numpy_float64)
@@ -12,18 +11,19 @@ def addapt_numpy_int64(numpy_int64):
 register_adapter(np.float64, addapt_numpy_float64)
 register_adapter(np.int64, addapt_numpy_int64) 
 
-def create_comparison_table(conn, embedding_dim=384):
+def create_comparison_table(conn):
     """
-    Crea la tabla 'chunks' en PostgreSQL utilizando la extension PGVector.
-    Se asume que la extensión 'vector' esta instalada en la base de datos.
+    Crea la tabla 'comparison' en PostgreSQL (preguntas, respuestas de RAG y de referencia
+    y metricas de BERTScore).
 
     Args:
         conn: Conexión a la base de datos.
-        embedding_dim (int): Dimensión del embedding a almacenar.
 
     Returns:
         None
     """
+    if isinstance(conn, NumpyVectorStore):
+        return
     cur = conn.cursor()
     # Asegurarse de que la extensión PGVector esté instalada
     cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
@@ -45,7 +45,7 @@ def create_comparison_table(conn, embedding_dim=384):
     conn.commit()
     cur.close()
 
-def insert_comparison(conn, question, rag_answer, gpt_answer="", bert_metrics=""):
+def insert_comparison(conn, question, rag_answer, gpt_answer=None, bert_metrics=None):
     """
     Inserta una comparación en la tabla 'comparison'.
 
@@ -53,12 +53,14 @@ def insert_comparison(conn, question, rag_answer, gpt_answer="", bert_metrics=""
         conn: Conexión a la base de datos.
         question (str): Pregunta realizada.
         rag_answer (str): Respuesta generada por RAG.
-        gpt_answer (str): Respuesta generada por GPT.
-        bert_metrics (str): Métricas de similitud de BERT.
+        gpt_answer (str): Respuesta generada por GPT (None si aun no se conoce).
+        bert_metrics (str): Métricas de similitud de BERT (None hasta evaluarla con comparison.py).
 
     Returns:
         None
     """
+    if isinstance(conn, NumpyVectorStore):
+        return insert_comparisons(conn, [(question, rag_answer, gpt_answer, bert_metrics)])
     cur = conn.cursor()
     cur.execute("""
         INSERT INTO comparison (question, rag_answer, gpt_answer, bert_metrics)
@@ -66,3 +68,78 @@ def insert_comparison(conn, question, rag_answer, gpt_answer="", bert_metrics=""
     """, (question, rag_answer, gpt_answer, bert_metrics))
     conn.commit()
     cur.close()
+
+def insert_comparisons(conn, rows):
+    """
+    Inserta varias comparaciones en la tabla 'comparison' en una sola transaccion.
+
+    Args:
+        conn: Conexión a la base de datos.
+        rows (list): Tuplas (question, rag_answer, gpt_answer, bert_metrics).
+
+    Returns:
+        None
+    """
+    if not rows:
+        return
+    if isinstance(conn, NumpyVectorStore):
+        conn.insert("comparison", [dict(zip(("question", "rag_answer", "gpt_answer", "bert_metrics"), row)) for row in rows])
+        return
+    cur = conn.cursor()
+    execute_values(cur, """
+        INSERT INTO comparison (question, rag_answer, gpt_answer, bert_metrics)
+        VALUES %s
+    """, rows)
+    conn.commit()
+    cur.close()
+
+def get_comparisons_to_score(conn, force=False):
+    """
+    Comparaciones con ambas respuestas (RAG y referencia) que aun no tienen bert_metrics.
+
+    Args:
+        conn: Conexión a la base de datos.
+        force (bool): Devolver tambien las filas ya evaluadas.
+
+    Returns:
+        list: Tuplas (id, gpt_answer, rag_answer).
+    """
+    if isinstance(conn, NumpyVectorStore):
+        return [(row["id"], row["gpt_answer"], row["rag_answer"]) for row in conn.select("comparison")
+                if row.get("gpt_answer") and row.get("rag_answer") and (force or not row.get("bert_metrics"))]
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT id, gpt_answer, rag_answer
+        FROM comparison
+        WHERE coalesce(gpt_answer, '') <> '' AND coalesce(rag_answer, '') <> ''
+            {"" if force else "AND coalesce(bert_metrics, '') = ''"}
+        ORDER BY id;
+    """)
+    rows = cur.fetchall()
+    cur.close()
+    return rows
+
+def update_bert_metrics(conn, rows):
+    """
+    Escribe bert_metrics de varias comparaciones con un solo UPDATE en una transaccion.
+
+    Args:
+        conn: Conexión a la base de datos.
+        rows (list): Tuplas (id, bert_metrics).
+
+    Returns:
+        None
+    """
+    if not rows:
+        return
+    if isinstance(conn, NumpyVectorStore):
+        conn.update("comparison", ("id",), [{"id": row_id, "bert_metrics": metrics} for row_id, metrics in rows])
+        return
+    cur = conn.cursor()
+    execute_values(cur, """
+        UPDATE comparison SET bert_metrics = v.bert_metrics
+        FROM (VALUES %s) AS v (id, bert_metrics)
+        WHERE comparison.id = v.id
+    """, rows)
+    conn.commit()
+    cur.close()
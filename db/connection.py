@@ -1,21 +1,278 @@
+import os
+import threading
+import time
 import psycopg2
-from psycopg2.extras import execute_values
-from sentence_transformers import SentenceTransformer
-import numpy as np
+from psycopg2.extensions import connection as _connection, TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+from psycopg2.pool import PoolError
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from resources import get_model
+from db.numpy_store import NumpyVectorStore, NumpyStorePool
 
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
 
 
+# Backend de almacenamiento: "postgres" (por defecto) o "numpy" (ver db/numpy_store.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "postgres")
+
+# Parametros de conexion (variables de entorno o .env; por defecto la base local 'amber')
+DB_NAME = os.getenv("DB_NAME", "amber")
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "1234")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+
+# Tamanho del pool, espera maxima por una conexion (s) y tiempo de inactividad (s)
+# a partir del cual se verifica la conexion con un SELECT 1 antes de entregarla
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_HEALTH_INTERVAL = float(os.getenv("DB_POOL_HEALTH_INTERVAL", "30"))
+
+
+class PreparedConnection(_connection):
+    """
+    Conexion de psycopg2 que recuerda las sentencias preparadas en la sesion (ver execute_prepared).
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.last_used = time.monotonic()
+
+
+def db_params(**overrides) -> dict:
+    """
+    Parametros de conexion configurados, con los valores de 'overrides' por encima.
+    """
+    params = {"dbname": DB_NAME, "user": DB_USER, "password": DB_PASSWORD, "host": DB_HOST, "port": DB_PORT}
+    params.update(overrides)
+    return params
+
 def create_conn():
-    conn = psycopg2.connect(
-        dbname="amber",
-        user="postgres",
-        password="1234",
-        host="localhost"
-    )
+    if VECTOR_BACKEND == "numpy":
+        return NumpyVectorStore()
+    conn = psycopg2.connect(connection_factory=PreparedConnection, **db_params())
     return conn
 
-# Configuración del modelo para obtener embeddings
-model = SentenceTransformer('all-MiniLM-L6-v2')  # Este modelo genera vectores de dimensión 384
\ No newline at end of file
+
+class ConnectionPool:
+    """
+    Pool de conexiones compartido entre hilos.
+
+    A diferencia de psycopg2.pool.ThreadedConnectionPool, mantiene abiertas hasta 'maxconn'
+    conexiones (no cierra las que superan 'minconn'), espera hasta 'timeout' segundos cuando
+    todas estan en uso en lugar de fallar, y verifica las conexiones inactivas antes de
+    entregarlas. Expone metricas de uso con metrics().
+
+    Args:
+        minconn (int): Conexiones abiertas al crear el pool.
+        maxconn (int): Conexiones maximas simultaneas.
+        timeout (float): Espera maxima por una conexion libre (segundos).
+        health_interval (float): Inactividad (segundos) a partir de la cual se hace un SELECT 1.
+        **params: Parametros de conexion que reemplazan a los configurados (ver db_params).
+    """
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 health_interval=DB_POOL_HEALTH_INTERVAL, **params):
+        self.minconn = minconn
+        self.maxconn = max(maxconn, minconn, 1)
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.params = db_params(**params)
+        self.closed = False
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+        for _ in range(minconn):
+            self._idle.append(self._connect())
+            self._size += 1
+
+    def _connect(self):
+        return psycopg2.connect(connection_factory=PreparedConnection, **self.params)
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed or conn.info.transaction_status == TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - getattr(conn, "last_used", 0.0) < self.health_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """
+        Entrega una conexion libre (o abre una nueva si hay cupo); si no hay, espera.
+        """
+        inicio = time.perf_counter()
+        with self._cond:
+            while True:
+                if self.closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    conn = None
+                    break
+                restante = self.timeout - (time.perf_counter() - inicio)
+                if restante <= 0:
+                    self._timeouts += 1
+                    raise PoolError(f"connection pool exhausted (maxconn={self.maxconn}, timeout={self.timeout}s)")
+                self._cond.wait(restante)
+        espera = time.perf_counter() - inicio
+
+        try:
+            if conn is not None and not self._healthy(conn):
+                conn.close()
+                conn = None
+                with self._cond:
+                    self._discarded += 1
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += espera
+            self._wait_max = max(self._wait_max, espera)
+            if espera > 0.001:
+                self._waits += 1
+        return conn
+
+    def putconn(self, conn, close=False) -> None:
+        """
+        Devuelve una conexion al pool (con rollback si quedo una transaccion abierta).
+        """
+        if not conn.closed and not close:
+            status = conn.info.transaction_status
+            if status == TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+        with self._cond:
+            if close or conn.closed or self.closed:
+                if not conn.closed:
+                    conn.close()
+                self._size -= 1
+            else:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def closeall(self) -> None:
+        with self._cond:
+            self.closed = True
+            for conn in self._idle:
+                conn.close()
+                self._size -= 1
+            self._idle = []
+            self._cond.notify_all()
+
+    def metrics(self) -> dict:
+        """
+        Metricas del pool: conexiones abiertas/en uso, checkouts y tiempos de espera.
+        """
+        with self._cond:
+            return {
+                "size": self._size,
+                "in_use": self._size - len(self._idle),
+                "idle": len(self._idle),
+                "maxconn": self.maxconn,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_total_s": self._wait_total,
+                "wait_avg_ms": 1000 * self._wait_total / self._checkouts if self._checkouts else 0.0,
+                "wait_max_ms": 1000 * self._wait_max,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+            }
+
+
+def create_pool(minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX):
+    """
+    Crea un pool de conexiones compartido entre hilos (mismos parametros que create_conn).
+
+    Args:
+        minconn (int): Conexiones abiertas al crear el pool.
+        maxconn (int): Conexiones maximas simultaneas.
+
+    Returns:
+        ConnectionPool: Pool de conexiones.
+    """
+    if VECTOR_BACKEND == "numpy":
+        return NumpyStorePool(NumpyVectorStore())
+    return ConnectionPool(minconn, maxconn)
+
+@contextmanager
+def pooled_conn(pool):
+    """
+    Toma una conexion del pool y la devuelve al salir del bloque 'with'.
+    """
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+def execute_prepared(cur, name: str, sql: str, types: dict, params: dict, prefix: str = "") -> None:
+    """
+    Ejecuta 'sql' como sentencia preparada del servidor (PREPARE/EXECUTE) para no volver a
+    enviar ni planificar el texto en cada llamada. La primera vez en cada conexion se verifica
+    si la sentencia ya existe en la sesion y, si no, el PREPARE y el EXECUTE van en el mismo envio.
+
+    Args:
+        cur: Cursor de psycopg2.
+        name (str): Nombre de la sentencia.
+        sql (str): Consulta con parametros con nombre ('%(param)s').
+        types (dict): Parametro -> tipo de Postgres, en el orden de la sentencia preparada.
+        params (dict): Valores de los parametros.
+        prefix (str): SQL que se envia antes (por ejemplo, los SET de db.indexes.search_settings_sql).
+    """
+    prepared = getattr(cur.connection, "prepared", None)
+    if prepared is None:
+        # Conexion creada fuera de create_conn/create_pool: consulta normal
+        cur.execute(prefix + sql, params)
+        return
+    argumentos = ", ".join(f"%({param})s::{tipo}" for param, tipo in types.items())
+    execute = f"EXECUTE {name} ({argumentos});"
+    if name not in prepared:
+        # PREPARE no se deshace con ROLLBACK: si un intento anterior fallo despues de preparar
+        # la sentencia, ya existe en la sesion aunque no este en 'prepared'. Se consulta
+        # pg_prepared_statements en lugar de capturar el error, que abortaria la transaccion
+        # del llamador.
+        cur.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s;", (name,))
+        if cur.fetchone() is None:
+            cuerpo = sql
+            for i, param in enumerate(types, start=1):
+                cuerpo = cuerpo.replace(f"%({param})s", f"${i}")
+            cur.execute(prefix + f"PREPARE {name} ({', '.join(types.values())}) AS {cuerpo.rstrip().rstrip(';')}; "
+                        + execute, params)
+        else:
+            cur.execute(prefix + execute, params)
+        prepared.add(name)
+    else:
+        cur.execute(prefix + execute, params)
+
+def __getattr__(name):
+    # Compatibilidad: 'db.connection.model' se carga en el primer acceso (ver resources.get_model)
+    if name == "model":
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
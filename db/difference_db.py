@@ -1,7 +1,9 @@
 from psycopg2.extensions import register_adapter, AsIs
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from db.connection import model
+from db.encoding import encode_chunks, vector_literals, embedding_dimension, check_embedding_dimension, DEFAULT_BATCH_SIZE
+from db.indexes import create_search_indexes
+from db.numpy_store import NumpyVectorStore, _pg_text
+from db.answer_cache_db import invalidate_answers
 from psycopg2.extras import execute_values
 
 def addapt_numpy_float64(numpy_float64):
@@ -12,18 +14,21 @@ def addapt_numpy_int64(numpy_int64):
 register_adapter(np.float64, addapt_numpy_float64)
 register_adapter(np.int64, addapt_numpy_int64) 
 
-def create_difference_table(conn, embedding_dim=384):
+def create_difference_table(conn, embedding_dim=None):
     """
     Crea la tabla 'chunks' en PostgreSQL utilizando la extension PGVector.
     Se asume que la extensión 'vector' esta instalada en la base de datos.
 
     Args:
         conn: Conexión a la base de datos.
-        embedding_dim (int): Dimensión del embedding a almacenar.
+        embedding_dim (int): Dimensión del embedding a almacenar (por defecto, la del proveedor de embeddings).
 
     Returns:
         None
     """
+    if isinstance(conn, NumpyVectorStore):
+        return
+    embedding_dim = embedding_dimension(embedding_dim)
     cur = conn.cursor()
     # Asegurarse de que la extensión PGVector esté instalada
     cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
@@ -42,32 +47,141 @@ def create_difference_table(conn, embedding_dim=384):
             embedding VECTOR({embedding_dim})
         );
     """)
+    check_embedding_dimension(cur, "differences", embedding_dim)
+    # Columnas para la ingesta incremental: par de documentos y hash de la seccion comparada
+    cur.execute("""
+        ALTER TABLE differences
+            ADD COLUMN IF NOT EXISTS pair TEXT,
+            ADD COLUMN IF NOT EXISTS section_hash TEXT;
+    """)
+    # Versiones de los dos documentos del par (corpus de varias versiones, ver corpus.py)
+    cur.execute("""
+        ALTER TABLE differences
+            ADD COLUMN IF NOT EXISTS version1 TEXT,
+            ADD COLUMN IF NOT EXISTS version2 TEXT;
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS differences_pair_indexes ON differences (pair, indexes);")
     conn.commit()
     cur.close()
+    # Indices ANN (HNSW/IVFFlat) sobre 'embedding' y GIN de trigramas sobre 'indexes'
+    create_search_indexes(conn, "differences")
 
-def insert_differences_chunks(conn, differences, chunks1, indexes):
+def insert_differences_chunks(conn, differences, chunks1, indexes, batch_size=DEFAULT_BATCH_SIZE, pool=None):
     """
-    Para cada par de chunks, se calcula su embedding, la similitud, y se inserta junto con los textos en la tabla.
+    Para cada par de chunks, se calcula su embedding (en lotes) y se inserta junto con los textos en la tabla.
     
     Args:
         conn: Conexión a la base de datos.
+        differences (list): Lista de diferencias por índice.
         chunks1 (list): Lista de chunks del primer texto.
-        chunks2 (list): Lista de chunks del segundo texto.
         indexes (list): Lista de índices correspondientes a los chunks.
+        batch_size (int): Tamanho de lote para la codificacion.
+        pool: Pool multiproceso opcional (ver db.encoding.start_encoder_pool).
     """
+    pairs = list(zip(differences, chunks1))
+    embeddings = encode_chunks([chunk1 for _, chunk1 in pairs], batch_size=batch_size, pool=pool)
+    if isinstance(conn, NumpyVectorStore):
+        conn.insert("differences", [{"indexes": _pg_text(indexes[i]), "text_diferences": difference, "text": chunk1}
+                                    for i, (difference, chunk1) in enumerate(pairs)], embeddings)
+        invalidate_answers(conn)
+        return
     cur = conn.cursor()
+    vectores = vector_literals(embeddings)
     data = []
-    for i, (difference, chunk1) in enumerate(zip(differences, chunks1)):
-        embedding1 = model.encode(chunk1).tolist()
-
+    for i, (difference, chunk1) in enumerate(pairs):
         # Preparar los datos para la inserción
-        data.append((indexes[i], difference, chunk1, embedding1))
+        data.append((indexes[i], difference, chunk1, vectores[i]))
 
     # Query para insertar en la tabla 'differences'
     query = f"""
         INSERT INTO differences (indexes, text_diferences, text, embedding)
         VALUES %s
     """
-    execute_values(cur, query, data)
+    execute_values(cur, query, data, template="(%s, %s, %s, %s::vector)")
     conn.commit()
-    cur.close()
\ No newline at end of file
+    cur.close()
+    # Filas sin par: no se sabe que respuestas en cache dependen de ellas
+    invalidate_answers(conn)
+
+def get_section_hashes(conn, pair):
+    """
+    Devuelve el hash almacenado de cada seccion comparada para un par de documentos.
+
+    Args:
+        conn: Conexión a la base de datos.
+        pair (str): Identificador del par de documentos ("nombre1:nombre2").
+
+    Returns:
+        dict: indice -> section_hash
+    """
+    if isinstance(conn, NumpyVectorStore):
+        return {row["indexes"]: row.get("section_hash") for row in conn.select("differences", pair=pair)}
+    cur = conn.cursor()
+    cur.execute("SELECT indexes, section_hash FROM differences WHERE pair = %s;", (pair,))
+    hashes = dict(cur.fetchall())
+    cur.close()
+    return hashes
+
+def upsert_differences(conn, pair, rows, batch_size=DEFAULT_BATCH_SIZE, pool=None, versions=None):
+    """
+    Inserta o actualiza las diferencias de las secciones indicadas de un par de documentos.
+
+    Args:
+        conn: Conexión a la base de datos.
+        pair (str): Identificador del par de documentos ("nombre1:nombre2").
+        rows (list): Tuplas (indice, diferencia, texto de la seccion, section_hash).
+        batch_size (int): Tamanho de lote para la codificacion.
+        pool: Pool multiproceso opcional (ver db.encoding.start_encoder_pool).
+        versions (tuple): Versiones (version1, version2) de los documentos del par.
+    """
+    if not rows:
+        return
+    version1, version2 = versions or (None, None)
+    embeddings = encode_chunks([text for _, _, text, _ in rows], batch_size=batch_size, pool=pool)
+    if isinstance(conn, NumpyVectorStore):
+        # Mismo ON CONFLICT (pair, indexes) que en Postgres: reingestar un par no duplica filas
+        conn.upsert("differences", ("pair", "indexes"),
+                    [{"pair": pair, "version1": version1, "version2": version2, "indexes": _pg_text(index),
+                      "text_diferences": difference, "text": text, "section_hash": section_hash}
+                     for index, difference, text, section_hash in rows], embeddings)
+        invalidate_answers(conn, pair.split(":"))
+        return
+    cur = conn.cursor()
+    vectores = vector_literals(embeddings)
+    data = [(pair, version1, version2, index, difference, text, section_hash, vectores[i])
+            for i, (index, difference, text, section_hash) in enumerate(rows)]
+    execute_values(cur, """
+        INSERT INTO differences (pair, version1, version2, indexes, text_diferences, text, section_hash, embedding)
+        VALUES %s
+        ON CONFLICT (pair, indexes) DO UPDATE
+            SET text_diferences = EXCLUDED.text_diferences, text = EXCLUDED.text,
+                section_hash = EXCLUDED.section_hash, embedding = EXCLUDED.embedding,
+                version1 = EXCLUDED.version1, version2 = EXCLUDED.version2
+    """, data, template="(%s, %s, %s, %s, %s, %s, %s, %s::vector)")
+    conn.commit()
+    cur.close()
+    # Las respuestas en cache que usaron diferencias de este par quedan obsoletas
+    invalidate_answers(conn, pair.split(":"))
+
+def delete_stale_differences(conn, pair, indexes):
+    """
+    Elimina las diferencias del par cuyas secciones ya no existen.
+
+    Args:
+        conn: Conexión a la base de datos.
+        pair (str): Identificador del par de documentos ("nombre1:nombre2").
+        indexes (list): Índices vigentes.
+    """
+    if isinstance(conn, NumpyVectorStore):
+        vigentes = {_pg_text(index) for index in indexes}
+        eliminadas = conn.delete("differences", lambda row: row.get("pair") == pair and row["indexes"] not in vigentes)
+        if eliminadas:
+            invalidate_answers(conn, pair.split(":"))
+        return
+    cur = conn.cursor()
+    cur.execute("DELETE FROM differences WHERE pair = %s AND NOT (indexes = ANY(%s));", (pair, list(indexes)))
+    eliminadas = cur.rowcount
+    conn.commit()
+    cur.close()
+    if eliminadas:
+        invalidate_answers(conn, pair.split(":"))
@@ -1,22 +1,26 @@
-import psycopg2
 from psycopg2.extras import execute_values
-from sentence_transformers import SentenceTransformer
-import numpy as np
-from db.connection import model
+from db.encoding import encode_chunks, vector_literals, embedding_dimension, check_embedding_dimension, DEFAULT_BATCH_SIZE
+from parser.Chunking_loading import content_hash
+from db.indexes import create_search_indexes
+from db.numpy_store import NumpyVectorStore, _pg_text
+from db.answer_cache_db import invalidate_answers
 
 
-def create_embedding_table(conn, embedding_dim=384):
+def create_embedding_table(conn, embedding_dim=None):
     """
     Crea la tabla 'chunks' en PostgreSQL utilizando la extension PGVector.
     Se asume que la extensión 'vector' esta instalada en la base de datos.
 
     Args:
         conn: Conexión a la base de datos.
-        embedding_dim (int): Dimensión del embedding a almacenar.
+        embedding_dim (int): Dimensión del embedding a almacenar (por defecto, la del proveedor de embeddings).
 
     Returns:
         None
     """
+    if isinstance(conn, NumpyVectorStore):
+        return
+    embedding_dim = embedding_dimension(embedding_dim)
     cur = conn.cursor()
     # Asegurarse de que la extensión PGVector esté instalada
     cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
@@ -35,20 +39,176 @@ def create_embedding_table(conn, embedding_dim=384):
             embedding VECTOR({embedding_dim})
         );
     """)
+    check_embedding_dimension(cur, "chunks", embedding_dim)
+    # Columnas para la ingesta incremental (hash por seccion y por chunk)
+    cur.execute("""
+        ALTER TABLE chunks
+            ADD COLUMN IF NOT EXISTS section TEXT,
+            ADD COLUMN IF NOT EXISTS section_hash TEXT,
+            ADD COLUMN IF NOT EXISTS chunk_hash TEXT;
+    """)
+    # Rango de palabras de cada chunk dentro del documento (ver parser/sections.py)
+    cur.execute("""
+        ALTER TABLE chunks
+            ADD COLUMN IF NOT EXISTS start_word INTEGER,
+            ADD COLUMN IF NOT EXISTS end_word INTEGER;
+    """)
+    # Version del documento (corpus de varias versiones, ver corpus.py)
+    cur.execute("ALTER TABLE chunks ADD COLUMN IF NOT EXISTS version TEXT;")
+    # Texto indexado para la busqueda lexica de la recuperacion hibrida (ver retrieve_knn_QA)
+    cur.execute("""
+        ALTER TABLE chunks
+            ADD COLUMN IF NOT EXISTS text_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('spanish', coalesce(text, ''))) STORED;
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS chunks_name_chunk_hash ON chunks (name, chunk_hash);")
+    conn.commit()
+    cur.close()
+    # Indices ANN (HNSW/IVFFlat) sobre 'embedding', GIN de trigramas sobre 'indexes' y GIN de texto completo
+    create_search_indexes(conn, "chunks", fulltext=True)
+
+def insert_embedding_chunks(conn, chunks, indexes, name, batch_size=DEFAULT_BATCH_SIZE, pool=None, spans=None,
+                            version=None):
+    """
+    Calcula los embeddings de los chunks en lotes y los inserta junto con el texto en la tabla.
+
+    Args:
+        conn: Conexión a la base de datos.
+        chunks (list): Lista de chunks del documento.
+        indexes (list): Lista de índices correspondientes a los chunks.
+        name (str): Nombre del documento.
+        batch_size (int): Tamanho de lote para la codificacion.
+        pool: Pool multiproceso opcional (ver db.encoding.start_encoder_pool).
+        spans (list): Rango de palabras (inicio, fin) de cada chunk (ver chunk_document).
+        version (str): Version del documento.
+    """
+    embeddings = encode_chunks(chunks, batch_size=batch_size, pool=pool)
+    spans = spans or [(None, None)] * len(chunks)
+    if isinstance(conn, NumpyVectorStore):
+        conn.insert("chunks", [{"name": name, "version": version, "indexes": _pg_text(indexes[i]), "text": chunk,
+                                "start_word": spans[i][0], "end_word": spans[i][1]}
+                               for i, chunk in enumerate(chunks)], embeddings)
+        invalidate_answers(conn, [name])
+        return
+    cur = conn.cursor()
+    vectores = vector_literals(embeddings)
+    data = [(name, version, indexes[i], chunk, spans[i][0], spans[i][1], vectores[i]) for i, chunk in enumerate(chunks)]
+    query = "INSERT INTO chunks (name, version, indexes, text, start_word, end_word, embedding) VALUES %s"
+    execute_values(cur, query, data, template="(%s, %s, %s, %s, %s, %s, %s::vector)")
     conn.commit()
     cur.close()
+    # Las respuestas en cache que usaron chunks de este documento quedan obsoletas
+    invalidate_answers(conn, [name])
 
-def insert_embedding_chunks(conn, chunks, indexes, name):
+def upsert_embedding_chunks(conn, chunks, indexes, sections, name, batch_size=DEFAULT_BATCH_SIZE, pool=None, spans=None,
+                            version=None):
     """
-    Para cada chunk, se calcula su embedding y se inserta junto con el texto en la tabla.
+    Ingesta incremental de los chunks de un documento. Cada chunk se identifica por el hash
+    de su seccion y su texto: solo se calculan embeddings de los chunks nuevos, los existentes
+    solo actualizan sus indices, y se eliminan las filas del documento que ya no existen.
+
+    Args:
+        conn: Conexión a la base de datos.
+        chunks (list): Lista de chunks del documento (ver chunk_sections).
+        indexes (list): Lista de índices correspondientes a los chunks.
+        sections (list): Marcador de la seccion de cada chunk.
+        name (str): Nombre del documento.
+        batch_size (int): Tamanho de lote para la codificacion.
+        pool: Pool multiproceso opcional (ver db.encoding.start_encoder_pool).
+        spans (list): Rango de palabras (inicio, fin) de cada chunk (ver chunk_document).
+        version (str): Version del documento (si se indica, se asigna a todas sus filas).
+
+    Returns:
+        int: Cantidad de chunks a los que se les calculo embedding.
     """
+    # Textos de cada seccion para calcular su hash
+    textos_seccion = {}
+    for chunk, section in zip(chunks, sections):
+        textos_seccion.setdefault(section, []).append(chunk)
+    section_hashes = {section: content_hash(*textos) for section, textos in textos_seccion.items()}
+
+    spans = spans or [(None, None)] * len(chunks)
+    filas = {}
+    for chunk, index_, section, (start_word, end_word) in zip(chunks, indexes, sections, spans):
+        chunk_hash = content_hash(section, chunk)
+        filas.setdefault(chunk_hash, (name, index_, chunk, section, section_hashes[section], chunk_hash,
+                                      start_word, end_word))
+
+    if isinstance(conn, NumpyVectorStore):
+        nuevas, eliminadas = _upsert_chunks_store(conn, name, filas, batch_size, pool, version)
+        if nuevas or eliminadas:
+            invalidate_answers(conn, [name])
+        return nuevas
+
     cur = conn.cursor()
-    data = []
-    for i, chunk in enumerate(chunks):
-        # Obtener el embedding como lista de floats
-        embedding = model.encode(chunk).tolist()
-        data.append((name, indexes[i], chunk, embedding))
-    query = "INSERT INTO chunks (name, indexes, text, embedding) VALUES %s"
-    execute_values(cur, query, data)
+    cur.execute("SELECT chunk_hash FROM chunks WHERE name = %s AND chunk_hash IS NOT NULL;", (name,))
+    existentes = {row[0] for row in cur.fetchall()}
+
+    nuevas = [fila for chunk_hash, fila in filas.items() if chunk_hash not in existentes]
+    if nuevas:
+        vectores = vector_literals(encode_chunks([fila[2] for fila in nuevas], batch_size=batch_size, pool=pool))
+        execute_values(cur, """
+            INSERT INTO chunks (name, indexes, text, section, section_hash, chunk_hash, start_word, end_word, embedding)
+            VALUES %s
+            ON CONFLICT (name, chunk_hash) DO UPDATE
+                SET indexes = EXCLUDED.indexes, section_hash = EXCLUDED.section_hash,
+                    start_word = EXCLUDED.start_word, end_word = EXCLUDED.end_word, embedding = EXCLUDED.embedding
+        """, [fila + (vectores[i],) for i, fila in enumerate(nuevas)],
+            template="(%s, %s, %s, %s, %s, %s, %s, %s, %s::vector)")
+
+    # Los chunks sin cambios pueden moverse de posicion si cambio una seccion anterior
+    actualizadas = [(name, fila[1], fila[4], fila[5], fila[6], fila[7])
+                    for chunk_hash, fila in filas.items() if chunk_hash in existentes]
+    if actualizadas:
+        execute_values(cur, """
+            UPDATE chunks SET indexes = v.indexes, section_hash = v.section_hash,
+                start_word = v.start_word::integer, end_word = v.end_word::integer
+            FROM (VALUES %s) AS v (name, indexes, section_hash, chunk_hash, start_word, end_word)
+            WHERE chunks.name = v.name AND chunks.chunk_hash = v.chunk_hash
+        """, actualizadas)
+
+    # Filas obsoletas: chunks que ya no existen y filas insertadas sin hash (modo no incremental)
+    cur.execute("""
+        DELETE FROM chunks
+        WHERE name = %s AND (chunk_hash IS NULL OR NOT (chunk_hash = ANY(%s)));
+    """, (name, list(filas)))
+    eliminadas = cur.rowcount
+    if version is not None:
+        cur.execute("UPDATE chunks SET version = %s WHERE name = %s AND version IS DISTINCT FROM %s;",
+                    (version, name, version))
     conn.commit()
-    cur.close()
\ No newline at end of file
+    cur.close()
+    if nuevas or eliminadas:
+        # Las respuestas en cache que usaron chunks de este documento quedan obsoletas
+        invalidate_answers(conn, [name])
+    return len(nuevas)
+
+def _upsert_chunks_store(store, name, filas, batch_size, pool, version):
+    """
+    upsert_embedding_chunks sobre el store local (mismas operaciones que las sentencias de Postgres).
+
+    Returns:
+        tuple: (chunks con embedding nuevo, filas eliminadas).
+    """
+    existentes = {row.get("chunk_hash") for row in store.select("chunks", name=name)}
+    columnas = ("name", "indexes", "text", "section", "section_hash", "chunk_hash", "start_word", "end_word")
+
+    nuevas = [fila for chunk_hash, fila in filas.items() if chunk_hash not in existentes]
+    if nuevas:
+        embeddings = encode_chunks([fila[2] for fila in nuevas], batch_size=batch_size, pool=pool)
+        store.upsert("chunks", ("name", "chunk_hash"),
+                     [dict(zip(columnas, fila), indexes=_pg_text(fila[1]), version=version) for fila in nuevas],
+                     embeddings)
+
+    # Los chunks sin cambios pueden moverse de posicion si cambio una seccion anterior
+    store.update("chunks", ("name", "chunk_hash"), [
+        {"name": name, "chunk_hash": chunk_hash, "indexes": _pg_text(fila[1]), "section_hash": fila[4],
+         "start_word": fila[6], "end_word": fila[7]}
+        for chunk_hash, fila in filas.items() if chunk_hash in existentes
+    ])
+
+    # Filas obsoletas: chunks que ya no existen y filas insertadas sin hash (modo no incremental)
+    eliminadas = store.delete("chunks", lambda row: row.get("name") == name and row.get("chunk_hash") not in filas)
+    if version is not None:
+        store.update("chunks", ("name",), [{"name": name, "version": version}])
+    return len(nuevas), eliminadas
@@ -0,0 +1,179 @@
+"""
+Proveedores de embeddings.
+
+Un proveedor expone la dimension de sus vectores y encode(textos) -> matriz float32. Hay dos:
+  - LocalEmbeddingProvider: SentenceTransformer en la maquina (por lotes, opcionalmente con
+    un pool multiproceso). Consume CPU local.
+  - TitanEmbeddingProvider: Amazon Titan Text Embeddings en Bedrock (una peticion por texto),
+    con varias peticiones en vuelo a la vez y como maximo 'max_in_flight'. Consume red.
+
+El proveedor se elige con la variable de entorno EMBEDDING_PROVIDER ("local" o "titan") y se
+obtiene con resources.get_embedding_provider(). Las tablas se crean con la dimension del
+proveedor (ver db.encoding.embedding_dimension).
+
+Variables de entorno:
+    EMBEDDING_PROVIDER    "local" (por defecto) o "titan".
+    TITAN_EMBEDDING_MODEL Modelo de Titan (por defecto amazon.titan-embed-text-v2:0).
+    TITAN_EMBEDDING_DIM   Dimension de los vectores de Titan v2 (256, 512 o 1024).
+    TITAN_MAX_IN_FLIGHT   Peticiones simultaneas a Bedrock.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+import telemetry
+
+PROVIDER = os.getenv("EMBEDDING_PROVIDER", "local")
+TITAN_MODEL_ID = os.getenv("TITAN_EMBEDDING_MODEL", "amazon.titan-embed-text-v2:0")
+TITAN_DIMENSION = int(os.getenv("TITAN_EMBEDDING_DIM", "1024"))
+TITAN_MAX_IN_FLIGHT = int(os.getenv("TITAN_MAX_IN_FLIGHT", "8"))
+
+
+class EmbeddingProvider:
+    """
+    Interfaz de los proveedores de embeddings.
+    """
+    name = "base"
+
+    @property
+    def dimension(self) -> int:
+        raise NotImplementedError
+
+    def encode(self, textos: list[str], batch_size: int = 64, pool=None) -> np.ndarray:
+        """
+        Embeddings de los textos, en orden, como matriz float32 de forma (len(textos), dimension).
+        """
+        raise NotImplementedError
+
+    def encode_query(self, texto: str) -> np.ndarray:
+        return self.encode([texto], batch_size=1)[0]
+
+    def start_pool(self, workers: int):
+        """
+        Pool de procesos para encode; None si el proveedor no lo usa.
+        """
+        return None
+
+    def stop_pool(self, pool) -> None:
+        pass
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    SentenceTransformer local, codificando por lotes de 'batch_size' textos.
+
+    Args:
+        model: Modelo con la interfaz de SentenceTransformer (por defecto resources.get_model()).
+    """
+    name = "local"
+
+    def __init__(self, model=None):
+        self._model = model
+
+    @property
+    def model(self):
+        # Sin modelo fijo se consulta el registro en cada uso (admite resources.set_resource)
+        if self._model is None:
+            from resources import get_model
+            return get_model()
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, textos: list[str], batch_size: int = 64, pool=None) -> np.ndarray:
+        if not textos:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        if pool is not None:
+            embeddings = self.model.encode_multi_process(textos, pool, batch_size=batch_size)
+        else:
+            embeddings = self.model.encode(textos, batch_size=batch_size, convert_to_numpy=True)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def encode_query(self, texto: str) -> np.ndarray:
+        return np.asarray(self.model.encode(texto), dtype=np.float32)
+
+    def start_pool(self, workers: int):
+        return self.model.start_multi_process_pool(target_devices=["cpu"] * workers)
+
+    def stop_pool(self, pool) -> None:
+        self.model.stop_multi_process_pool(pool)
+
+
+class TitanEmbeddingProvider(EmbeddingProvider):
+    """
+    Amazon Titan Text Embeddings en Bedrock. Titan recibe un texto por peticion: los textos se
+    envian desde un pool de hilos manteniendo como maximo 'max_in_flight' peticiones en vuelo
+    (ventana deslizante: cuando termina una se envia la siguiente). Los errores de limitacion
+    de tasa se reintentan con backoff (ver LLM.call_with_backoff).
+
+    Args:
+        bedrock: Cliente 'bedrock-runtime' (por defecto resources.get_bedrock()).
+        model_id (str): Modelo de Titan.
+        dimension (int): Dimension de los vectores (Titan v2: 256, 512 o 1024).
+        max_in_flight (int): Peticiones simultaneas.
+    """
+    name = "titan"
+
+    def __init__(self, bedrock=None, model_id: str = TITAN_MODEL_ID, dimension: int = TITAN_DIMENSION,
+                 max_in_flight: int = TITAN_MAX_IN_FLIGHT):
+        self._bedrock = bedrock
+        self.model_id = model_id
+        self._dimension = dimension
+        self.max_in_flight = max(1, max_in_flight)
+
+    @property
+    def bedrock(self):
+        if self._bedrock is None:
+            from resources import get_bedrock
+            return get_bedrock()
+        return self._bedrock
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+    def _embed(self, texto: str) -> np.ndarray:
+        from LLM import embed_call, call_with_backoff
+        result = call_with_backoff(embed_call, self.bedrock, texto, model_id=self.model_id,
+                                   dimensions=self._dimension)
+        return np.asarray(result["embedding"], dtype=np.float32)
+
+    def encode(self, textos: list[str], batch_size: int = 64, pool=None) -> np.ndarray:
+        embeddings = np.zeros((len(textos), self._dimension), dtype=np.float32)
+        if not textos:
+            return embeddings
+        if self.max_in_flight == 1 or len(textos) == 1:
+            for i, texto in enumerate(textos):
+                embeddings[i] = self._embed(texto)
+            return embeddings
+
+        embed = telemetry.bind(self._embed)
+        pendientes = iter(enumerate(textos))
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(textos))) as executor:
+            en_vuelo = {}
+            for i, texto in pendientes:
+                en_vuelo[executor.submit(embed, texto)] = i
+                if len(en_vuelo) == self.max_in_flight:
+                    break
+            while en_vuelo:
+                terminados, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for future in terminados:
+                    embeddings[en_vuelo.pop(future)] = future.result()
+                    siguiente = next(pendientes, None)
+                    if siguiente is not None:
+                        en_vuelo[executor.submit(embed, siguiente[1])] = siguiente[0]
+        return embeddings
+
+
+def create_provider(name: str = PROVIDER) -> EmbeddingProvider:
+    """
+    Crea el proveedor 'name' ("local" o "titan").
+    """
+    if name == "local":
+        return LocalEmbeddingProvider()
+    if name == "titan":
+        return TitanEmbeddingProvider()
+    raise ValueError(f"Proveedor de embeddings desconocido: {name} (se espera 'local' o 'titan')")
@@ -0,0 +1,102 @@
+import os
+import numpy as np
+import telemetry
+from resources import get_embedding_provider
+
+# Tamanho de lote por defecto; se puede ajustar con la variable de entorno EMBEDDING_BATCH_SIZE
+DEFAULT_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Numero de procesos del pool de codificacion (0 = sin pool, un solo proceso)
+DEFAULT_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "0"))
+
+
+def vector_literals(embeddings) -> list[str]:
+    """
+    Literales de PGVector ('[x1,x2,...]') de las filas de una matriz de embeddings, para
+    insertarlos con un parametro '%s::vector'. Se formatea una fila completa por operacion
+    y 9 cifras significativas recuperan el float32 exacto.
+
+    Args:
+        embeddings (np.ndarray): Matriz (n, dim) o un solo vector.
+
+    Returns:
+        list[str]: Un literal por fila.
+    """
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    formato = "[" + ",".join(["%.9g"] * embeddings.shape[1]) + "]"
+    return [formato % tuple(fila) for fila in embeddings.tolist()]
+
+
+def embedding_dimension(embedding_dim: int = None) -> int:
+    """
+    Dimension de los vectores de las tablas: la indicada o la del proveedor de embeddings.
+    """
+    return embedding_dim or get_embedding_provider().dimension
+
+
+def check_embedding_dimension(cur, table: str, embedding_dim: int) -> None:
+    """
+    Verifica que la columna 'embedding' de una tabla existente tenga la dimension del
+    proveedor actual (al cambiar de proveedor hay que recrear las tablas).
+    """
+    cur.execute("SELECT atttypmod FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'embedding';",
+                (table,))
+    row = cur.fetchone()
+    if row is not None and row[0] > 0 and row[0] != embedding_dim:
+        raise ValueError(f"La tabla '{table}' guarda vectores de dimension {row[0]} y el proveedor de "
+                         f"embeddings genera {embedding_dim}: recree la tabla o cambie EMBEDDING_PROVIDER")
+
+
+def start_encoder_pool(workers: int = DEFAULT_WORKERS):
+    """
+    Levanta un pool multiproceso de SentenceTransformer, un proceso por nucleo indicado.
+    Con un proveedor remoto (Titan) no se usa pool y se devuelve None.
+
+    Args:
+        workers (int): Numero de procesos. Si es 0 se usan todos los nucleos disponibles.
+
+    Returns:
+        dict: Pool de procesos (se debe cerrar con stop_encoder_pool).
+    """
+    workers = workers or os.cpu_count() or 1
+    return get_embedding_provider().start_pool(workers)
+
+
+def stop_encoder_pool(pool) -> None:
+    """
+    Cierra un pool creado con start_encoder_pool.
+    """
+    if pool is not None:
+        get_embedding_provider().stop_pool(pool)
+
+
+def encode_chunks(chunks: list[str], batch_size: int = DEFAULT_BATCH_SIZE, pool=None) -> np.ndarray:
+    """
+    Calcula los embeddings de todos los chunks en lotes.
+
+    Args:
+        chunks (list[str]): Textos a codificar.
+        batch_size (int): Cantidad de textos por lote.
+        pool: Pool multiproceso (ver start_encoder_pool). Si es None se codifica en el proceso actual.
+
+    Returns:
+        np.ndarray: Matriz float32 de forma (len(chunks), dim).
+    """
+    provider = get_embedding_provider()
+    if len(chunks) == 0:
+        return np.zeros((0, provider.dimension), dtype=np.float32)
+
+    with telemetry.span("embedding.encode", texts=len(chunks), batch_size=batch_size, multiprocess=pool is not None,
+                        provider=provider.name):
+        embeddings = provider.encode(list(chunks), batch_size=batch_size, pool=pool)
+    telemetry.inc("embedding_texts_total", len(chunks), provider=provider.name)
+    return embeddings
+
+def encode_query(texto: str) -> np.ndarray:
+    """
+    Embedding de un solo texto (la pregunta en las busquedas kNN).
+    """
+    provider = get_embedding_provider()
+    with telemetry.span("embedding.encode", texts=1, batch_size=1, multiprocess=False, provider=provider.name):
+        embedding = provider.encode_query(texto)
+    telemetry.inc("embedding_texts_total", provider=provider.name)
+    return embedding
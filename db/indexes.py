@@ -0,0 +1,114 @@
+import os
+from db.numpy_store import NumpyVectorStore
+from db.quantization import default_quantizer, pg_mode, pg_index_sql
+
+# Tipo de indice vectorial: "hnsw", "ivfflat" o "none"
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "hnsw")
+# Parametros de construccion/busqueda de HNSW
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+# Parametros de IVFFlat (lists = 0 -> filas / 1000, minimo 10)
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "0"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+# Umbral del operador % de pg_trgm para el filtro por indices de seccion. Con 0 el filtro
+# equivale al original (similarity > 0, el indice GIN solo descarta filas sin trigramas en
+# comun); un valor mayor descarta ademas las secciones poco parecidas y puede perder candidatos
+TRGM_THRESHOLD = float(os.getenv("TRGM_THRESHOLD", "0"))
+
+
+def create_search_indexes(conn, table, index_type=VECTOR_INDEX, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION,
+                          lists=IVFFLAT_LISTS, trigram=True, fulltext=False):
+    """
+    Crea (si no existen) los indices de busqueda de una tabla con columnas 'embedding' e 'indexes':
+      - HNSW o IVFFlat de PGVector sobre 'embedding' (distancia L2, operador <->). Con
+        VECTOR_QUANTIZATION "half" o "binary" se crea en su lugar un HNSW de expresion sobre
+        la representacion compacta (ver db/quantization.py).
+      - GIN de pg_trgm sobre 'indexes' (operador %).
+      - GIN sobre la columna 'text_tsv' (texto completo en espanhol, operador @@).
+
+    Args:
+        conn: Conexión a la base de datos.
+        table (str): Nombre de la tabla ('chunks' o 'differences').
+        index_type (str): "hnsw", "ivfflat" o "none".
+        m (int): Conexiones por nodo de HNSW.
+        ef_construction (int): Tamanho de la lista de candidatos al construir HNSW.
+        lists (int): Numero de listas de IVFFlat (0 = filas / 1000).
+        trigram (bool): Crear el indice GIN de trigramas.
+        fulltext (bool): Crear el indice GIN de texto completo (la tabla debe tener 'text_tsv').
+
+    Returns:
+        None
+    """
+    if isinstance(conn, NumpyVectorStore):
+        return
+    cur = conn.cursor()
+    mode = pg_mode(default_quantizer)
+    if mode != "none" and index_type != "none":
+        cur.execute(pg_index_sql(table, _embedding_dim(cur, table), mode, m, ef_construction))
+    elif index_type == "hnsw":
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {table}_embedding_hnsw ON {table}
+            USING hnsw (embedding vector_l2_ops) WITH (m = {int(m)}, ef_construction = {int(ef_construction)});
+        """)
+    elif index_type == "ivfflat":
+        if not lists:
+            cur.execute(f"SELECT COUNT(*) FROM {table};")
+            lists = max(cur.fetchone()[0] // 1000, 10)
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS {table}_embedding_ivfflat ON {table}
+            USING ivfflat (embedding vector_l2_ops) WITH (lists = {int(lists)});
+        """)
+    if trigram:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_indexes_trgm ON {table} USING gin (indexes gin_trgm_ops);")
+    if fulltext:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_text_tsv_gin ON {table} USING gin (text_tsv);")
+    conn.commit()
+    cur.close()
+
+
+def _embedding_dim(cur, table: str) -> int:
+    """
+    Dimension declarada de la columna 'embedding' (VECTOR(dim)).
+    """
+    cur.execute("SELECT atttypmod FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'embedding';",
+                (table,))
+    return cur.fetchone()[0]
+
+
+def maintain_search_indexes(conn, table, index_type=VECTOR_INDEX, lists=IVFFLAT_LISTS):
+    """
+    Mantenimiento despues de una carga: IVFFlat fija sus centroides al construirse, por lo que
+    se reconstruye con el numero de listas acorde al tamanho actual; HNSW se actualiza solo.
+    En ambos casos se actualizan las estadisticas para el planificador.
+
+    Args:
+        conn: Conexión a la base de datos.
+        table (str): Nombre de la tabla.
+        index_type (str): "hnsw", "ivfflat" o "none".
+        lists (int): Numero de listas de IVFFlat (0 = filas / 1000).
+    """
+    if isinstance(conn, NumpyVectorStore):
+        return
+    cur = conn.cursor()
+    if index_type == "ivfflat" and pg_mode(default_quantizer) == "none":
+        cur.execute(f"DROP INDEX IF EXISTS {table}_embedding_ivfflat;")
+        conn.commit()
+        create_search_indexes(conn, table, "ivfflat", lists=lists, trigram=False)
+    cur.execute(f"ANALYZE {table};")
+    conn.commit()
+    cur.close()
+
+
+def search_settings_sql(ef_search=None, probes=None, trgm_threshold=None):
+    """
+    Sentencias SET con los parametros de busqueda; se envian en la misma llamada que la
+    consulta kNN para no agregar un viaje extra a la base de datos. Los valores omitidos
+    toman la configuracion del modulo (HNSW_EF_SEARCH, IVFFLAT_PROBES, TRGM_THRESHOLD).
+    """
+    ef_search = HNSW_EF_SEARCH if ef_search is None else ef_search
+    probes = IVFFLAT_PROBES if probes is None else probes
+    trgm_threshold = TRGM_THRESHOLD if trgm_threshold is None else trgm_threshold
+    return (f"SET hnsw.ef_search = {int(ef_search)}; "
+            f"SET ivfflat.probes = {int(probes)}; "
+            f"SET pg_trgm.similarity_threshold = {float(trgm_threshold)}; ")
@@ -0,0 +1,510 @@
+"""
+Backend de almacenamiento local (sin Postgres) para despliegues de un solo nodo y CI.
+
+Cada tabla ('chunks', 'differences') se guarda en el directorio del store como:
+  - <tabla>.f32    matriz float32 (filas x dim) que se abre con np.memmap;
+  - <tabla>.jsonl  metadatos de cada fila (mismas columnas que la tabla de Postgres);
+  - <tabla>.json   cabecera con la dimension de los embeddings.
+
+La busqueda kNN es exhaustiva y vectorizada (distancia L2 con np.argpartition), y el
+filtro por secciones reproduce la similitud de trigramas de pg_trgm. La recuperacion hibrida
+usa un indice invertido en memoria como aproximacion de text_tsv/ts_rank_cd. Con VECTOR_QUANTIZATION
+o VECTOR_PCA_DIM los candidatos se buscan sobre codigos compactos en memoria y se re-ordenan
+con la distancia exacta (ver db/quantization.py). La cache semantica de respuestas
+(db/answer_cache_db.py) se mantiene en memoria durante la vida del store.
+
+Las filas se agregan al final de los archivos; la ingesta incremental (upsert por clave,
+actualizacion de columnas y eliminacion de filas obsoletas) reescribe los metadatos y, al
+eliminar, compacta tambien la matriz de vectores.
+
+Se selecciona con VECTOR_BACKEND=numpy (ver db.connection.create_conn); el directorio
+se configura con VECTOR_STORE_PATH.
+"""
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from db.quantization import Quantizer
+
+DEFAULT_PATH = os.getenv("VECTOR_STORE_PATH", os.path.join(".cache", "vector_store"))
+
+
+def _pg_text(value) -> str:
+    """
+    Representacion textual de un valor tal como queda en una columna TEXT de Postgres
+    (las listas se guardan con el formato de arreglo '{"a","b"}').
+    """
+    if isinstance(value, (list, tuple)):
+        elementos = []
+        for elemento in value:
+            elemento = str(elemento)
+            if elemento == "" or re.search(r'[\s,{}"\\]', elemento) or elemento.upper() == "NULL":
+                elemento = '"' + elemento.replace('\\', '\\\\').replace('"', '\\"') + '"'
+            elementos.append(elemento)
+        return "{" + ",".join(elementos) + "}"
+    return str(value)
+
+
+def _trigrams(texto: str) -> set:
+    """
+    Trigramas de un texto con las mismas reglas que pg_trgm (palabras alfanumericas en
+    minusculas, con dos espacios al inicio y uno al final).
+    """
+    trigramas = set()
+    for palabra in re.findall(r'[^\W_]+', texto.lower()):
+        palabra = "  " + palabra + " "
+        trigramas.update(palabra[i:i + 3] for i in range(len(palabra) - 2))
+    return trigramas
+
+
+# Palabras vacias mas frecuentes de la configuracion 'spanish' (no se indexan)
+_STOPWORDS = {"a", "al", "con", "como", "del", "el", "en", "es", "la", "las", "lo", "los", "mas", "para",
+              "por", "que", "se", "su", "sus", "un", "una", "le", "les", "me", "mi", "ya"}
+
+
+def _terms(texto: str) -> list[str]:
+    """
+    Terminos de un texto para la busqueda lexica (palabras en minusculas sin palabras vacias).
+    """
+    return [palabra for palabra in re.findall(r'[^\W_]+', texto.lower()) if palabra not in _STOPWORDS]
+
+
+def trigram_similarity(a: str, b: str) -> float:
+    """
+    Equivalente de similarity(a, b) de pg_trgm.
+    """
+    ta, tb = _trigrams(a), _trigrams(b)
+    union = len(ta | tb)
+    return len(ta & tb) / union if union else 0.0
+
+
+class _Table:
+    def __init__(self, directory: str, name: str):
+        self.vectors_path = os.path.join(directory, name + ".f32")
+        self.meta_path = os.path.join(directory, name + ".jsonl")
+        self.header_path = os.path.join(directory, name + ".json")
+        self.dim = None
+        self.rows = []
+        self.vectors = None
+        self.norms = None
+        self._next_id = 1
+        self._quantized = {}
+        self._inverted = None
+        self.load()
+
+    def load(self) -> None:
+        if os.path.exists(self.header_path):
+            with open(self.header_path, encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, encoding="utf-8") as f:
+            self.rows = [json.loads(line) for line in f if line.strip()]
+        # Filas sin id (escritas antes de que el store las numerara)
+        self._next_id = max((row.get("id") or 0 for row in self.rows), default=0) + 1
+        for row in self.rows:
+            if row.get("id") is None:
+                row["id"] = self._next_id
+                self._next_id += 1
+        if self.dim is not None:
+            tamanho = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+            n = min(tamanho // (4 * self.dim), len(self.rows))
+            # Escritura interrumpida: se descartan las filas sin vector (y los bytes sobrantes)
+            # para que las siguientes filas queden alineadas con sus vectores
+            if n < len(self.rows):
+                self.rows = self.rows[:n]
+                self._write_meta()
+            if tamanho > n * 4 * self.dim:
+                os.truncate(self.vectors_path, n * 4 * self.dim)
+            self._map()
+            self.norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        self._reset_caches()
+
+    def _map(self) -> None:
+        n = len(self.rows)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim)) if n else \
+            np.zeros((0, self.dim), dtype=np.float32)
+
+    def _reset_caches(self) -> None:
+        self._quantized = {}
+        self._inverted = None
+
+    def _write_meta(self) -> None:
+        temporal = self.meta_path + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            for row in self.rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        os.replace(temporal, self.meta_path)
+
+    def _positions(self, key: tuple) -> dict:
+        """
+        Clave (valores de las columnas 'key') -> posiciones de las filas con esa clave.
+        """
+        posiciones = {}
+        for i, row in enumerate(self.rows):
+            posiciones.setdefault(tuple(row.get(columna) for columna in key), []).append(i)
+        return posiciones
+
+    def lexical(self, query_text: str, k: int, mask: np.ndarray = None) -> np.ndarray:
+        """
+        Posiciones de las k filas con mas apariciones de los terminos de la pregunta (cualquiera
+        de ellos), de mayor a menor. Aproxima text_tsv @@ tsquery con OR y ts_rank_cd.
+        """
+        if self._inverted is None:
+            # Indice invertido: termino -> (posiciones, apariciones)
+            indice = {}
+            for i, row in enumerate(self.rows):
+                for termino in _terms(row.get("text", "")):
+                    conteo = indice.setdefault(termino, {})
+                    conteo[i] = conteo.get(i, 0) + 1
+            self._inverted = {termino: (np.fromiter(conteo.keys(), dtype=np.int64, count=len(conteo)),
+                                        np.fromiter(conteo.values(), dtype=np.float32, count=len(conteo)))
+                              for termino, conteo in indice.items()}
+        scores = np.zeros(len(self.rows), dtype=np.float32)
+        for termino in set(_terms(query_text)):
+            if termino in self._inverted:
+                posiciones, apariciones = self._inverted[termino]
+                scores[posiciones] += apariciones
+        if mask is not None:
+            scores[~mask] = 0.0
+        candidatos = np.flatnonzero(scores > 0)
+        if len(candidatos) > k:
+            candidatos = candidatos[np.argpartition(-scores[candidatos], k - 1)[:k]]
+        # Mayor puntaje primero; a igual puntaje, la fila anterior
+        return candidatos[np.lexsort((candidatos, -scores[candidatos]))]
+
+    def quantized(self, quantizer: Quantizer):
+        """
+        Codigos compactos de los vectores para 'quantizer' (se calculan una vez por carga).
+        """
+        compactos = self._quantized.get(quantizer.key)
+        if compactos is None:
+            compactos = self._quantized[quantizer.key] = quantizer.fit(self.vectors)
+        return compactos
+
+    def append(self, rows: list[dict], embeddings: np.ndarray = None) -> None:
+        """
+        Agrega filas al final de la tabla (con un id como el SERIAL de Postgres). Los vectores
+        nuevos se agregan al archivo y se vuelve a mapear el memmap, sin releer la tabla.
+        """
+        nuevas = []
+        for row in rows:
+            nuevas.append(dict(row, id=self._next_id))
+            self._next_id += 1
+        if embeddings is not None:
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                with open(self.header_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+            if self.norms is None:
+                self.norms = np.zeros(0, dtype=np.float32)
+        # Primero los metadatos: si el proceso se corta, load() descarta filas sin vector
+        with open(self.meta_path, "a", encoding="utf-8") as f:
+            for row in nuevas:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.rows += nuevas
+        if embeddings is not None:
+            with open(self.vectors_path, "ab") as f:
+                f.write(embeddings.tobytes())
+            self.norms = np.concatenate([self.norms, np.einsum("ij,ij->i", embeddings, embeddings)])
+            self._map()
+        self._reset_caches()
+
+    def update(self, key: tuple, rows: list[dict]) -> int:
+        """
+        Actualiza las columnas de 'rows' en las filas con la misma clave (columnas 'key');
+        los vectores no cambian. Devuelve la cantidad de filas actualizadas.
+        """
+        posiciones = self._positions(key)
+        actualizadas = 0
+        for row in rows:
+            for p in posiciones.get(tuple(row.get(columna) for columna in key), ()):
+                self.rows[p].update(row)
+                actualizadas += 1
+        if actualizadas:
+            self._write_meta()
+            self._reset_caches()
+        return actualizadas
+
+    def upsert(self, key: tuple, rows: list[dict], embeddings: np.ndarray) -> int:
+        """
+        Equivalente de INSERT ... ON CONFLICT (key) DO UPDATE: las filas con una clave existente
+        reemplazan a la fila almacenada (conservando su id y su posicion, el vector se escribe en
+        su lugar) y las demas se agregan. Devuelve la cantidad de filas agregadas.
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        posiciones = self._positions(key) if self.dim is not None else {}
+        reemplazos, nuevas = {}, {}
+        for i, row in enumerate(rows):
+            clave = tuple(row.get(columna) for columna in key)
+            if clave in posiciones:
+                for p in posiciones[clave]:
+                    reemplazos[p] = i
+            else:
+                # Con claves repetidas en 'rows' gana la ultima
+                nuevas[clave] = i
+        if reemplazos:
+            destino = np.fromiter(reemplazos.keys(), dtype=np.int64, count=len(reemplazos))
+            origen = np.fromiter(reemplazos.values(), dtype=np.int64, count=len(reemplazos))
+            escritura = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(len(self.rows), self.dim))
+            escritura[destino] = embeddings[origen]
+            escritura.flush()
+            del escritura
+            self.norms[destino] = np.einsum("ij,ij->i", embeddings[origen], embeddings[origen])
+            for p, i in reemplazos.items():
+                self.rows[p] = dict(rows[i], id=self.rows[p]["id"])
+            self._write_meta()
+            self._reset_caches()
+        if nuevas:
+            self.append([rows[i] for i in nuevas.values()], embeddings[list(nuevas.values())])
+        return len(nuevas)
+
+    def delete(self, predicate) -> int:
+        """
+        Elimina las filas para las que predicate(row) es verdadero y compacta los archivos.
+        Devuelve la cantidad de filas eliminadas.
+        """
+        conservar = [i for i, row in enumerate(self.rows) if not predicate(row)]
+        eliminadas = len(self.rows) - len(conservar)
+        if not eliminadas:
+            return 0
+        if self.dim is not None:
+            temporal = self.vectors_path + ".tmp"
+            with open(temporal, "wb") as f:
+                f.write(np.ascontiguousarray(self.vectors[conservar]).tobytes())
+            os.replace(temporal, self.vectors_path)
+            self.norms = self.norms[conservar]
+        self.rows = [self.rows[i] for i in conservar]
+        self._write_meta()
+        if self.dim is not None:
+            self._map()
+        self._reset_caches()
+        return eliminadas
+
+    def section_mask(self, filtro: str, threshold: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Filas cuya columna 'indexes' cumple similarity(indexes, filtro) > 0 y >= threshold
+        (filtro de las consultas de Postgres, ver db.indexes.TRGM_THRESHOLD).
+        """
+        mask = np.zeros(len(self.rows), dtype=bool)
+        similarities = np.zeros(len(self.rows), dtype=np.float32)
+        cache = {}
+        for i, row in enumerate(self.rows):
+            indexes = row["indexes"]
+            if indexes not in cache:
+                cache[indexes] = trigram_similarity(indexes, filtro)
+            similarities[i] = cache[indexes]
+        mask[:] = (similarities > 0) & (similarities >= threshold)
+        return mask, similarities
+
+    def knn(self, query_embedding: np.ndarray, k: int, mask: np.ndarray = None, quantizer: Quantizer = None):
+        """
+        Devuelve (posiciones, distancias L2) de los k vectores mas cercanos. Con un quantizer
+        activo se preseleccionan quantizer.candidates(k) filas con los codigos compactos y
+        solo esas se comparan con la distancia exacta.
+        """
+        if self.vectors is None or len(self.rows) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        q = np.asarray(query_embedding, dtype=np.float32)
+        candidatos = np.arange(len(self.rows)) if mask is None else np.flatnonzero(mask)
+        if len(candidatos) == 0:
+            return candidatos, np.zeros(0, dtype=np.float32)
+        todos = mask is None
+        if quantizer is not None and quantizer.enabled and quantizer.candidates(k, len(candidatos)) < len(candidatos):
+            n = quantizer.candidates(k, len(candidatos))
+            aproximadas = self.quantized(quantizer).distances(q, None if todos else candidatos)
+            # Orden de filas para leer el memmap de forma secuencial
+            candidatos = np.sort(candidatos[np.argpartition(aproximadas, n - 1)[:n]])
+            todos = False
+        vectors = self.vectors if todos else self.vectors[candidatos]
+        norms = self.norms if todos else self.norms[candidatos]
+        d2 = norms - 2.0 * (vectors @ q) + float(q @ q)
+        k = min(k, len(candidatos))
+        top = np.argpartition(d2, k - 1)[:k]
+        top = top[np.argsort(d2[top])]
+        return candidatos[top], np.sqrt(np.maximum(d2[top], 0.0))
+
+
+class NumpyVectorStore:
+    """
+    Store local con la misma superficie que la conexion de Postgres para las funciones de
+    db/ y parser/Chunking_loading.py (se pasa como 'conn').
+
+    Args:
+        path (str): Directorio del store.
+    """
+    def __init__(self, path: str = DEFAULT_PATH, quantizer: Quantizer = None):
+        self.path = path
+        self.quantizer = quantizer or Quantizer()
+        os.makedirs(path, exist_ok=True)
+        self._tables = {}
+        self._lock = threading.Lock()
+        # Cache semantica de respuestas: entradas y sus embeddings normalizados (coseno)
+        self._answers = []
+        self._answer_vectors = []
+        self._next_answer_id = 0
+
+    def _table(self, name: str) -> _Table:
+        # Se llama con self._lock tomado
+        if name not in self._tables:
+            self._tables[name] = _Table(self.path, name)
+        return self._tables[name]
+
+    def table(self, name: str) -> _Table:
+        with self._lock:
+            return self._table(name)
+
+    def insert(self, name: str, rows: list[dict], embeddings: np.ndarray = None) -> None:
+        """
+        Agrega filas (y sus embeddings) a una tabla.
+        """
+        if not rows:
+            return
+        with self._lock:
+            self._table(name).append(rows, embeddings)
+
+    def select(self, table_name: str, **filtro) -> list[dict]:
+        """
+        Filas de una tabla cuyas columnas tienen los valores de 'filtro' (columna=valor).
+        """
+        with self._lock:
+            return [row for row in self._table(table_name).rows
+                    if all(row.get(columna) == valor for columna, valor in filtro.items())]
+
+    def update(self, name: str, key: tuple, rows: list[dict]) -> int:
+        """
+        Equivalente de UPDATE ... WHERE key = ...: cada fila de 'rows' actualiza sus columnas
+        en las filas de la tabla con la misma clave (ver _Table.update).
+        """
+        if not rows:
+            return 0
+        with self._lock:
+            return self._table(name).update(key, rows)
+
+    def upsert(self, name: str, key: tuple, rows: list[dict], embeddings: np.ndarray) -> int:
+        """
+        Inserta o reemplaza filas segun la clave 'key' (ver _Table.upsert).
+        """
+        if not rows:
+            return 0
+        with self._lock:
+            return self._table(name).upsert(key, rows, embeddings)
+
+    def delete(self, name: str, predicate) -> int:
+        """
+        Elimina las filas de una tabla para las que predicate(row) es verdadero.
+        """
+        with self._lock:
+            return self._table(name).delete(predicate)
+
+    def retrieve_knn_QA(self, query_embedding, list_indexes, k: int, threshold: float):
+        table = self.table("chunks")
+        filtro = _pg_text(list_indexes)
+        mask, similarities = table.section_mask(filtro, threshold) if list_indexes else (None, None)
+        posiciones, distancias = table.knn(query_embedding, k, mask, self.quantizer)
+        return [(table.rows[p]["name"], table.rows[p]["indexes"], table.rows[p]["text"], float(d),
+                 float(similarities[p]) if similarities is not None else 0.0,
+                 table.rows[p].get("start_word"), table.rows[p].get("end_word"))
+                for p, d in zip(posiciones, distancias)]
+
+    def retrieve_hybrid_QA(self, query_embedding, query_text: str, list_indexes, k: int, threshold: float,
+                           candidates: int, rrf_k: int):
+        """
+        Equivalente de KNN_QA_HYBRID_SQL: 'candidates' filas por distancia y por texto,
+        fusionadas con reciprocal rank fusion.
+        """
+        table = self.table("chunks")
+        filtro = _pg_text(list_indexes)
+        mask, similarities = table.section_mask(filtro, threshold) if list_indexes else (None, None)
+        vectoriales, _ = table.knn(query_embedding, candidates, mask, self.quantizer)
+        scores = {}
+        for lista in (vectoriales, table.lexical(query_text, candidates, mask)):
+            for rank, p in enumerate(lista, start=1):
+                scores[int(p)] = scores.get(int(p), 0.0) + 1.0 / (rrf_k + rank)
+        posiciones = sorted(scores, key=lambda p: (-scores[p], p))[:k]
+        q = np.asarray(query_embedding, dtype=np.float32)
+        return [(table.rows[p]["name"], table.rows[p]["indexes"], table.rows[p]["text"],
+                 float(np.linalg.norm(table.vectors[p] - q)),
+                 float(similarities[p]) if similarities is not None else 0.0,
+                 table.rows[p].get("start_word"), table.rows[p].get("end_word"))
+                for p in posiciones]
+
+    def retrieve_knn_difference(self, query_embedding, list_indexes: str, k: int, threshold: float):
+        table = self.table("differences")
+        if list_indexes == '':
+            posiciones, distancias = table.knn(query_embedding, k, quantizer=self.quantizer)
+            return [(table.rows[p]["indexes"], table.rows[p]["text_diferences"], float(d), table.rows[p].get("pair"))
+                    for p, d in zip(posiciones, distancias)]
+        mask, similarities = table.section_mask(list_indexes, threshold)
+        posiciones, distancias = table.knn(query_embedding, k, mask, self.quantizer)
+        return [(float(similarities[p]), table.rows[p]["text_diferences"], float(d), table.rows[p].get("pair"))
+                for p, d in zip(posiciones, distancias)]
+
+    def lookup_answer(self, query_embedding, numbers: str):
+        with self._lock:
+            candidatos = [i for i, row in enumerate(self._answers)
+                          if row["numbers"] == numbers or not row["numbers"] or not numbers]
+            if not candidatos:
+                return None
+            q = np.asarray(query_embedding, dtype=np.float32)
+            q = q / (np.linalg.norm(q) or 1.0)
+            similitudes = np.stack([self._answer_vectors[i] for i in candidatos]) @ q
+            mejor = int(np.argmax(similitudes))
+            row = self._answers[candidatos[mejor]]
+            return row["id"], row["answer"], row["latency"], float(similitudes[mejor])
+
+    def insert_answer(self, row: dict, embedding) -> None:
+        v = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._next_answer_id += 1
+            self._answers.append(dict(row, id=self._next_answer_id, hits=0))
+            self._answer_vectors.append(v / (np.linalg.norm(v) or 1.0))
+
+    def record_answer_hit(self, entry_id) -> None:
+        with self._lock:
+            for row in self._answers:
+                if row["id"] == entry_id:
+                    row["hits"] += 1
+
+    def invalidate_answers(self, documents=None) -> int:
+        with self._lock:
+            conservar = [i for i, row in enumerate(self._answers)
+                         if documents is not None and row["documents"] is not None
+                         and not set(row["documents"]) & set(documents)]
+            eliminadas = len(self._answers) - len(conservar)
+            self._answers = [self._answers[i] for i in conservar]
+            self._answer_vectors = [self._answer_vectors[i] for i in conservar]
+            return eliminadas
+
+    def answer_cache_totals(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._answers), "hits": sum(row["hits"] for row in self._answers),
+                    "saved_seconds": sum(row["hits"] * row["latency"] for row in self._answers)}
+
+    # Compatibilidad con la interfaz de conexion usada en main.py y rag.py
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class NumpyStorePool:
+    """
+    Pool trivial para answer_batch: todas las "conexiones" son el mismo store.
+    """
+    def __init__(self, store: NumpyVectorStore):
+        self.store = store
+
+    def getconn(self):
+        return self.store
+
+    def putconn(self, conn) -> None:
+        pass
+
+    def closeall(self) -> None:
+        pass
@@ -0,0 +1,188 @@
+"""
+Busqueda kNN sobre representaciones compactas de los embeddings con re-ranking exacto.
+
+Modo opcional (VECTOR_QUANTIZATION). Los candidatos se buscan sobre una version compacta
+de los vectores y solo los rerank_factor * k mejores se re-ordenan con la distancia L2
+exacta sobre los vectores completos:
+  - "half":   float16 (la mitad de memoria).
+  - "int8":   un byte por dimension, con escala por dimension (un cuarto de memoria).
+  - "binary": un bit por dimension (signo respecto a la media), distancia de Hamming (1/32).
+Opcionalmente los vectores se proyectan antes con PCA a VECTOR_PCA_DIM dimensiones.
+
+En el backend numpy (db/numpy_store.py) los codigos se calculan al cargar la tabla y se
+mantienen en memoria, mientras que los vectores completos quedan en el memmap y solo se leen
+los de los candidatos; "half" e "int8" reducen la memoria pero cada busqueda convierte los
+codigos a float32 (no hay producto matricial nativo en esos tipos), mientras que "binary" y
+PCA reducen tambien el tiempo de busqueda (ver benchmarks/bench_quantization.py). En Postgres, "half" y "binary" se implementan con indices HNSW de
+expresion de pgvector (halfvec y binary_quantize) y una consulta que re-ordena los candidatos
+por embedding <-> q; "int8" y PCA no tienen equivalente en pgvector y usan la busqueda exacta.
+
+Variables de entorno:
+    VECTOR_QUANTIZATION   "none" (por defecto), "half", "int8" o "binary".
+    VECTOR_PCA_DIM        Dimension tras PCA (0 = sin reduccion).
+    VECTOR_RERANK_FACTOR  Candidatos por resultado que se re-ordenan con la distancia exacta.
+"""
+import os
+
+import numpy as np
+
+QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+PCA_DIM = int(os.getenv("VECTOR_PCA_DIM", "0"))
+RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))
+
+MODES = ("none", "half", "int8", "binary")
+# Modos con indice de expresion en pgvector: tipo del cast y clase de operadores de HNSW
+PG_MODES = {"half": ("halfvec", "halfvec_l2_ops"), "binary": ("bit", "bit_hamming_ops")}
+
+# Filas por bloque al convertir codigos a float32 (limita la memoria temporal por consulta)
+_BLOQUE = 32768
+# Filas usadas para ajustar PCA
+_MUESTRA_PCA = 20000
+# Bits en 1 de cada byte (si numpy no tiene bitwise_count)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return _POPCOUNT[x]
+
+
+class Quantizer:
+    """
+    Configuracion de la busqueda compacta.
+
+    Args:
+        mode (str): "none", "half", "int8" o "binary".
+        pca_dim (int): Dimension tras PCA (0 = sin reduccion).
+        rerank_factor (int): Candidatos por resultado que se re-ordenan con la distancia exacta.
+    """
+    def __init__(self, mode: str = QUANTIZATION, pca_dim: int = PCA_DIM, rerank_factor: int = RERANK_FACTOR):
+        if mode not in MODES:
+            raise ValueError(f"VECTOR_QUANTIZATION desconocido: {mode} (se espera uno de {', '.join(MODES)})")
+        self.mode = mode
+        self.pca_dim = max(0, pca_dim)
+        self.rerank_factor = max(1, rerank_factor)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "none" or self.pca_dim > 0
+
+    @property
+    def key(self) -> tuple:
+        return (self.mode, self.pca_dim)
+
+    def candidates(self, k: int, n: int = None) -> int:
+        """
+        Filas que se re-ordenan con la distancia exacta para devolver k (de n disponibles).
+        """
+        return k * self.rerank_factor if n is None else min(n, k * self.rerank_factor)
+
+    def fit(self, vectors: np.ndarray) -> "QuantizedVectors":
+        return QuantizedVectors(self, vectors)
+
+    def __repr__(self) -> str:
+        return f"Quantizer(mode={self.mode!r}, pca_dim={self.pca_dim}, rerank_factor={self.rerank_factor})"
+
+
+class QuantizedVectors:
+    """
+    Codigos compactos de una matriz de vectores (ver Quantizer.fit).
+    """
+    def __init__(self, quantizer: Quantizer, vectors: np.ndarray):
+        self.mode = quantizer.mode
+        n, dim = vectors.shape
+        self.mean = None
+        self.components = None
+        if quantizer.pca_dim and quantizer.pca_dim < dim and n > 1:
+            muestra = vectors[:: max(1, n // _MUESTRA_PCA)]
+            self.mean = muestra.mean(axis=0, dtype=np.float64).astype(np.float32)
+            _, _, vt = np.linalg.svd(muestra - self.mean, full_matrices=False)
+            self.components = np.ascontiguousarray(vt[:quantizer.pca_dim].T, dtype=np.float32)
+        elif self.mode == "binary" and n > 0:
+            # El signo se toma respecto a la media para repartir los bits
+            self.mean = vectors[:: max(1, n // _MUESTRA_PCA)].mean(axis=0, dtype=np.float64).astype(np.float32)
+
+        bloques = [self.project(vectors[i:i + _BLOQUE]) for i in range(0, n, _BLOQUE)]
+        salida = self.components.shape[1] if self.components is not None else dim
+        reducidos = np.concatenate(bloques) if bloques else np.zeros((0, salida), dtype=np.float32)
+        self.scale = None
+        if self.mode == "half":
+            self.codes = reducidos.astype(np.float16)
+        elif self.mode == "int8":
+            maximo = np.abs(reducidos).max(axis=0) if n else np.ones(reducidos.shape[1], dtype=np.float32)
+            self.scale = np.where(maximo > 0, maximo / 127.0, 1.0).astype(np.float32)
+            self.codes = np.clip(np.rint(reducidos / self.scale), -127, 127).astype(np.int8)
+        elif self.mode == "binary":
+            self.codes = np.packbits(reducidos > 0, axis=1)
+        else:
+            self.codes = reducidos
+        self.norms = None
+        if self.mode != "binary":
+            # Normas de los vectores tal como se reconstruyen de los codigos
+            aproximados = self._dequantize(self.codes)
+            self.norms = np.einsum("ij,ij->i", aproximados, aproximados)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.norms.nbytes if self.norms is not None else 0)
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.mean is not None:
+            vectors = vectors - self.mean
+        if self.components is not None:
+            vectors = vectors @ self.components
+        return vectors
+
+    def _dequantize(self, codes: np.ndarray) -> np.ndarray:
+        codes = codes.astype(np.float32)
+        return codes * self.scale if self.scale is not None else codes
+
+    def distances(self, query_embedding: np.ndarray, posiciones: np.ndarray = None) -> np.ndarray:
+        """
+        Distancia aproximada (menor = mas cercano) de la consulta a cada fila (o a 'posiciones').
+        """
+        q = self.project(np.asarray(query_embedding, dtype=np.float32)[None, :])[0]
+        codes = self.codes if posiciones is None else self.codes[posiciones]
+        if self.mode == "binary":
+            bits = np.packbits(q > 0)
+            return _popcount(np.bitwise_xor(codes, bits)).sum(axis=1, dtype=np.int32)
+        norms = self.norms if posiciones is None else self.norms[posiciones]
+        # (codes * scale) @ q == codes @ (q * scale)
+        escalada = q * self.scale if self.scale is not None else q
+        productos = np.concatenate([codes[i:i + _BLOQUE].astype(np.float32) @ escalada
+                                    for i in range(0, len(codes), _BLOQUE)]) if len(codes) else \
+            np.zeros(0, dtype=np.float32)
+        return norms - 2.0 * productos + float(q @ q)
+
+
+def pg_mode(quantizer: Quantizer) -> str:
+    """
+    Modo compacto que se aplica en Postgres ("half" o "binary"), o "none".
+    """
+    return quantizer.mode if quantizer.mode in PG_MODES else "none"
+
+
+def pg_index_sql(table: str, dim: int, mode: str, m: int, ef_construction: int) -> str:
+    """
+    Indice HNSW de expresion sobre la representacion compacta de 'embedding'.
+    """
+    tipo, ops = PG_MODES[mode]
+    expresion = f"(embedding::halfvec({dim}))" if mode == "half" else f"(binary_quantize(embedding)::bit({dim}))"
+    return f"""
+        CREATE INDEX IF NOT EXISTS {table}_embedding_{tipo}_hnsw ON {table}
+        USING hnsw ({expresion} {ops}) WITH (m = {int(m)}, ef_construction = {int(ef_construction)});
+    """
+
+
+def pg_order_sql(dim: int, mode: str) -> str:
+    """
+    Expresion ORDER BY que usa el indice de pg_index_sql para la consulta %(query_embedding)s.
+    """
+    if mode == "half":
+        return f"embedding::halfvec({dim}) <-> %(query_embedding)s::halfvec({dim})"
+    return f"binary_quantize(embedding)::bit({dim}) <~> binary_quantize(%(query_embedding)s::vector)"
+
+
+default_quantizer = Quantizer()
@@ -1,5 +1,5 @@
 diferencias = [
-    "diferencias"
+    "diferencias",
     'cambios',
     'diferencia',
     'cambio',
@@ -10,7 +10,7 @@ diferencias = [
 
 plurales = [
     "secciones",
-    "Secciones"
+    "Secciones",
     "Indices",
     "indices",
     
@@ -0,0 +1,144 @@
+"""
+Cache persistente de respuestas del LLM.
+
+Todas las llamadas de LLM.py usan temperature 0.0, por lo que la misma peticion
+(modelo + cuerpo: prompt de sistema, mensaje de usuario y parametros de generacion)
+produce la misma respuesta. Se guardan en un archivo SQLite con expulsion LRU por
+tamanho total y TTL opcional.
+
+Variables de entorno:
+    LLM_CACHE          "0" desactiva la cache (bypass global).
+    LLM_CACHE_PATH     Ruta del archivo SQLite (por defecto .cache/llm_responses.sqlite3).
+    LLM_CACHE_MAX_MB   Tamanho maximo en MB antes de expulsar entradas (por defecto 256).
+    LLM_CACHE_TTL      Segundos de vida de cada entrada (por defecto sin expiracion).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite3"))
+DEFAULT_MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+DEFAULT_TTL = float(os.getenv("LLM_CACHE_TTL")) if os.getenv("LLM_CACHE_TTL") else None
+ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+
+
+class ResponseCache:
+    """
+    Cache clave-valor en disco con expulsion LRU y TTL opcional.
+
+    Args:
+        path (str): Ruta del archivo SQLite.
+        max_bytes (int): Tamanho maximo de los valores almacenados.
+        ttl (float): Segundos de vida de una entrada; None para no expirar.
+    """
+    def __init__(self, path: str = DEFAULT_PATH, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                size INTEGER,
+                created_at REAL,
+                accessed_at REAL
+            );
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_id: str, body: str) -> str:
+        """
+        Clave determinista a partir del modelo y el cuerpo JSON de la peticion.
+        """
+        return hashlib.sha256(f"{model_id}\n{body}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """
+        Devuelve la respuesta almacenada o None si no existe o expiro.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, response: dict) -> None:
+        """
+        Guarda una respuesta y expulsa las entradas menos usadas si se supera max_bytes.
+        """
+        value = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at ASC LIMIT 1"
+                ).fetchone()
+                if oldest is None or oldest[0] == key:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (oldest[0],))
+                total -= oldest[1]
+                self.evictions += 1
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """
+        Contadores de aciertos, fallos y expulsiones desde que se abrio la cache.
+        """
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    """
+    Cache compartida por el proceso (se abre en el primer uso).
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -1,11 +1,126 @@
 from parser.Parser_pdf2 import extraer_texto, eliminar_indice, remove_connector_words, remove_pagination_words
-from parser.Chunking_loading import chunk_text, chunk_text_indexes_differences
-from db.embedding_db import create_embedding_table, insert_embedding_chunks
-from db.difference_db import create_difference_table, insert_differences_chunks
+from parser.Chunking_loading import chunk_document, chunk_text_indexes_differences, section_segments, diff_segments, content_hash
+from parser.sections import SectionTable
+from db.embedding_db import create_embedding_table, insert_embedding_chunks, upsert_embedding_chunks
+from db.difference_db import create_difference_table, insert_differences_chunks, get_section_hashes, upsert_differences, delete_stale_differences
 from db.connection import create_conn
+from db.encoding import start_encoder_pool, stop_encoder_pool, DEFAULT_WORKERS
+from db.indexes import maintain_search_indexes
+import telemetry
 
 
-def parser_uniformizador(pdf_path1: str, pdf_path2: str, salida_base: str) -> None:
+def nombre_documento(pdf_path: str) -> str:
+    """
+    Nombre del documento: nombre del archivo sin extension (se guarda en chunks.name).
+    """
+    return pdf_path.split("/")[-1].split(".")[0]
+
+def preparar_documento(pdf_path: str, aligned: bool = False, workers: int = None) -> dict:
+    """
+    Extrae, limpia y divide en chunks un documento. El resultado se reutiliza en todas las
+    comparaciones en las que participa el documento (ver corpus.py).
+
+    Args:
+        pdf_path (str): Ruta al PDF.
+        aligned (bool): Chunks alineados a secciones (necesario para la ingesta incremental).
+        workers (int): Procesos para la extraccion de paginas (ver extraer_paginas).
+
+    Returns:
+        dict: name, path, texto, indexes, table (SectionTable), chunks, chunk_indexes, sections y spans.
+    """
+    name = nombre_documento(pdf_path)
+    with telemetry.span("ingest.extraccion", document=name):
+        texto, titulo = extraer_texto(pdf_path, workers)
+
+    with telemetry.span("ingest.eliminar_indice", document=name):
+        texto, indexes = eliminar_indice(texto, titulo)
+
+    with telemetry.span("ingest.normalizacion", document=name):
+        texto = remove_connector_words(texto)
+        texto = remove_pagination_words(texto)
+
+    # Tabla de secciones del documento: la usan el chunking, la comparacion y la base de datos
+    with telemetry.span("ingest.chunking", document=name) as span:
+        table = SectionTable(texto, indexes)
+        chunks, chunk_indexes, sections, spans = chunk_document(table, aligned=aligned)
+        span.set(chunks=len(chunks))
+    return {"name": name, "path": pdf_path, "texto": texto, "indexes": indexes, "table": table,
+            "chunks": chunks, "chunk_indexes": chunk_indexes, "sections": sections, "spans": spans}
+
+def guardar_documento(doc: dict, salida: str) -> None:
+    """
+    Escribe el texto uniformizado (<salida>.txt), los chunks (<salida>_chunks.txt) y la tabla
+    de secciones (<salida>_sections.json) de un documento.
+    """
+    with open(salida + ".txt", "w", encoding="utf-8") as f:
+        f.write(doc["texto"])
+    with open(salida + "_chunks.txt", "w", encoding="utf-8") as f:
+        for chunk in doc["chunks"]:
+            f.write(chunk + "\n")
+    doc["table"].save(salida + "_sections.json")
+
+def common_indexes(doc1: dict, doc2: dict) -> list[str]:
+    """
+    Indices presentes en ambos documentos, ordenados.
+    """
+    return sorted(set(doc1["indexes"]).intersection(doc2["indexes"]))
+
+def upsert_documento(conn, doc: dict, pool=None, version: str = None) -> int:
+    """
+    Ingesta incremental de los chunks de un documento (solo se recalculan los embeddings de
+    los chunks cuyo hash cambio). Devuelve la cantidad de chunks nuevos.
+    """
+    nuevos = upsert_embedding_chunks(conn, doc["chunks"], doc["chunk_indexes"], doc["sections"], doc["name"],
+                                     pool=pool, spans=doc["spans"], version=version)
+    print(f"Chunks con embedding recalculado: {doc['name']}={nuevos}/{len(doc['chunks'])}")
+    return nuevos
+
+def upsert_diferencias_par(conn, doc1: dict, doc2: dict, indexes_diff: list[str], pool=None,
+                           versions: tuple = None, incremental: bool = True) -> None:
+    """
+    Vuelve a comparar con el LLM solo las secciones del par cuyo hash (texto en ambos
+    documentos) cambio respecto a la ultima ingesta, y actualiza sus filas en 'differences'.
+    Con incremental=False se comparan todas las secciones.
+    """
+    pair = f"{doc1['name']}:{doc2['name']}"
+    almacenados = get_section_hashes(conn, pair) if incremental else {}
+    cambiadas = []
+    for marker, segment1, segment2 in section_segments(doc1["texto"], doc2["texto"], indexes_diff,
+                                                       doc1["table"], doc2["table"]):
+        section_hash = content_hash(segment1, segment2)
+        if almacenados.get(marker) != section_hash:
+            cambiadas.append((marker, segment1, segment2, section_hash))
+    print(f"Secciones a comparar ({pair}): {len(cambiadas)}/{len(indexes_diff)}")
+
+    differences = diff_segments([(segment1, segment2) for _, segment1, segment2, _ in cambiadas])
+    upsert_differences(conn, pair, [
+        (marker, difference, segment1 or segment2, section_hash)
+        for (marker, segment1, segment2, section_hash), difference in zip(cambiadas, differences)
+    ], pool=pool, versions=versions)
+    if incremental:
+        delete_stale_differences(conn, pair, indexes_diff)
+
+def ingesta_incremental(conn, doc1: dict, doc2: dict, indexes_diff: list[str], pool=None) -> None:
+    """
+    Ingesta incremental: solo se calculan embeddings de los chunks cuyo hash cambio y solo se
+    vuelven a comparar con el LLM las secciones cuyo hash (texto en ambos documentos) cambio.
+    Las filas se actualizan (upsert) en lugar de agregarse.
+
+    Args:
+        conn: Conexión a la base de datos.
+        doc1, doc2 (dict): Documentos preparados con preparar_documento(aligned=True).
+        indexes_diff (list[str]): Índices presentes en ambos documentos.
+        pool: Pool multiproceso opcional de codificacion.
+
+    Returns:
+        None
+    """
+    upsert_documento(conn, doc1, pool=pool)
+    upsert_documento(conn, doc2, pool=pool)
+    upsert_diferencias_par(conn, doc1, doc2, indexes_diff, pool=pool)
+
+@telemetry.traced("ingest")
+def parser_uniformizador(pdf_path1: str, pdf_path2: str, salida_base: str, incremental: bool = False) -> None:
     """
     Procesa dos PDFs:
       - Extrae el texto.
@@ -20,72 +135,75 @@ def parser_uniformizador(pdf_path1: str, pdf_path2: str, salida_base: str) -> No
     Se generan archivos de salida para cada PDF:
       - Un archivo con el texto uniformizado.
       - Un archivo con los chunks, separados por una línea delimitadora.
+      - Un archivo JSON con la tabla de secciones (offsets de caracter y de palabra de cada marcador).
 
     Args:
         pdf_path1 (str): Ruta al primer PDF.
         pdf_path2 (str): Ruta al segundo PDF.
         salida_base (str): Nombre base para los archivos de salida. Se anhade sufijo "_1" y "_2" para cada PDF
+        incremental (bool): Si es True, los chunks se alinean a secciones y solo se reprocesan
+            (embeddings y diferencias) las secciones que cambiaron respecto a la ultima ingesta.
     
     Returns:
         None
     """
-    name1 = pdf_path1.split("/")[-1].split(".")[0]
-    name2 = pdf_path2.split("/")[-1].split(".")[0]
+    name1 = nombre_documento(pdf_path1)
+    name2 = nombre_documento(pdf_path2)
     print(f"Procesando PDFs: {name1} y {name2}")
+    telemetry.annotate(pdf1=name1, pdf2=name2, incremental=incremental)
 
-    texto1, titulo1 = extraer_texto(pdf_path1, 1)
-    texto2, titulo2 = extraer_texto(pdf_path2, 2)
-
-    texto1, indexes1 = eliminar_indice(texto1, titulo1)
-    texto2, indexes2 = eliminar_indice(texto2, titulo2)
-    
-    texto1 = remove_connector_words(texto1)
-    texto2 = remove_connector_words(texto2)
-    
-    texto1 = remove_pagination_words(texto1)
-    texto2 = remove_pagination_words(texto2)
-    
-    chunks1, indexes1_ = chunk_text(texto1, indexes1)
-    chunks2, indexes2_ = chunk_text(texto2, indexes2)
+    doc1 = preparar_documento(pdf_path1, aligned=incremental)
+    doc2 = preparar_documento(pdf_path2, aligned=incremental)
+    texto1, texto2 = doc1["texto"], doc2["texto"]
+    chunks1, chunks2 = doc1["chunks"], doc2["chunks"]
 
-    #get unique indexes merge
-    # Get indexes that exist in both lists
-    indexes_diff = list(set(indexes1).intersection(set(indexes2)))
-    indexes_diff = sorted(indexes_diff)
+    # Indices presentes en ambos documentos
+    indexes_diff = common_indexes(doc1, doc2)
 
-    indexes_diff_, differences = chunk_text_indexes_differences(texto1, texto2, indexes_diff)
+    if not incremental:
+        with telemetry.span("ingest.diferencias", sections=len(indexes_diff)):
+            indexes_diff_, differences = chunk_text_indexes_differences(texto1, texto2, indexes_diff,
+                                                                        table1=doc1["table"], table2=doc2["table"])
     
     with open('index.txt', 'w', encoding='utf-8') as f:
         for index in indexes_diff:
             f.write(f"{index}\n")
     
-    with open(salida_base + "_1.txt", "w", encoding="utf-8") as f:
-        f.write(texto1)
-    with open(salida_base + "_2.txt", "w", encoding="utf-8") as f:
-        f.write(texto2)
-    
-    with open(salida_base + "_1_chunks.txt", "w", encoding="utf-8") as f:
-        for chunk in chunks1:
-            f.write(chunk + "\n")
-    with open(salida_base + "_2_chunks.txt", "w", encoding="utf-8") as f:
-        for chunk in chunks2:
-            f.write(chunk + "\n")
+    guardar_documento(doc1, salida_base + "_1")
+    guardar_documento(doc2, salida_base + "_2")
     
+    # Pool multiproceso de codificacion (solo si EMBEDDING_WORKERS > 0)
+    pool = start_encoder_pool(DEFAULT_WORKERS) if DEFAULT_WORKERS > 0 else None
     conn = create_conn()
-    create_embedding_table(conn)
-    insert_embedding_chunks(conn, chunks1, indexes1_, name1)
-    insert_embedding_chunks(conn, chunks2, indexes2_, name2)
-    create_difference_table(conn)
-    insert_differences_chunks(conn, differences, chunks1, indexes_diff_)
-    conn.close()
+    try:
+        create_embedding_table(conn)
+        create_difference_table(conn)
+        if incremental:
+            with telemetry.span("ingest.incremental"):
+                ingesta_incremental(conn, doc1, doc2, indexes_diff, pool=pool)
+        else:
+            with telemetry.span("ingest.insercion"):
+                insert_embedding_chunks(conn, chunks1, doc1["chunk_indexes"], name1, pool=pool, spans=doc1["spans"])
+                insert_embedding_chunks(conn, chunks2, doc2["chunk_indexes"], name2, pool=pool, spans=doc2["spans"])
+                insert_differences_chunks(conn, differences, chunks1, indexes_diff_, pool=pool)
+        with telemetry.span("ingest.indices"):
+            maintain_search_indexes(conn, "chunks")
+            maintain_search_indexes(conn, "differences")
+    finally:
+        conn.close()
+        if pool is not None:
+            stop_encoder_pool(pool)
 
     print("Proceso completado. Archivos guardados:")
     print("Texto uniformizado:", salida_base + "_1.txt", "y", salida_base + "_2.txt")
     print("Chunks para RAG:", salida_base + "_1_chunks.txt", "y", salida_base + "_2_chunks.txt")
+    print("Tablas de secciones:", salida_base + "_1_sections.json", "y", salida_base + "_2_sections.json")
 
 if __name__ == "__main__":
     import sys
-    if len(sys.argv) < 4:
-        print("Uso: python parser.py archivo1.pdf archivo2.pdf salida_base")
+    incremental = "--incremental" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != "--incremental"]
+    if len(args) < 3:
+        print("Uso: python main.py archivo1.pdf archivo2.pdf salida_base [--incremental]")
     else:
-        parser_uniformizador(sys.argv[1], sys.argv[2], sys.argv[3])
\ No newline at end of file
+        parser_uniformizador(args[0], args[1], args[2], incremental=incremental)
\ No newline at end of file
@@ -1,67 +1,308 @@
-import difflib
-from LLM import call_differences, bedrock_runtime
-from psycopg2.extras import execute_values
-import re
-from sentence_transformers import SentenceTransformer
-import numpy as np
-from db.connection import model
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from LLM import call_differences, call_with_backoff
+from resources import get_bedrock
+from db.indexes import search_settings_sql
+from db.quantization import default_quantizer, pg_mode, pg_order_sql
+from db.connection import execute_prepared
+from db.encoding import encode_query
+import telemetry
+import db.indexes
+from db.numpy_store import NumpyVectorStore
+from parser.sections import SectionTable, chunk_spans
+from parser.differences import sentence_diff, format_changes, NO_DIFFERENCES
+
+# Numero maximo de llamadas simultaneas al LLM en chunk_text_indexes_differences
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+# Recuperacion de chunks: "vector" (kNN) o "hybrid" (texto completo + kNN fusionados con RRF)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+# Candidatos de cada lista (lexica y vectorial) en la recuperacion hibrida
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "40"))
+# Constante de reciprocal rank fusion: score = sum(1 / (RRF_K + rango))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Consultas kNN; se ejecutan como sentencias preparadas (ver db.connection.execute_prepared)
+KNN_DIFFERENCE_SQL = """
+    SELECT indexes, text_diferences,
+           embedding <-> %(query_embedding)s::vector AS distance, pair
+    FROM differences
+    ORDER BY distance ASC
+    LIMIT %(k)s;
+"""
+KNN_DIFFERENCE_FILTERED_SQL = """
+    WITH candidates AS MATERIALIZED (
+        SELECT indexes, text_diferences, embedding, pair
+        FROM differences
+        WHERE indexes %% %(list_indexes)s::text AND similarity(indexes, %(list_indexes)s::text) > 0
+    )
+    SELECT similarity(indexes, %(list_indexes)s::text) AS text_similarity, text_diferences,
+           embedding <-> %(query_embedding)s::vector AS distance, pair
+    FROM candidates
+    ORDER BY distance ASC
+    LIMIT %(k)s;
+"""
+KNN_QA_SQL = """
+    SELECT name, indexes, text,
+           embedding <-> %(query_embedding)s::vector AS distance,
+           0.0 AS text_similarity, start_word, end_word
+    FROM chunks
+    ORDER BY distance ASC
+    LIMIT %(k)s;
+"""
+KNN_QA_FILTERED_SQL = """
+    WITH candidates AS MATERIALIZED (
+        SELECT name, indexes, text, embedding, start_word, end_word
+        FROM chunks
+        WHERE indexes %% %(list_indexes)s::text AND similarity(indexes, %(list_indexes)s::text) > 0
+    )
+    SELECT name, indexes, text,
+           embedding <-> %(query_embedding)s::vector AS distance,
+           similarity(indexes, %(list_indexes)s::text) AS text_similarity, start_word, end_word
+    FROM candidates
+    ORDER BY distance ASC
+    LIMIT %(k)s;
+"""
+# Variantes con VECTOR_QUANTIZATION "half"/"binary": candidatos por el indice compacto ({order},
+# ver db.quantization.pg_order_sql) y re-ordenamiento con la distancia exacta
+KNN_DIFFERENCE_QUANTIZED_SQL = """
+    WITH candidates AS MATERIALIZED (
+        SELECT indexes, text_diferences, embedding, pair
+        FROM differences
+        ORDER BY {order}
+        LIMIT %(candidates)s
+    )
+    SELECT indexes, text_diferences,
+           embedding <-> %(query_embedding)s::vector AS distance, pair
+    FROM candidates
+    ORDER BY distance ASC
+    LIMIT %(k)s;
+"""
+KNN_QA_QUANTIZED_SQL = """
+    WITH candidates AS MATERIALIZED (
+        SELECT name, indexes, text, embedding, start_word, end_word
+        FROM chunks
+        ORDER BY {order}
+        LIMIT %(candidates)s
+    )
+    SELECT name, indexes, text,
+           embedding <-> %(query_embedding)s::vector AS distance,
+           0.0 AS text_similarity, start_word, end_word
+    FROM candidates
+    ORDER BY distance ASC
+    LIMIT %(k)s;
+"""
+# Recuperacion hibrida en una sola consulta: candidatos por texto completo (indice GIN sobre
+# text_tsv, terminos de la pregunta unidos con OR) y por distancia ({order}), fusionados con
+# reciprocal rank fusion. {filtro} restringe ambas listas a las secciones pedidas; la
+# similitud de trigramas solo se calcula para las k filas devueltas.
+KNN_QA_HYBRID_SQL = """
+    WITH pregunta AS (
+        SELECT replace(plainto_tsquery('spanish', %(query_text)s)::text, '&', '|')::tsquery AS tsq
+    ),
+    vector AS (
+        SELECT id, ROW_NUMBER() OVER (ORDER BY distance) AS rank
+        FROM (
+            SELECT id, {order} AS distance
+            FROM chunks
+            WHERE TRUE {filtro}
+            ORDER BY distance
+            LIMIT %(candidates)s
+        ) v
+    ),
+    lexical AS (
+        SELECT id, ROW_NUMBER() OVER (ORDER BY score DESC, id) AS rank
+        FROM (
+            SELECT id, ts_rank_cd(text_tsv, pregunta.tsq) AS score
+            FROM chunks, pregunta
+            WHERE text_tsv @@ pregunta.tsq {filtro}
+            ORDER BY score DESC
+            LIMIT %(candidates)s
+        ) l
+    ),
+    fused AS (
+        SELECT id, SUM(1.0 / (%(rrf_k)s + rank)) AS score
+        FROM (SELECT * FROM vector UNION ALL SELECT * FROM lexical) r
+        GROUP BY id
+        ORDER BY score DESC
+        LIMIT %(k)s
+    )
+    SELECT c.name, c.indexes, c.text,
+           c.embedding <-> %(query_embedding)s::vector AS distance,
+           {similitud} AS text_similarity, c.start_word, c.end_word
+    FROM fused JOIN chunks c USING (id)
+    ORDER BY fused.score DESC;
+"""
+KNN_TYPES = {"query_embedding": "vector", "k": "int"}
+KNN_FILTERED_TYPES = {"list_indexes": "text", "query_embedding": "vector", "k": "int"}
+KNN_QUANTIZED_TYPES = {"query_embedding": "vector", "candidates": "int", "k": "int"}
+KNN_HYBRID_TYPES = {"query_text": "text", "query_embedding": "vector", "candidates": "int", "rrf_k": "int", "k": "int"}
 
 def retrieve_knn_difference(conn, list_indexes, query_text, k=5):
     """
     Dado un query, se obtiene su embedding y se recuperan los K chunks más similares usando la busqueda de vecinos.
+
+    Sin filtro de indices la consulta es un ORDER BY embedding <-> q LIMIT k que resuelve el indice
+    HNSW/IVFFlat. Con filtro, los candidatos (similarity(indexes, filtro) > 0) se obtienen primero
+    con el operador % de pg_trgm (indice GIN sobre 'indexes') y luego se ordenan por distancia
+    exacta (ver TRGM_THRESHOLD en db/indexes.py).
+
+    La ultima columna de cada fila es el par de documentos ("nombre1:nombre2", NULL en las filas
+    insertadas sin par) del que sale la diferencia (ver answer_cache.py).
     """
+    if isinstance(list_indexes, list):
+        list_indexes = [index for index in list_indexes if index.strip()]
     list_indexes = str(list_indexes).replace("[","").replace("]","")
+    with telemetry.span("db.retrieve_knn_difference", k=k, filtered=list_indexes != '') as span:
+        results = _retrieve_knn_difference(conn, list_indexes, query_text, k)
+        span.set(rows=len(results))
+    telemetry.inc("retrieval_rows_total", len(results), function="retrieve_knn_difference")
+    return results
+
+def _retrieve_knn_difference(conn, list_indexes, query_text, k):
+    query_embedding = encode_query(query_text)
+    if isinstance(conn, NumpyVectorStore):
+        return conn.retrieve_knn_difference(query_embedding, list_indexes, k, db.indexes.TRGM_THRESHOLD)
     cur = conn.cursor()
-    query_embedding = model.encode(query_text).tolist()
+    query_embedding = query_embedding.tolist()
     # La consulta utiliza el operador <-> (distancia euclidiana o coseno, según la configuración de PGVector)
-    if list_indexes == '':
-        sql = """
-        SELECT indexes, text_diferences, 
-               embedding <-> %s::vector AS distance
-        FROM differences
-            ORDER BY distance ASC
-            LIMIT %s;
-        """
-        cur.execute(sql, (query_embedding, k))
-        results = cur.fetchall()
-        cur.close()
+    if list_indexes == '' and pg_mode(default_quantizer) != "none":
+        _execute_quantized(cur, "knn_difference", KNN_DIFFERENCE_QUANTIZED_SQL, query_embedding, k)
+    elif list_indexes == '':
+        execute_prepared(cur, "knn_difference", KNN_DIFFERENCE_SQL, KNN_TYPES,
+                         {"query_embedding": query_embedding, "k": k}, prefix=search_settings_sql())
     else:
-        sql = """
-        SELECT similarity(indexes::text, %s::text) AS text_similarity, text_diferences, 
-            embedding <-> %s::vector AS distance
-        FROM differences
-            WHERE similarity(indexes::text, %s::text) > 0
-            ORDER BY distance ASC
-            LIMIT %s;
-        """
-
-        cur.execute(sql, (list_indexes, query_embedding, list_indexes, k))
-        results = cur.fetchall()
-        cur.close()
+        execute_prepared(cur, "knn_difference_filtered", KNN_DIFFERENCE_FILTERED_SQL, KNN_FILTERED_TYPES,
+                         {"list_indexes": list_indexes, "query_embedding": query_embedding, "k": k},
+                         prefix=search_settings_sql())
+    results = cur.fetchall()
+    cur.close()
     return results
 
-def retrieve_knn_QA(conn, query_text, list_indexes, k=5):
+def retrieve_knn_QA(conn, query_text, list_indexes, k=5, mode=None):
     """
     Dado un query, se obtiene su embedding y se recuperan los K chunks más similares usando la busqueda de vecinos.
+
+    Si no se piden indices se busca en todos los chunks con el indice vectorial; si se piden, los
+    candidatos se filtran con el operador % de pg_trgm (indice GIN) y se ordenan por distancia exacta.
+
+    Cada fila es (name, indexes, text, distance, text_similarity, start_word, end_word); el rango
+    de palabras permite unir chunks vecinos al armar el contexto (ver context_packer.py).
+
+    Con mode="hybrid" (o RETRIEVAL_MODE=hybrid) se combinan en la misma consulta los mejores
+    chunks por texto completo y por distancia (ver KNN_QA_HYBRID_SQL); las filas tienen el mismo
+    formato y vienen ordenadas por el puntaje fusionado.
     """
+    list_indexes = [index for index in list_indexes if index.strip()]
+    mode = mode or RETRIEVAL_MODE
+    with telemetry.span("db.retrieve_knn_QA", k=k, filtered=bool(list_indexes), mode=mode) as span:
+        if mode == "hybrid":
+            results = _retrieve_hybrid_QA(conn, query_text, list_indexes, k)
+        else:
+            results = _retrieve_knn_QA(conn, query_text, list_indexes, k)
+        span.set(rows=len(results))
+    telemetry.inc("retrieval_rows_total", len(results), function="retrieve_knn_QA")
+    return results
+
+def _retrieve_knn_QA(conn, query_text, list_indexes, k):
+    query_embedding = encode_query(query_text)
+    if isinstance(conn, NumpyVectorStore):
+        return conn.retrieve_knn_QA(query_embedding, list_indexes, k, db.indexes.TRGM_THRESHOLD)
     cur = conn.cursor()
-    query_embedding = model.encode(query_text).tolist()
+    query_embedding = query_embedding.tolist()
     # La consulta utiliza el operador <-> (distancia euclidiana o coseno, según la configuración de PGVector)
-    sql = """
-        SELECT name, indexes, text, 
-            embedding <-> %s::vector AS distance,
-            similarity(indexes::text, %s::text) AS text_similarity
-        FROM chunks
-        WHERE similarity(indexes::text, %s::text) > 0
-        ORDER BY distance ASC
-        LIMIT %s;
-    """
+    if not list_indexes and pg_mode(default_quantizer) != "none":
+        _execute_quantized(cur, "knn_qa", KNN_QA_QUANTIZED_SQL, query_embedding, k)
+    elif not list_indexes:
+        execute_prepared(cur, "knn_qa", KNN_QA_SQL, KNN_TYPES,
+                         {"query_embedding": query_embedding, "k": k}, prefix=search_settings_sql())
+    else:
+        execute_prepared(cur, "knn_qa_filtered", KNN_QA_FILTERED_SQL, KNN_FILTERED_TYPES,
+                         {"list_indexes": list_indexes, "query_embedding": query_embedding, "k": k},
+                         prefix=search_settings_sql())
+    results = cur.fetchall()
+    cur.close()
+    return results
 
-    cur.execute(sql, (query_embedding, list_indexes, list_indexes, k))
+def _retrieve_hybrid_QA(conn, query_text, list_indexes, k):
+    query_embedding = encode_query(query_text)
+    candidates = max(HYBRID_CANDIDATES, k)
+    if isinstance(conn, NumpyVectorStore):
+        return conn.retrieve_hybrid_QA(query_embedding, query_text, list_indexes, k, db.indexes.TRGM_THRESHOLD,
+                                       candidates, RRF_K)
+    cur = conn.cursor()
+    query_embedding = query_embedding.tolist()
+    mode, dim = pg_mode(default_quantizer), len(query_embedding)
+    order = pg_order_sql(dim, mode) if mode != "none" else "embedding <-> %(query_embedding)s::vector"
+    params = {"query_text": query_text, "query_embedding": query_embedding, "candidates": candidates,
+              "rrf_k": RRF_K, "k": k}
+    types = dict(KNN_HYBRID_TYPES)
+    if list_indexes:
+        filtro = "AND indexes %% %(list_indexes)s::text AND similarity(indexes, %(list_indexes)s::text) > 0"
+        sql = KNN_QA_HYBRID_SQL.format(order=order, filtro=filtro,
+                                       similitud="similarity(c.indexes, %(list_indexes)s::text)")
+        types["list_indexes"] = "text"
+        params["list_indexes"] = list_indexes
+        name = f"knn_qa_hybrid_filtered_{mode}_{dim}"
+    else:
+        sql = KNN_QA_HYBRID_SQL.format(order=order, filtro="", similitud="0.0")
+        name = f"knn_qa_hybrid_{mode}_{dim}"
+    execute_prepared(cur, name, sql, types, params,
+                     prefix=search_settings_sql(ef_search=max(db.indexes.HNSW_EF_SEARCH, candidates)))
     results = cur.fetchall()
     cur.close()
     return results
 
+def _execute_quantized(cur, name, sql, query_embedding, k):
+    """
+    kNN sobre el indice compacto (ver db/quantization.py): se piden k * VECTOR_RERANK_FACTOR
+    candidatos al HNSW (ef_search al menos igual) y se re-ordenan con la distancia exacta.
+    """
+    mode, dim = pg_mode(default_quantizer), len(query_embedding)
+    candidates = default_quantizer.candidates(k)
+    execute_prepared(cur, f"{name}_{mode}_{dim}", sql.format(order=pg_order_sql(dim, mode)), KNN_QUANTIZED_TYPES,
+                     {"query_embedding": query_embedding, "candidates": candidates, "k": k},
+                     prefix=search_settings_sql(ef_search=max(db.indexes.HNSW_EF_SEARCH, candidates)))
+
+def chunk_document(table: SectionTable, chunk_size: int=200, overlap: int=25, aligned: bool=False) -> tuple:
+    """
+    Divide un documento en chunks de aproximadamente 'chunk_size' palabras con 'overlap' palabras de
+    solapamiento, a partir de su tabla de secciones. Cada chunk es un rango de palabras y sus indices
+    se obtienen por intervalos en la tabla (sin buscar cada marcador en el texto del chunk).
+
+    Args:
+        table (SectionTable): Tabla de secciones del documento (ver parser/sections.py).
+        chunk_size (int): Tamanho de los fragmentos.
+        overlap (int): Cantidad de palabras de solapamiento entre fragmentos.
+        aligned (bool): Si es True, cada seccion se fragmenta por separado (ver chunk_sections).
+
+    Returns:
+        tuple: (chunks, indices de cada chunk, marcador de la seccion de cada chunk,
+                rango de palabras (inicio, fin) de cada chunk)
+    """
+    if aligned:
+        rangos = [(marker, *table.word_range(start, end)) for marker, start, end in table.sections()]
+    else:
+        rangos = [("", 0, len(table.palabras))]
+
+    chunks, indexes_used, sections, spans = [], [], [], []
+    for marker, start_word, end_word in rangos:
+        last_index = ""
+        for inicio, fin in chunk_spans(start_word, end_word, chunk_size, overlap):
+            index_ = []
+            if last_index != "":
+                index_.append(last_index)
+            encontrados = table.markers_in(inicio, fin)
+            if encontrados:
+                last_index = encontrados[-1]
+                index_.extend(encontrados)
+
+            indexes_used.append(index_)
+            chunks.append(table.text(inicio, fin))
+            sections.append(marker)
+            spans.append((inicio, fin))
+    return chunks, indexes_used, sections, spans
+
 def chunk_text(texto: str, indices: list[str], chunk_size: int=200, overlap: int=25) -> list:
     """
     Divide el texto en fragmentos de aproximadamente 'chunk_size' palabras con un solapamiento de 'overlap' palabras.
@@ -75,107 +316,154 @@ def chunk_text(texto: str, indices: list[str], chunk_size: int=200, overlap: int
     Returns:
         list: Lista de fragmentos (chunks) del texto.
     """
-    palabras = texto.split()
-    chunks = []
-    indexes_used = []
-    inicio = 0
-    last_index = ""
-
-    while inicio < len(palabras):
-        index_ = []
-        if last_index != "":
-            index_.append(last_index)
-
-        fin = min(inicio + chunk_size, len(palabras))
-        chunk = " ".join(palabras[inicio:fin])
-        for index in indices:
-            if index in chunk:
-                last_index = index
-                index_.append(index)
-
-        indexes_used.append(index_)
-        chunks.append(chunk)
-        inicio += chunk_size - overlap
+    chunks, indexes_used, _, _ = chunk_document(SectionTable(texto, indices), chunk_size, overlap)
     return chunks, indexes_used
 
-def split_into_sentences(text: str) -> list[str]:
+def content_hash(*parts: str) -> str:
     """
-    Splits a text into sentences. This is a simple splitter that assumes sentences end with 
-    '.', '!' or '?' followed by whitespace.
+    Hash SHA-256 de uno o varios textos; se usa para detectar secciones y chunks que cambiaron.
     """
-    # The regex looks for punctuation that likely terminates a sentence.
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    # Remove any empty sentences and strip extra spaces.
-    return [s.strip() for s in sentences if s.strip()]
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
 
-def chunk_text_indexes_differences(texto1: str, texto2: str, indices: list[str]) -> tuple[list[str], list[list[str]], list[list[str]]]:
+def chunk_sections(texto: str, indices: list[str], chunk_size: int=200, overlap: int=25) -> tuple[list[str], list[list[str]], list[str]]:
     """
-    For each index (section marker) in the given order, extracts the corresponding segments
-    from texto1 and texto2 (from the marker up to the next marker or end of text). Then, splits
-    each segment into sentences and computes the differences:
-      - For text1: the sentences that do NOT appear in text2.
-      - For text2: the sentences that do NOT appear in text1.
-    
-    If an index is not found in one of the texts, its segment is treated as empty.
-    
+    Divide el texto en chunks alineados a secciones: cada seccion (desde su marcador hasta el
+    siguiente marcador encontrado) se fragmenta por separado con chunk_text. Asi, editar una
+    seccion solo cambia los chunks de esa seccion. El texto anterior al primer marcador forma
+    una seccion con marcador "".
+
     Args:
-        texto1 (str): Full text of document 1 (assumed to be a single string without extra breaklines).
-        texto2 (str): Full text of document 2 (same assumption).
-        indices (list[str]): List of section markers (indices) in the order of appearance.
-    
+        texto (str): Texto del documento.
+        indices (list[str]): Marcadores de seccion.
+        chunk_size (int): Tamanho de los fragmentos.
+        overlap (int): Cantidad de palabras de solapamiento entre fragmentos.
+
     Returns:
-        tuple:
-          - list[str]: The markers that were processed.
-          - list[list[str]]: A list of lists; each sublist contains the sentences from texto1 for that marker
-                             that do not appear in the corresponding segment of texto2.
-          - list[list[str]]: Similarly, a list of lists for texto2 differences.
+        tuple: (chunks, indices de cada chunk, marcador de la seccion de cada chunk)
     """
-    markers = []
-    differences = []
+    chunks, indexes_used, sections, _ = chunk_document(SectionTable(texto, indices), chunk_size, overlap, aligned=True)
+    return chunks, indexes_used, sections
 
-    
-    
+def section_segments(texto1: str, texto2: str, indices: list[str],
+                     table1: SectionTable = None, table2: SectionTable = None) -> list[tuple[str, str, str]]:
+    """
+    For each index (section marker) in the given order, extracts the corresponding segments
+    from texto1 and texto2 (from the marker up to the next marker or end of text).
+    If an index is not found in one of the texts, its segment is empty.
+
+    Args:
+        texto1, texto2 (str): Full texts of both documents.
+        indices (list[str]): Section markers in order of appearance.
+        table1, table2 (SectionTable): Section tables of both texts, reused from chunking if given.
+
+    Returns:
+        list[tuple[str, str, str]]: (marker, segment1, segment2) for every marker in 'indices'.
+    """
+    table1 = table1 or SectionTable(texto1, indices)
+    table2 = table2 or SectionTable(texto2, indices)
+    segments = []
     for i, marker in enumerate(indices):
-        # Find segment boundaries in texto1
-        start1 = texto1.find(marker)
-        if start1 == -1:
-            segment1 = ""
-        else:
-            markers.append(marker)
-            if i < len(indices) - 1:
-                next_marker = indices[i+1]
-                end1 = texto1.find(next_marker, start1)
-                if end1 == -1:
-                    end1 = len(texto1)
-            else:
-                end1 = len(texto1)
-            segment1 = texto1[start1:end1].strip()
-        
-        # Find segment boundaries in texto2
-        start2 = texto2.find(marker)
-        if start2 == -1:
-            segment2 = ""
-        else:
-            if i < len(indices) - 1:
-                next_marker = indices[i+1]
-                end2 = texto2.find(next_marker, start2)
-                if end2 == -1:
-                    end2 = len(texto2)
-            else:
-                end2 = len(texto2)
-            segment2 = texto2[start2:end2].strip()
-        
-        # Split the segments into sentences.
-        
+        next_marker = indices[i + 1] if i < len(indices) - 1 else None
+        segments.append((marker, table1.segment(marker, next_marker), table2.segment(marker, next_marker)))
+    return segments
+
+def diff_segments(pairs: list[tuple[str, str]], max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, bedrock=None,
+                  local_diff: bool = True) -> list[str]:
+    """
+    Asks the LLM for the differences of each (segment1, segment2) pair.
+
+    With local_diff, both segments are first compared sentence by sentence (see
+    parser.differences.sentence_diff): sections without changes get NO_DIFFERENCES without
+    calling the LLM, and only the changed sentences are sent to be summarized. Without it,
+    the whole segments are sent for every pair.
+
+    The LLM calls run concurrently with at most 'max_in_flight' requests in flight; throttling
+    errors are retried with exponential backoff and jitter (see LLM.call_with_backoff). Results
+    keep the order of 'pairs'.
+
+    Args:
+        pairs (list[tuple[str, str]]): Segments of document 1 and document 2 to compare.
+        max_in_flight (int): Maximum number of concurrent LLM calls (1 = sequential).
+        bedrock: Bedrock runtime client (defaults to resources.get_bedrock()). Any object exposing
+                 invoke_model, such as a local stub, can be used.
+        local_diff (bool): Compare sentences locally and only send the changes to the LLM.
+
+    Returns:
+        list[str]: The differences returned by the LLM for each pair.
+    """
+    if local_diff:
+        contexts = []
+        for segment1, segment2 in pairs:
+            changes = sentence_diff(segment1, segment2)
+            contexts.append(f"Cambios entre el Texto 1 y el Texto 2:\n{format_changes(changes)}" if changes else None)
+    else:
+        contexts = [f"Texto 1: {segment1} Texto 2: {segment2}" for segment1, segment2 in pairs]
+
+    pendientes = [i for i, context in enumerate(contexts) if context is not None]
+    if local_diff:
+        enviados = sum(len(contexts[i]) for i in pendientes)
+        completos = sum(len(segment1) + len(segment2) for segment1, segment2 in pairs)
+        telemetry.inc("diff_sections_total", len(pairs) - len(pendientes), result="unchanged")
+        telemetry.inc("diff_chars_total", enviados, kind="sent")
+        telemetry.inc("diff_chars_total", completos, kind="full")
+        telemetry.annotate(sections=len(pairs), unchanged=len(pairs) - len(pendientes), chars_sent=enviados,
+                           chars_full=completos)
+    telemetry.inc("diff_sections_total", len(pendientes), result="llm")
+    if not pendientes:
+        return [NO_DIFFERENCES] * len(pairs)
+    if bedrock is None:
+        bedrock = get_bedrock()
+
+    def diff_section(context: str) -> str:
         prompt = (
         f"Utilizando el siguiente contexto responde la pregunta:\n\n"
-        f"Context:\nTexto 1: {segment1} Texto 2: {segment2}\n\n"
+        f"Context:\n{context}\n\n"
         f"Question: ¿Cuales son las diferencias entre los Textos?\n"
         f"Answer:"
         )
         # Call the LLM to get the differences
-        response = call_differences(bedrock_runtime, prompt, '¿Cuales son las diferencias entre los Textos?')
-        difference = response['content'][0]['text'].strip()
-        differences.append(difference)
+        response = call_with_backoff(call_differences, bedrock, prompt, '¿Cuales son las diferencias entre los Textos?')
+        return response['content'][0]['text'].strip()
+
+    if max_in_flight <= 1:
+        respuestas = [diff_section(contexts[i]) for i in pendientes]
+    else:
+        # executor.map conserva el orden de las secciones
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            # bind: las llamadas de cada hilo quedan dentro de la traza de la ingesta
+            respuestas = list(executor.map(telemetry.bind(diff_section), [contexts[i] for i in pendientes]))
+
+    differences = [NO_DIFFERENCES] * len(pairs)
+    for i, respuesta in zip(pendientes, respuestas):
+        differences[i] = respuesta
+    return differences
+
+def chunk_text_indexes_differences(texto1: str, texto2: str, indices: list[str],
+                                   max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                                   bedrock=None, table1: SectionTable = None,
+                                   table2: SectionTable = None, local_diff: bool = True) -> tuple[list[str], list[str]]:
+    """
+    For each index (section marker) in the given order, extracts the corresponding segments
+    from texto1 and texto2 (see section_segments) and asks the LLM for the differences between
+    both segments (see diff_segments). Results keep the order of 'indices'.
     
-    return markers, differences
\ No newline at end of file
+    Args:
+        texto1 (str): Full text of document 1 (assumed to be a single string without extra breaklines).
+        texto2 (str): Full text of document 2 (same assumption).
+        indices (list[str]): List of section markers (indices) in the order of appearance.
+        max_in_flight (int): Maximum number of concurrent LLM calls (1 = sequential).
+        bedrock: Bedrock runtime client (defaults to resources.get_bedrock()).
+        table1, table2 (SectionTable): Section tables of both texts, reused from chunking if given.
+        local_diff (bool): Skip unchanged sections and send only changed sentences (see diff_segments).
+    
+    Returns:
+        tuple:
+          - list[str]: The markers that were found in texto1.
+          - list[str]: The differences returned by the LLM for each marker in 'indices'.
+    """
+    table1 = table1 or SectionTable(texto1, indices)
+    segments = section_segments(texto1, texto2, indices, table1, table2)
+    markers = [marker for marker in indices if table1.first(marker) != -1]
+    differences = diff_segments([(segment1, segment2) for _, segment1, segment2 in segments],
+                                max_in_flight=max_in_flight, bedrock=bedrock, local_diff=local_diff)
+    return markers, differences
@@ -39,8 +39,9 @@ def parse_and_uniformize_pdfs(pdf1_path, pdf2_path, output_path):
         output_file.write(combined_text)
 
 # Ejemplo de uso
-pdf1_path = "./data/tdr_v4.pdf"
-pdf2_path = "./data/tdr_v6.pdf"
-output_path = "./data/documento_uniforme.txt"
+if __name__ == "__main__":
+    pdf1_path = "./data/tdr_v4.pdf"
+    pdf2_path = "./data/tdr_v6.pdf"
+    output_path = "./data/documento_uniforme.txt"
 
-parse_and_uniformize_pdfs(pdf1_path, pdf2_path, output_path)
\ No newline at end of file
+    parse_and_uniformize_pdfs(pdf1_path, pdf2_path, output_path)
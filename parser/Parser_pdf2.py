@@ -1,35 +1,108 @@
+import hashlib
+import os
 import re
-import unicodedata
+from concurrent.futures import ProcessPoolExecutor
 from PyPDF2 import PdfReader
-import spacy
+from parser.normalizer import default_normalizer, get_normalizer
 
-try:
-    nlp = spacy.load("es_core_news_sm")
-except OSError:
-    from spacy.cli import download
-    download("es_core_news_sm")
-    nlp = spacy.load("es_core_news_sm")
+# Directorio de la cache de texto por pagina (una carpeta por hash de contenido del PDF)
+PAGE_CACHE_DIR = os.getenv("PDF_PAGE_CACHE_DIR", os.path.join(".cache", "pages"))
 
-def extraer_texto(pdf_path:str, i ) -> str:
+def _pdf_hash(pdf_path: str) -> str:
+    """
+    Hash SHA-256 del contenido del PDF (identifica la version del documento en la cache).
+    """
+    sha = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+def _extraer_rango(pdf_path: str, numeros: list[int]) -> list[str]:
+    """
+    Extrae el texto de las paginas indicadas (se ejecuta en un proceso del pool).
+    """
+    lector = PdfReader(pdf_path)
+    return [lector.pages[n].extract_text() for n in numeros]
+
+def extraer_paginas(pdf_path: str, workers: int = None, use_cache: bool = True) -> list[str]:
+    """
+    Extrae el texto de cada pagina del PDF exactamente una vez, repartiendo las paginas
+    entre un pool de procesos. El resultado se guarda en disco por hash del PDF y numero
+    de pagina, de modo que una segunda ejecucion sobre el mismo archivo no extrae nada.
+
+    Args:
+        pdf_path (str): Ruta al archivo PDF.
+        workers (int): Numero de procesos (por defecto, los nucleos disponibles).
+        use_cache (bool): Si es False se ignora la cache en disco.
+
+    Returns:
+        list[str]: Texto de cada pagina, en orden.
+    """
+    cache_dir = os.path.join(PAGE_CACHE_DIR, _pdf_hash(pdf_path))
+    meta_path = os.path.join(cache_dir, "pages.txt")
+
+    if use_cache and os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            n_paginas = int(f.read())
+    else:
+        n_paginas = len(PdfReader(pdf_path).pages)
+
+    paginas = [None] * n_paginas
+    if use_cache:
+        for n in range(n_paginas):
+            ruta = os.path.join(cache_dir, f"{n}.txt")
+            if os.path.exists(ruta):
+                with open(ruta, encoding="utf-8", errors="surrogatepass", newline="") as f:
+                    paginas[n] = f.read()
+
+    faltantes = [n for n in range(n_paginas) if paginas[n] is None]
+    if faltantes:
+        workers = min(workers or os.cpu_count() or 1, len(faltantes))
+        # Bloques contiguos por proceso: cada proceso abre el PDF una sola vez
+        tamanho = -(-len(faltantes) // workers)
+        bloques = [faltantes[i:i + tamanho] for i in range(0, len(faltantes), tamanho)]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                resultados = list(executor.map(_extraer_rango, [pdf_path] * len(bloques), bloques))
+        else:
+            resultados = [_extraer_rango(pdf_path, bloque) for bloque in bloques]
+        for bloque, textos in zip(bloques, resultados):
+            for n, texto in zip(bloque, textos):
+                paginas[n] = texto
+
+        if use_cache:
+            os.makedirs(cache_dir, exist_ok=True)
+            for n in faltantes:
+                ruta = os.path.join(cache_dir, f"{n}.txt")
+                with open(ruta + ".tmp", "w", encoding="utf-8", errors="surrogatepass", newline="") as f:
+                    f.write(paginas[n])
+                os.replace(ruta + ".tmp", ruta)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                f.write(str(n_paginas))
+    return paginas
+
+def extraer_texto(pdf_path:str, workers: int = None) -> tuple[str, str]:
     """
     Extrae el texto completo de un PDF.
 
     Args:
         pdf_path (str): Ruta al archivo PDF.
+        workers (int): Numero de procesos para la extraccion (ver extraer_paginas).
     
     Returns:
-        str: Texto extraido del PDF
+        tuple: (texto extraido del PDF, titulo del documento)
     """
-    lector = PdfReader(pdf_path)
-    texto = ""
+    paginas = extraer_paginas(pdf_path, workers)
     titulo = ""
-    for pagina in lector.pages:
+    for texto_pagina in paginas:
         # si la pagina contiene indice, buscamos el texto escrito antes de indice para conseguir el titulo
+        texto_lower = texto_pagina.lower()
         for t in ["índice", "tabla de contenidos"]:
-            if t in pagina.extract_text().lower():
-                titulo = pagina.extract_text().strip().lower().split(t)[0]
+            if t in texto_lower:
+                titulo = texto_pagina.strip().lower().split(t)[0]
                 titulo = re.sub(r'\s+', ' ', titulo).strip()
-        texto += pagina.extract_text() + "\n"
+    texto = "".join(texto_pagina + "\n" for texto_pagina in paginas)
     titulo = normalize_text(titulo)
     return texto, titulo
 
@@ -173,8 +246,6 @@ def eliminar_indice(texto: str, titulo: str) -> str:
     for i in range(len(indexes)):
         indexes[i] = normalize_text(indexes[i])
         indexes[i] = remove_connector_words(indexes[i])
-    import time
-    time.sleep(9)
     texto_limpio = "\n".join(new_lines)
     
     texto_limpio = normalize_text(texto_limpio)
@@ -195,13 +266,7 @@ def remove_connector_words(texto: str, connector_words: dict=None)-> str:
     Returns:
         str: Texto sin las palabras conectivas.
     """
-    if connector_words is None:
-        connector_words = {"y", "o", "ni", "pero", "sino", "aunque", 
-                           "ademas", "tampoco", "sin", "embargo", "no obstante", "aun", "de"}
-    pattern = r'\b(' + '|'.join(re.escape(word) for word in connector_words) + r')\b'
-    texto_sin_conectores = re.sub(pattern, '', texto, flags=re.IGNORECASE)
-    texto_sin_conectores = re.sub(r'\s+', ' ', texto_sin_conectores)
-    return texto_sin_conectores.strip()
+    return get_normalizer(connector_words).remove_connectors(texto)
 
 def normalize_text(texto: str) -> str:
     """
@@ -216,11 +281,7 @@ def normalize_text(texto: str) -> str:
     Returns:
         str: Texto normalizado.
     """
-    texto = texto.lower()
-    texto = unicodedata.normalize('NFKD', texto)
-    texto = texto.encode('ASCII', 'ignore').decode('utf-8')
-    #texto = re.sub(r'[^\w\s]', '', texto)
-    return texto
+    return default_normalizer.normalize(texto)
 
 def remove_pagination_words(texto: str) -> str:
     """
@@ -232,12 +293,4 @@ def remove_pagination_words(texto: str) -> str:
     Returns:
         str: Texto sin las palabras de paginacion.
     """
-    texto = re.sub(r'\bpagina\d+de\d+\b', '', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'\bp a g i n a\d+d e\d+\b', '', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'\b\w*\d+de\d+\w*\b', '', texto, flags=re.IGNORECASE)
-    texto = re.sub(r'\s+', ' ', texto).strip()
-    return texto
-
-
-
-
+    return default_normalizer.remove_pagination(texto)
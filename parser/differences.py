@@ -1,3 +1,20 @@
+import difflib
+import re
+
+# Respuesta para secciones sin cambios (no se consulta al LLM)
+NO_DIFFERENCES = "No hay diferencias entre los Textos."
+
+
+def split_into_sentences(text: str) -> list[str]:
+    """
+    Splits a text into sentences. This is a simple splitter that assumes sentences end with 
+    '.', '!' or '?' followed by whitespace.
+    """
+    # The regex looks for punctuation that likely terminates a sentence.
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    # Remove any empty sentences and strip extra spaces.
+    return [s.strip() for s in sentences if s.strip()]
+
 def has_differences(chunks_texto1: list[str], chunks_texto2: list[str]) -> list[bool]:
     """
     Compares the corresponding chunks from two texts and checks if there are differences.
@@ -22,13 +39,73 @@ def has_differences(chunks_texto1: list[str], chunks_texto2: list[str]) -> list[
     
     return differences
 
+def sentence_diff(text1: str, text2: str, modified_ratio: float = 0.5) -> list[dict]:
+    """
+    Compares two texts sentence by sentence (difflib alignment over split_into_sentences).
+
+    Replaced sentences are paired in order: a pair whose similarity is at least 'modified_ratio'
+    is reported as modified, otherwise as one removed and one added sentence.
+
+    Args:
+        text1 (str): Text of document 1.
+        text2 (str): Text of document 2.
+        modified_ratio (float): Minimum similarity (difflib ratio) to report a modified sentence.
+
+    Returns:
+        list[dict]: Change records with keys type ("added", "removed" or "modified"), before,
+                    after (the sentences, None when not applicable), position1 and position2
+                    (sentence index in each text). Empty if both texts have the same sentences.
+    """
+    sentences1 = split_into_sentences(text1)
+    sentences2 = split_into_sentences(text2)
+    if sentences1 == sentences2:
+        return []
+
+    changes = []
+    matcher = difflib.SequenceMatcher(None, sentences1, sentences2, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        removed = list(range(i1, i2))
+        added = list(range(j1, j2))
+        if tag == "replace":
+            for i, j in zip(removed, added):
+                before, after = sentences1[i], sentences2[j]
+                if difflib.SequenceMatcher(None, before, after).ratio() >= modified_ratio:
+                    changes.append({"type": "modified", "before": before, "after": after, "position1": i, "position2": j})
+                else:
+                    changes.append({"type": "removed", "before": before, "after": None, "position1": i, "position2": j})
+                    changes.append({"type": "added", "before": None, "after": after, "position1": i, "position2": j})
+            pares = min(len(removed), len(added))
+            removed, added = removed[pares:], added[pares:]
+        for i in removed:
+            changes.append({"type": "removed", "before": sentences1[i], "after": None, "position1": i, "position2": j2})
+        for j in added:
+            changes.append({"type": "added", "before": None, "after": sentences2[j], "position1": i2, "position2": j})
+    return changes
+
+def format_changes(changes: list[dict]) -> str:
+    """
+    Text representation of the change records of sentence_diff, used as LLM context.
+    """
+    lines = []
+    for change in changes:
+        if change["type"] == "modified":
+            lines.append(f"Modificada: Texto 1: {change['before']} Texto 2: {change['after']}")
+        elif change["type"] == "removed":
+            lines.append(f"Solo en Texto 1: {change['before']}")
+        else:
+            lines.append(f"Solo en Texto 2: {change['after']}")
+    return "\n".join(lines)
+
 # Example of how to use it:
-chunks_texto1 = ["This is a sample chunk of text.", "Another chunk here.", "Final chunk."]
-chunks_texto2 = ["This is a sample chunk of text.", "Another chunk here with some differences.", "Final chunk."]
+if __name__ == "__main__":
+    chunks_texto1 = ["This is a sample chunk of text.", "Another chunk here.", "Final chunk."]
+    chunks_texto2 = ["This is a sample chunk of text.", "Another chunk here with some differences.", "Final chunk."]
 
-# Get whether chunks have differences or not
-differences = has_differences(chunks_texto1, chunks_texto2)
+    # Get whether chunks have differences or not
+    differences = has_differences(chunks_texto1, chunks_texto2)
 
-# Print the result
-for i, diff in enumerate(differences):
-    print(f"Chunk {i+1} has differences: {diff}")
+    # Print the result
+    for i, diff in enumerate(differences):
+        print(f"Chunk {i+1} has differences: {diff}")
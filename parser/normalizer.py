@@ -0,0 +1,206 @@
+"""
+Normalizacion de texto compilada una sola vez y reutilizable.
+
+TextNormalizer produce exactamente la misma salida que normalize_text, remove_connector_words
+y remove_pagination_words (parser/Parser_pdf2.py), con menos recorridos del texto:
+  - conectores: una sola expresion compilada, factorizada por prefijos;
+  - paginacion: "pagina1de2" es un caso particular de las palabras con "<n>de<m>", que se
+    ubican con una busqueda literal y se eliminan completas; "p a g i n a" solo se busca
+    con un patron que empieza por un literal;
+  - espacios: " ".join(texto.split()) en lugar de re.sub(r'\\s+', ' ', ...).strip();
+  - diacriticos: texto ASCII sin cambios; si no, NFKD + ASCII (mas rapido en CPython que
+    str.translate con una tabla por caracter sobre documentos completos).
+
+stream() aplica el mismo proceso sobre un iterador de paginas, cortando el texto solo donde
+el resultado no depende de lo que venga despues.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, Iterator
+
+CONNECTOR_WORDS = {"y", "o", "ni", "pero", "sino", "aunque",
+                   "ademas", "tampoco", "sin", "embargo", "no obstante", "aun", "de"}
+
+# Caracteres del final del buffer de stream() donde se busca un punto de corte
+_VENTANA_CORTE = 2048
+_PALABRA = re.compile(r'\S+')
+
+
+def _alternation(words: Iterable[str]) -> str:
+    """
+    Alternancia de expresion regular factorizada por prefijos ("sin|sino" -> "sin(?:o)?").
+    Ante dos palabras con el mismo prefijo se prueba primero la mas larga.
+    """
+    arbol = {}
+    for word in words:
+        if not word:
+            continue
+        nodo = arbol
+        for c in word:
+            nodo = nodo.setdefault(c, {})
+        nodo[""] = {}
+
+    def emitir(nodo: dict) -> str:
+        ramas = [re.escape(c) + emitir(hijo) for c, hijo in sorted(nodo.items()) if c]
+        if not ramas:
+            return ""
+        cuerpo = ramas[0] if len(ramas) == 1 else "(?:" + "|".join(ramas) + ")"
+        if "" in nodo:
+            return "(?:" + cuerpo + ")?"
+        return cuerpo
+
+    return emitir(arbol)
+
+
+def _is_word_char(c: str) -> bool:
+    # Misma definicion que \w en expresiones regulares sobre str
+    return c.isalnum() or c == "_"
+
+
+class TextNormalizer:
+    """
+    Normalizador de texto con los patrones precompilados.
+
+    Args:
+        connector_words (set[str]): Palabras conectivas a eliminar (por defecto CONNECTOR_WORDS).
+    """
+    def __init__(self, connector_words: Iterable[str] = None):
+        self.connector_words = set(CONNECTOR_WORDS if connector_words is None else connector_words)
+        palabras = [word for word in self.connector_words if word]
+        if palabras:
+            iniciales = "".join(sorted({re.escape(word[0]) for word in palabras}))
+            self._conectores = re.compile(r'(?=[' + iniciales + r'])\b' + _alternation(palabras) + r'\b', re.IGNORECASE)
+        else:
+            self._conectores = None
+        # Palabras que contienen "<n>de<m>" (incluye "pagina<n>de<m>")
+        self._n_de_m = re.compile(r'\dde\d', re.IGNORECASE)
+        # "p a g i n a<n>d e<m>"; el \b inicial se expresa con un lookbehind despues del literal
+        self._pagina_espaciada = re.compile(r'p(?<!\wp) a g i n a\d+d e\d+\b', re.IGNORECASE)
+        # Palabras completas que pueden formar parte de un conector (para elegir cortes en stream)
+        self._parte_conector = re.compile(_alternation({parte for word in palabras for parte in word.split()}),
+                                          re.IGNORECASE) if palabras else None
+
+    @staticmethod
+    def collapse_spaces(texto: str) -> str:
+        """
+        Equivalente a re.sub(r'\\s+', ' ', texto).strip().
+        """
+        return " ".join(texto.split())
+
+    def normalize(self, texto: str) -> str:
+        """
+        Minusculas y sin diacriticos (equivalente a normalize_text).
+        """
+        texto = texto.lower()
+        if texto.isascii():
+            return texto
+        return unicodedata.normalize('NFKD', texto).encode('ASCII', 'ignore').decode('utf-8')
+
+    def remove_connectors(self, texto: str) -> str:
+        """
+        Elimina las palabras conectivas y colapsa los espacios (equivalente a remove_connector_words).
+        """
+        if self._conectores is not None:
+            texto = self._conectores.sub('', texto)
+        return self.collapse_spaces(texto)
+
+    def _remove_n_de_m_words(self, texto: str) -> str:
+        """
+        Elimina las palabras completas (secuencias de \\w) que contienen "<n>de<m>", como
+        re.sub(r'\\b\\w*\\d+de\\d+\\w*\\b', '', texto, flags=re.IGNORECASE).
+        """
+        partes = []
+        anterior = 0
+        for match in self._n_de_m.finditer(texto):
+            if match.start() < anterior:
+                # Dentro de una palabra que ya se elimino
+                continue
+            inicio, fin = match.start(), match.end()
+            while inicio > anterior and _is_word_char(texto[inicio - 1]):
+                inicio -= 1
+            while fin < len(texto) and _is_word_char(texto[fin]):
+                fin += 1
+            partes.append(texto[anterior:inicio])
+            anterior = fin
+        if not partes:
+            return texto
+        partes.append(texto[anterior:])
+        return "".join(partes)
+
+    def remove_pagination(self, texto: str) -> str:
+        """
+        Elimina las palabras de paginacion y colapsa los espacios (equivalente a remove_pagination_words).
+        """
+        texto = self._pagina_espaciada.sub('', texto)
+        texto = self._remove_n_de_m_words(texto)
+        return self.collapse_spaces(texto)
+
+    def clean(self, texto: str) -> str:
+        """
+        remove_pagination(remove_connectors(texto)), el paso de main.parser_uniformizador.
+        """
+        return self.remove_pagination(self.remove_connectors(texto))
+
+    def _safe_cut(self, texto: str) -> int:
+        """
+        Ultima posicion (inicio de un bloque de espacios) donde clean(texto) se puede calcular
+        por partes: las palabras a ambos lados son alfabeticas, de al menos 3 letras, no forman
+        parte de un conector ni de "p a g i n a<n>d e<m>", y la de la derecha esta completa.
+        Devuelve 0 si no hay un corte seguro.
+        """
+        # Solo se busca al final del texto; la primera palabra de la ventana puede estar cortada
+        desde = max(0, len(texto) - _VENTANA_CORTE)
+        palabras = [(m.start(), m.end()) for m in _PALABRA.finditer(texto, desde)]
+        primera = 1 if desde == 0 else 2
+        # La palabra de la derecha (i) tiene que estar seguida de otra para estar completa
+        for i in range(len(palabras) - 2, primera - 1, -1):
+            if all(self._safe_word(texto[inicio:fin]) for inicio, fin in palabras[i - 1:i + 1]):
+                return palabras[i - 1][1]
+        return 0
+
+    def _safe_word(self, palabra: str) -> bool:
+        return (len(palabra) >= 3 and palabra.isalpha() and
+                (self._parte_conector is None or not self._parte_conector.fullmatch(palabra)))
+
+    def stream(self, paginas: Iterable[str]) -> Iterator[str]:
+        """
+        Aplica normalize y clean sobre un iterador de paginas a medida que llegan.
+        "".join(stream(paginas)) == clean(normalize("".join(paginas))).
+
+        Yields:
+            str: Fragmentos consecutivos del texto normalizado.
+        """
+        pendiente = ""
+        emitido = False
+        for pagina in paginas:
+            pendiente += self.normalize(pagina)
+            corte = self._safe_cut(pendiente)
+            if not corte:
+                continue
+            salida = self.clean(pendiente[:corte])
+            pendiente = pendiente[corte:]
+            if salida:
+                yield (" " if emitido else "") + salida
+                emitido = True
+        salida = self.clean(pendiente)
+        if salida:
+            yield (" " if emitido else "") + salida
+
+
+# Instancia con los conectores por defecto (la usan las funciones de Parser_pdf2)
+default_normalizer = TextNormalizer()
+
+
+@lru_cache(maxsize=32)
+def _normalizer_for(connector_words: frozenset) -> TextNormalizer:
+    return TextNormalizer(connector_words)
+
+
+def get_normalizer(connector_words: Iterable[str] = None) -> TextNormalizer:
+    """
+    Normalizador para un conjunto de conectores (los patrones se compilan una vez por conjunto).
+    """
+    if connector_words is None:
+        return default_normalizer
+    return _normalizer_for(frozenset(connector_words))
@@ -0,0 +1,155 @@
+"""
+Tabla de offsets de las secciones de un documento.
+
+Se construye una sola vez por documento y la comparten el chunking (los chunks son rangos
+de palabras y la pertenencia a una seccion es una busqueda por intervalos), la comparacion
+de secciones entre documentos y la base de datos (start_word/end_word de cada chunk).
+"""
+import bisect
+import json
+import re
+
+import numpy as np
+
+
+class SectionTable:
+    """
+    Posiciones de los marcadores de seccion dentro de un texto.
+
+    Para cada marcador se guardan todas sus apariciones (offset de caracter), con la misma
+    semantica que str.find; las palabras del texto son las de texto.split() y se guardan los
+    offsets de caracter donde empieza y termina cada una.
+
+    Args:
+        texto (str): Texto del documento.
+        indices (list[str]): Marcadores de seccion, en el orden del indice.
+    """
+    def __init__(self, texto: str, indices: list[str]):
+        self.texto = texto
+        self.indices = list(indices)
+        self.rango = {marker: i for i, marker in enumerate(self.indices)}
+
+        self.palabras = texto.split()
+        longitudes = np.fromiter(map(len, self.palabras), dtype=np.int64, count=len(self.palabras))
+        if " ".join(self.palabras) == texto:
+            # Texto uniformizado (un solo espacio entre palabras): offsets por suma acumulada
+            self.inicios = np.concatenate(([0], np.cumsum(longitudes[:-1] + 1))).astype(np.int64) \
+                if len(longitudes) else longitudes
+        else:
+            self.inicios = np.fromiter((m.start() for m in re.finditer(r'\S+', texto)), dtype=np.int64,
+                                       count=len(self.palabras))
+        self.finales = self.inicios + longitudes
+
+        # Apariciones de cada marcador (offsets de inicio ordenados)
+        self.ocurrencias = {}
+        for marker in dict.fromkeys(self.indices):
+            posiciones = []
+            pos = texto.find(marker) if marker else -1
+            while pos != -1:
+                posiciones.append(pos)
+                pos = texto.find(marker, pos + 1)
+            self.ocurrencias[marker] = posiciones
+
+        # Todas las apariciones ordenadas por inicio, para la busqueda por intervalos
+        todas = sorted((pos, pos + len(marker), marker)
+                       for marker, posiciones in self.ocurrencias.items() for pos in posiciones)
+        self._inicio_ocurrencias = [inicio for inicio, _, _ in todas]
+        self._ocurrencias = todas
+
+    def first(self, marker: str, desde: int = 0) -> int:
+        """
+        Primera aparicion de 'marker' a partir de 'desde' (-1 si no aparece), como texto.find.
+        """
+        posiciones = self.ocurrencias.get(marker)
+        if posiciones is None:
+            return self.texto.find(marker, desde)
+        i = bisect.bisect_left(posiciones, desde)
+        return posiciones[i] if i < len(posiciones) else -1
+
+    def found(self) -> list[str]:
+        """
+        Marcadores que aparecen en el texto, en el orden del indice.
+        """
+        return [marker for marker in self.indices if self.ocurrencias.get(marker)]
+
+    def word_range(self, start: int, end: int) -> tuple[int, int]:
+        """
+        Rango de palabras [inicio, fin) que cubre los caracteres [start, end).
+        """
+        return (int(np.searchsorted(self.finales, start, side="right")),
+                int(np.searchsorted(self.inicios, end, side="left")))
+
+    def char_span(self, start_word: int, end_word: int) -> tuple[int, int]:
+        """
+        Offsets de caracter del rango de palabras [start_word, end_word).
+        """
+        return int(self.inicios[start_word]), int(self.finales[end_word - 1])
+
+    def markers_in(self, start_word: int, end_word: int) -> list[str]:
+        """
+        Marcadores con alguna aparicion completa dentro del rango de palabras [start_word, end_word),
+        en el orden del indice (equivale a 'marker in " ".join(palabras[start_word:end_word])'
+        cuando las palabras estan separadas por un solo espacio).
+        """
+        if start_word >= end_word:
+            return []
+        inicio, fin = self.char_span(start_word, end_word)
+        desde = bisect.bisect_left(self._inicio_ocurrencias, inicio)
+        hasta = bisect.bisect_left(self._inicio_ocurrencias, fin)
+        encontrados = {marker for _, final, marker in self._ocurrencias[desde:hasta] if final <= fin}
+        return sorted(encontrados, key=self.rango.__getitem__)
+
+    def text(self, start_word: int, end_word: int) -> str:
+        return " ".join(self.palabras[start_word:end_word])
+
+    def sections(self) -> list[tuple[str, int, int]]:
+        """
+        Particion del texto en secciones: (marcador, inicio, fin) en caracteres, desde la
+        primera aparicion de cada marcador hasta la del siguiente en el texto. El texto previo
+        al primer marcador forma una seccion con marcador "".
+        """
+        posiciones = sorted((posiciones[0], marker) for marker, posiciones in self.ocurrencias.items() if posiciones)
+        cortes = [(0, "")] + posiciones
+        return [(marker, start, cortes[j + 1][0] if j + 1 < len(cortes) else len(self.texto))
+                for j, (start, marker) in enumerate(cortes)]
+
+    def segment(self, marker: str, next_marker: str = None) -> str:
+        """
+        Texto desde la primera aparicion de 'marker' hasta la siguiente aparicion de
+        'next_marker' (o el final del texto); "" si el marcador no aparece.
+        """
+        start = self.first(marker)
+        if start == -1:
+            return ""
+        end = self.first(next_marker, start) if next_marker is not None else -1
+        if end == -1:
+            end = len(self.texto)
+        return self.texto[start:end].strip()
+
+    def to_dict(self) -> dict:
+        """
+        Tabla serializable: marcador -> offsets de caracter y de palabra de su seccion.
+        """
+        tabla = {}
+        for marker, start, end in self.sections():
+            if not marker:
+                continue
+            start_word, end_word = self.word_range(start, end)
+            tabla[marker] = {"start": start, "end": end, "start_word": start_word, "end_word": end_word}
+        return tabla
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+def chunk_spans(start_word: int, end_word: int, chunk_size: int = 200, overlap: int = 25) -> list[tuple[int, int]]:
+    """
+    Rangos de palabras [inicio, fin) de los chunks de 'chunk_size' palabras con 'overlap' de solapamiento.
+    """
+    spans = []
+    inicio = start_word
+    while inicio < end_word:
+        spans.append((inicio, min(inicio + chunk_size, end_word)))
+        inicio += chunk_size - overlap
+    return spans
@@ -1,19 +1,34 @@
 from parser.Chunking_loading import retrieve_knn_difference, retrieve_knn_QA
-from db.connection import create_conn
-from LLM import claude_call, bedrock_runtime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from db.connection import create_conn, create_pool, pooled_conn
+from LLM import claude_call, claude_stream
+from resources import get_bedrock
 from parser.Parser_pdf2 import remove_connector_words, normalize_text 
-from Questions import Querys
-from diferencias import diferencias
-from db.comparison_db import create_comparison_table, insert_comparison
-import ast
+from db.comparison_db import create_comparison_table, insert_comparisons
+from resources import get_embedding_provider
+from router import route
+from context_packer import pack_chunks, pack_texts
+from answer_cache import get_answer_cache
+import telemetry
 
-# Read indexes.txt file
-with open('index.txt', 'r') as file:
-    indexes = file.read().splitlines()
-# convert it into array
-indexes = [line.split(' ')[0] for line in indexes]
+_indexes = None
+
+def load_indexes(path='index.txt'):
+    """
+    Lee (una sola vez por proceso) la lista de indices generada por main.py.
+    """
+    global _indexes
+    if _indexes is None:
+        # Read indexes.txt file
+        with open(path, 'r') as file:
+            indexes = file.read().splitlines()
+        # convert it into array
+        _indexes = [line.split(' ')[0] for line in indexes]
+    return _indexes
 
 def get_indexes(query):
+    indexes = load_indexes()
     prompt = (
         f"Estas encargado de analizar preguntas para extraer secciones, apartados o indices e indicar que secciones de las Options se estan pidiendo.\n\n"
         f"Options: {indexes}\n"
@@ -27,7 +42,7 @@ def get_indexes(query):
         f"Template Answer: []\n"
         f"Answer: "
     )
-    response = claude_call(bedrock_runtime, prompt, query)
+    response = claude_call(get_bedrock(), prompt, query)
     # Extract and return the generated answer
     answer = response['content'][0]['text'].strip()
     # answer has to be only the part of the text similar as list []
@@ -41,20 +56,12 @@ def get_indexes(query):
 
     return answer
 
-def rag_call_differences(query_text, conn, list_indexes, k=5):
+@telemetry.traced("rag.prompt_differences")
+def prompt_differences(query_text, conn, list_indexes, k=5, sources=None):
     """
-    Performs a RAG call by:
-      - Retrieving the k most similar chunks from the database.
-      - Constructing a prompt that includes these chunks as context.
-      - Calling a generative model to produce an answer.
-    
-    Args:
-        query_text (str): The question or query text.
-        conn: A connection to the database.
-        k (int): The number of chunks to retrieve.
-    
-    Returns:
-        str: The generated answer.
+    Builds the prompt of rag_call_differences: retrieves the k most similar differences
+    from the database and uses them as context. If 'sources' (set) is given it receives the
+    documents of the retrieved differences (None for rows stored without their pair).
     """
 
     query_text_tmp = remove_connector_words(query_text)
@@ -67,25 +74,24 @@ def rag_call_differences(query_text, conn, list_indexes, k=5):
             list_indexes = ''
             k = 5
         results = retrieve_knn_difference(conn,list_indexes, query_text_tmp, k=k)
-        answer = "\n---\n".join([row[1] for row in results])
+        answer = pack_texts([row[1] for row in results])
     else:
         if list_indexes == []:
             results = retrieve_knn_difference(conn, list_indexes = '', query_text=query_text_tmp, k=k)
         else:
             results = retrieve_knn_difference(conn, list_indexes, query_text_tmp, k=k)
-        answer = "\n---\n".join([row[1] for row in results])
+        answer = pack_texts([row[1] for row in results])
+    if sources is not None:
+        for row in results:
+            sources.update(row[3].split(":") if row[3] else [None])
     prompt = (
         f"Estas encargado de analizar, resumir texto sin perjudicar el Context y responder a la pregunta solicitada\n\n"
         f"Context:\n{answer}\n\n"
         f"Answer: "
     )
-    response = claude_call(bedrock_runtime, prompt, query_text)
-    # Extract and return the generated answer
-    answer = response['content'][0]['text'].strip()
-    # Concatenate the retrieved chunks to form the context
-    return answer
+    return prompt
 
-def rag_call_QA(query_text, conn, list_indexes,  k=5):
+def rag_call_differences(query_text, conn, list_indexes, k=5, sources=None):
     """
     Performs a RAG call by:
       - Retrieving the k most similar chunks from the database.
@@ -96,36 +102,87 @@ def rag_call_QA(query_text, conn, list_indexes,  k=5):
         query_text (str): The question or query text.
         conn: A connection to the database.
         k (int): The number of chunks to retrieve.
+        sources (set): Receives the documents used as context (see prompt_differences).
     
     Returns:
         str: The generated answer.
     """
+    prompt = prompt_differences(query_text, conn, list_indexes, k, sources)
+    response = claude_call(get_bedrock(), prompt, query_text)
+    # Extract and return the generated answer
+    answer = response['content'][0]['text'].strip()
+    # Concatenate the retrieved chunks to form the context
+    return answer
+
+@telemetry.traced("rag.prompt_QA")
+def prompt_QA(query_text, conn, list_indexes, k=5, sources=None):
+    """
+    Builds the prompt of rag_call_QA: retrieves the k most similar chunks from the
+    database and uses them as context. If 'sources' (set) is given it receives the names
+    of the documents of the retrieved chunks.
+    """
 
     query_text_tmp = remove_connector_words(query_text)
     query_text_tmp = normalize_text(query_text_tmp)
 
     # Retrieve the k nearest chunks using the retrieval function defined earlier
     results = retrieve_knn_QA(conn, query_text_tmp, list_indexes, k)
-    # Concatenate the retrieved chunks to form the context
-    context = "\n---\n".join([row[2] for row in results])
+    if sources is not None:
+        sources.update(row[0] for row in results)
+    # Merge overlapping neighbors, drop duplicates and, if RAG_CONTEXT_TOKENS is set, fit the
+    # token budget (see context_packer.py)
+    context = pack_chunks(results)
     # Build a prompt that provides context and then asks the query
     prompt = (
         f"Eres un analizador de Textos. Utilizando el siguiente contexto responde la pregunta:\n\n"
         f"Context:\n{context}\n\n"
         f"Answer:"
     )
+    return prompt
 
-    response = claude_call(bedrock_runtime, prompt, query_text)
+def rag_call_QA(query_text, conn, list_indexes,  k=5, sources=None):
+    """
+    Performs a RAG call by:
+      - Retrieving the k most similar chunks from the database.
+      - Constructing a prompt that includes these chunks as context.
+      - Calling a generative model to produce an answer.
+    
+    Args:
+        query_text (str): The question or query text.
+        conn: A connection to the database.
+        k (int): The number of chunks to retrieve.
+        sources (set): Receives the documents used as context (see prompt_QA).
+    
+    Returns:
+        str: The generated answer.
+    """
+    prompt = prompt_QA(query_text, conn, list_indexes, k, sources)
+    response = claude_call(get_bedrock(), prompt, query_text)
     
     # Extract and return the generated answer
     answer = response['content'][0]['text'].strip()
     return answer
 
-conn = create_conn()
-# Create the database table if it doesn't exist
-create_comparison_table(conn)
+def rag_stream_differences(query_text, conn, list_indexes, k=5, stats=None, sources=None):
+    """
+    Streaming version of rag_call_differences: yields the answer text as it is generated.
+    'stats' (dict) receives time-to-first-token and tokens/s (see LLM.claude_stream).
+    """
+    prompt = prompt_differences(query_text, conn, list_indexes, k, sources)
+    yield from claude_stream(get_bedrock(), prompt, query_text, stats=stats)
+
+def rag_stream_QA(query_text, conn, list_indexes, k=5, stats=None, sources=None):
+    """
+    Streaming version of rag_call_QA: yields the answer text as it is generated.
+    'stats' (dict) receives time-to-first-token and tokens/s (see LLM.claude_stream).
+    """
+    prompt = prompt_QA(query_text, conn, list_indexes, k, sources)
+    yield from claude_stream(get_bedrock(), prompt, query_text, stats=stats)
 
-for query in Querys:
+def is_comparison(query):
+    """
+    Pregunta al LLM si la consulta busca comparar documentos (YES/NO).
+    """
     prompt = (
         f"Estas encargado de analizar preguntas para conocer si se busca comparar documentos o no\n\n"
         f"Options: NO | YES\n"
@@ -135,19 +192,223 @@ for query in Querys:
         f"Template Answer: NO\n"
         f"Answer: "
     )
-    response = claude_call(bedrock_runtime, prompt, query)
+    response = claude_call(get_bedrock(), prompt, query)
     # Extract and return the generated answer
     answer = response['content'][0]['text'].strip()
-    list_indexes = get_indexes(query)
+    return "YES" in answer
+
+@telemetry.traced("rag.route")
+def route_query(query, local_router=True):
+    """
+    Devuelve (es comparacion, indices) para la pregunta. Con local_router se usa el enrutador
+    local (router.route) y solo se llama al LLM cuando su confianza es baja.
+    """
+    if local_router:
+        decision = route(query, fallback_compare=is_comparison, fallback_indexes=get_indexes)
+        return decision["compare"], decision["indexes"]
+    return is_comparison(query), get_indexes(query)
+
+def _documents(sources):
+    """
+    Documentos de los que depende una respuesta (None si alguna fila no indica su documento).
+    """
+    return None if None in sources else sources
+
+@telemetry.traced("rag.answer_question")
+def answer_question(query, conn, local_router=True, use_cache=True):
+    """
+    Responde una pregunta: cache semantica (ver answer_cache.py), enrutamiento, recuperacion
+    y llamada al LLM.
+    """
+    cache = get_answer_cache() if use_cache else None
+    clave = cache.lookup(conn, query) if cache is not None else None
+    if clave is not None and clave["answer"] is not None:
+        telemetry.annotate(cache="hit", similarity=clave["similarity"])
+        return clave["answer"]
+    inicio = time.perf_counter()
+    compare, list_indexes = route_query(query, local_router)
+    telemetry.annotate(compare=compare, indexes=len(list_indexes))
+    sources = set()
     # Check if the answer indicates a comparison
+    if compare:
+        answer = rag_call_differences(query, conn, list_indexes, sources=sources)
+    else:
+        answer = rag_call_QA(query, conn, list_indexes, sources=sources)
+    if cache is not None:
+        cache.store(conn, query, clave, answer, compare, _documents(sources), time.perf_counter() - inicio)
+    return answer
+
+def answer_question_stream(query, conn, local_router=True, stats=None, use_cache=True):
+    """
+    Igual que answer_question pero entrega la respuesta en fragmentos a medida que se genera.
+    Una respuesta de la cache se entrega en un solo fragmento.
+    """
+    cache = get_answer_cache() if use_cache else None
+    clave = cache.lookup(conn, query) if cache is not None else None
+    if clave is not None and clave["answer"] is not None:
+        if stats is not None:
+            stats.update(ttft=0.0, duration=0.0, output_tokens=0, tokens_per_s=0.0, cached=True)
+        return iter([clave["answer"]])
+    inicio = time.perf_counter()
+    compare, list_indexes = route_query(query, local_router)
+    sources = set()
+    if compare:
+        fragmentos = rag_stream_differences(query, conn, list_indexes, stats=stats, sources=sources)
+    else:
+        fragmentos = rag_stream_QA(query, conn, list_indexes, stats=stats, sources=sources)
+    if cache is None:
+        return fragmentos
+
+    def guardar_al_terminar():
+        partes = []
+        for fragmento in fragmentos:
+            partes.append(fragmento)
+            yield fragmento
+        cache.store(conn, query, clave, "".join(partes).strip(), compare, _documents(sources),
+                    time.perf_counter() - inicio)
+    return guardar_al_terminar()
+
+def answer_batch(queries, workers=8, pool=None, local_router=True, store=True, use_cache=True):
+    """
+    Responde un lote de preguntas de forma concurrente.
 
-    if "YES" in answer:
-        answer = rag_call_differences(query, conn, list_indexes)
+    Todos los hilos comparten un pool de conexiones y el mismo modelo de embeddings; el
+    resultado conserva el orden de 'queries' y, si store es True, se escribe en la tabla
+    'comparison' con una sola insercion al final.
+
+    Args:
+        queries (list[str]): Preguntas.
+        workers (int): Cantidad de preguntas procesadas a la vez.
+        pool: Pool de conexiones (por defecto se crea uno de tamanho 'workers').
+        local_router (bool): Usar el enrutador local (ver route_query).
+        store (bool): Guardar las respuestas en la tabla 'comparison'.
+        use_cache (bool): Usar la cache semantica de respuestas (ver answer_cache.py).
+
+    Returns:
+        list[dict]: question, answer, latency (segundos) y error por pregunta.
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = create_pool(1, workers)
+    # Cargar el proveedor de embeddings (y su modelo) antes de lanzar los hilos
+    get_embedding_provider().dimension
+
+    def worker(query):
+        inicio = time.perf_counter()
+        try:
+            with pooled_conn(pool) as conn:
+                answer, error = answer_question(query, conn, local_router, use_cache), None
+        except Exception as e:
+            answer, error = "", repr(e)
+        return {"question": query, "answer": answer, "latency": time.perf_counter() - inicio, "error": error}
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(worker, queries))
+        if store:
+            with pooled_conn(pool) as conn:
+                create_comparison_table(conn)
+                # gpt_answer and bert_metrics stay NULL until a reference answer is loaded (see comparison.py)
+                insert_comparisons(conn, [(r["question"], r["answer"], None, None) for r in results
+                                          if r["error"] is None and r["answer"]])
+    finally:
+        if own_pool:
+            pool.closeall()
+    return results
+
+def print_cache_stats(conn=None):
+    """
+    Reporta la tasa de aciertos y la latencia ahorrada por la cache semantica.
+    """
+    cache = get_answer_cache()
+    if not cache.enabled:
+        return
+    stats = cache.stats(conn)
+    print(f"Cache semantica: {stats['hits']}/{stats['hits'] + stats['misses']} aciertos "
+          f"({stats['hit_rate']:.0%}), {stats['saved_seconds']:.2f}s ahorrados, "
+          f"busqueda media {stats['lookup_ms_avg']:.1f}ms")
+    if "table" in stats:
+        tabla = stats["table"]
+        print(f"Cache semantica (acumulado): {tabla['entries']} entradas, {tabla['hits']} aciertos, "
+              f"{tabla['saved_seconds']:.2f}s ahorrados")
+
+def main(local_router=True, stream=False, use_cache=True):
+    from Questions import Querys
+
+    conn = create_conn()
+    # Create the database table if it doesn't exist
+    create_comparison_table(conn)
+
+    for query in Querys:
+        if stream:
+            stats = {}
+            print("answer ", end="", flush=True)
+            for fragmento in answer_question_stream(query, conn, local_router, stats=stats, use_cache=use_cache):
+                print(fragmento, end="", flush=True)
+            print(f"\n[primer token {stats['ttft']:.2f}s, total {stats['duration']:.2f}s, "
+                  f"{stats['output_tokens']} tokens, {stats['tokens_per_s']:.1f} tokens/s]")
+            continue
+        answer = answer_question(query, conn, local_router, use_cache)
+
+        # Insert the comparison into the database
+        print("answer", answer)
+        #insert_comparison(conn, query, answer)
+
+    if use_cache:
+        print_cache_stats(conn)
+    conn.close()
+
+def main_batch(questions_path=None, workers=8, local_router=True, store=True, use_cache=True):
+    """
+    Modo lote: responde las preguntas de un archivo (una por linea) o Questions.Querys
+    y reporta la latencia por pregunta y el throughput total.
+    """
+    if questions_path:
+        with open(questions_path, 'r', encoding='utf-8') as file:
+            queries = [line.strip() for line in file if line.strip()]
     else:
-        answer = rag_call_QA(query, conn, list_indexes)
+        from Questions import Querys
+        queries = Querys
 
-    # Insert the comparison into the database
-    print("answer", answer)
-    #insert_comparison(conn, query, answer)
+    pool = create_pool(1, workers)
+    inicio = time.perf_counter()
+    try:
+        results = answer_batch(queries, workers=workers, pool=pool, local_router=local_router, store=store,
+                               use_cache=use_cache)
+        if use_cache:
+            with pooled_conn(pool) as conn:
+                print_cache_stats(conn)
+    finally:
+        metrics = pool.metrics() if hasattr(pool, "metrics") else None
+        pool.closeall()
+    duracion = time.perf_counter() - inicio
 
-conn.close()
\ No newline at end of file
+    for r in results:
+        estado = "ERROR " + r["error"] if r["error"] else "ok"
+        print(f"[{r['latency']:6.2f}s] {estado:<6} {r['question']}")
+        if not r["error"]:
+            print("answer", r["answer"])
+    latencias = sorted(r["latency"] for r in results)
+    print(f"{len(results)} preguntas en {duracion:.2f}s ({len(results) / duracion:.2f} preguntas/s, "
+          f"workers={workers}, p50={latencias[len(latencias) // 2]:.2f}s, max={latencias[-1]:.2f}s)")
+    if metrics:
+        print(f"Pool: {metrics['checkouts']} checkouts, {metrics['size']} conexiones, "
+              f"espera media {metrics['wait_avg_ms']:.1f}ms, maxima {metrics['wait_max_ms']:.1f}ms, "
+              f"{metrics['timeouts']} timeouts, {metrics['discarded']} descartadas")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-router", action="store_true", help="Usar el LLM para enrutar (sin router local)")
+    parser.add_argument("--batch", action="store_true", help="Responder las preguntas de forma concurrente")
+    parser.add_argument("--questions", help="Archivo con una pregunta por linea (modo lote)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--no-store", action="store_true", help="No guardar las respuestas en 'comparison'")
+    parser.add_argument("--stream", action="store_true", help="Mostrar las respuestas a medida que se generan")
+    parser.add_argument("--no-cache", action="store_true", help="No usar la cache semantica de respuestas")
+    args = parser.parse_args()
+    if args.batch:
+        main_batch(args.questions, args.workers, local_router=not args.llm_router, store=not args.no_store,
+                   use_cache=not args.no_cache)
+    else:
+        main(local_router=not args.llm_router, stream=args.stream, use_cache=not args.no_cache)
@@ -0,0 +1,109 @@
+"""
+Registro de recursos pesados con carga diferida.
+
+El modelo de embeddings y el cliente de Bedrock se crean en el primer uso y se
+reutilizan durante toda la vida del proceso. Importar un modulo del proyecto ya
+no carga modelos ni abre clientes.
+
+    from resources import get_model, get_bedrock
+    model = get_model()          # SentenceTransformer('all-MiniLM-L6-v2')
+    bedrock = get_bedrock()      # boto3.client('bedrock-runtime')
+    provider = get_embedding_provider()  # EMBEDDING_PROVIDER (ver db/embedding_providers.py)
+
+set_resource permite sustituir un recurso (por ejemplo por un cliente simulado).
+"""
+import os
+import threading
+
+_factories = {}
+_instances = {}
+_lock = threading.Lock()
+
+
+def register(name: str, factory) -> None:
+    """
+    Registra la funcion que construye el recurso 'name'.
+    """
+    _factories[name] = factory
+
+
+def get(name: str):
+    """
+    Devuelve el recurso 'name', construyendolo la primera vez que se pide.
+    """
+    try:
+        return _instances[name]
+    except KeyError:
+        pass
+    with _lock:
+        if name not in _instances:
+            _instances[name] = _factories[name]()
+        return _instances[name]
+
+
+def set_resource(name: str, instance) -> None:
+    """
+    Fija la instancia de un recurso (reemplaza la construccion diferida).
+    """
+    with _lock:
+        _instances[name] = instance
+
+
+def reset(name: str = None) -> None:
+    """
+    Descarta la instancia cacheada de 'name' (o de todos los recursos).
+    """
+    with _lock:
+        if name is None:
+            _instances.clear()
+        else:
+            _instances.pop(name, None)
+
+
+def is_loaded(name: str) -> bool:
+    return name in _instances
+
+
+def _load_embedding_model():
+    from sentence_transformers import SentenceTransformer
+    # Este modelo genera vectores de dimensión 384
+    return SentenceTransformer(os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
+
+
+def _load_bedrock():
+    import boto3
+    return boto3.client(
+        service_name='bedrock-runtime',
+        region_name=os.getenv("AWS_REGION", "us-east-1"),
+    )
+
+
+def _load_embedding_provider():
+    from db.embedding_providers import create_provider
+    return create_provider()
+
+
+register("embedding_model", _load_embedding_model)
+register("bedrock", _load_bedrock)
+register("embedding_provider", _load_embedding_provider)
+
+
+def get_model():
+    """
+    Modelo de embeddings (SentenceTransformer) compartido por el proceso.
+    """
+    return get("embedding_model")
+
+
+def get_bedrock():
+    """
+    Cliente 'bedrock-runtime' compartido por el proceso.
+    """
+    return get("bedrock")
+
+
+def get_embedding_provider():
+    """
+    Proveedor de embeddings (local o Titan) compartido por el proceso.
+    """
+    return get("embedding_provider")
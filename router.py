@@ -0,0 +1,179 @@
+"""
+Enrutador local de preguntas (sin LLM).
+
+Reemplaza las dos llamadas previas a la recuperacion en rag.py:
+  - el clasificador YES/NO "¿se busca comparar documentos?", resuelto con el
+    vocabulario de diferencias.py y algunas frases de comparacion;
+  - get_indexes, resuelto buscando en la lista de secciones de index.txt las
+    rutas numericas ("5.1"), los anexos ("Anexo A") y los titulos por similitud
+    difusa (difflib).
+
+Cada decision lleva una confianza; si es menor que el umbral se usa la funcion
+de respaldo (la llamada al LLM original).
+"""
+import difflib
+import re
+import time
+
+from diferencias import diferencias, plurales
+from parser.Parser_pdf2 import normalize_text
+
+# Umbral de confianza por debajo del cual se consulta al LLM
+DEFAULT_THRESHOLD = 0.6
+
+# Frases que indican comparacion aunque no usen el vocabulario de diferencias
+FRASES_COMPARACION = ["ambas versiones", "las mismas", "los mismos", "compar", "version anterior",
+                      "nueva version", "se modifico", "modificacion", "modificaciones"]
+# Palabras que indican que la pregunta se refiere a secciones concretas
+PALABRAS_SECCION = ["seccion", "indice", "apartado", "anexo", "numeral", "capitulo"]
+
+_NUMERO = re.compile(r'(?<![\w.])(\d+(?:\.\d+)*)\.?(?![\w])')
+_ANEXO = re.compile(r'\banexo\s+(?:n\s+)?([a-z])\b')
+
+_titulos = None
+
+
+def load_index_titles(path: str = 'index.txt') -> list[str]:
+    """
+    Lee (una sola vez por proceso) los titulos completos de las secciones de index.txt.
+    """
+    global _titulos
+    if _titulos is None:
+        with open(path, 'r', encoding='utf-8') as file:
+            _titulos = [line.strip() for line in file if line.strip()]
+    return _titulos
+
+
+def _normalizar(texto: str) -> str:
+    texto = normalize_text(texto)
+    return re.sub(r'[^\w\s.]', ' ', texto)
+
+
+def _numero_titulo(titulo: str) -> str:
+    """
+    Ruta numerica de un titulo ("5.1. seguros" -> "5.1"); "" si no tiene.
+    """
+    match = re.match(r'(\d+(?:\.\d+)*)\.?\s', titulo)
+    return match.group(1) if match else ""
+
+
+def _texto_titulo(titulo: str) -> str:
+    return re.sub(r'^\d+(?:\.\d+)*\.?\s*', '', titulo).strip()
+
+
+def classify_comparison(query: str) -> tuple[bool, float]:
+    """
+    Indica si la pregunta busca comparar las versiones del documento.
+
+    Returns:
+        tuple[bool, float]: (es comparacion, confianza)
+    """
+    texto = _normalizar(query)
+    palabras = set(texto.split())
+    vocabulario = {normalize_text(palabra) for palabra in diferencias}
+    if palabras & vocabulario or any(palabra.startswith(("diferencia", "cambio", "distincion")) for palabra in palabras):
+        return True, 0.95
+    if any(frase in texto for frase in FRASES_COMPARACION):
+        return True, 0.7
+    return False, 0.75
+
+
+def match_sections(query: str, titulos: list[str], fuzzy_cutoff: float = 0.8) -> tuple[list[str], float]:
+    """
+    Busca las secciones mencionadas en la pregunta.
+
+    Args:
+        query (str): Pregunta del usuario.
+        titulos (list[str]): Titulos de las secciones (ver load_index_titles).
+        fuzzy_cutoff (float): Similitud minima (difflib) para aceptar un titulo por nombre.
+
+    Returns:
+        tuple[list[str], float]: (titulos encontrados, confianza)
+    """
+    texto = _normalizar(query)
+    encontrados = []
+
+    # Rutas numericas: "5.1", "1, 2 y 3", "seccion 5."
+    numeros = _NUMERO.findall(texto)
+    por_numero = {}
+    for titulo in titulos:
+        por_numero.setdefault(_numero_titulo(titulo), titulo)
+    numeros_sin_match = 0
+    for numero in numeros:
+        if numero in por_numero:
+            encontrados.append(por_numero[numero])
+        else:
+            numeros_sin_match += 1
+
+    # Anexos: "Anexo A"
+    for letra in _ANEXO.findall(texto):
+        for titulo in titulos:
+            if _ANEXO.match(titulo) and _ANEXO.match(titulo).group(1) == letra:
+                encontrados.append(titulo)
+                break
+
+    # Titulos por nombre: se compara cada titulo con ventanas de la pregunta del mismo largo
+    palabras = texto.replace('.', ' ').split()
+    for titulo in titulos:
+        nombre = _texto_titulo(titulo)
+        n = len(nombre.split())
+        # Los titulos genericos ("8. anexos") solo se aceptan por numero
+        if n == 0 or titulo in encontrados or nombre.rstrip('s') in PALABRAS_SECCION:
+            continue
+        ventanas = [" ".join(palabras[i:i + n]) for i in range(max(len(palabras) - n + 1, 0))]
+        if difflib.get_close_matches(nombre, ventanas, n=1, cutoff=fuzzy_cutoff):
+            encontrados.append(titulo)
+
+    encontrados = list(dict.fromkeys(encontrados))
+    menciona_seccion = any(palabra in texto for palabra in PALABRAS_SECCION + [normalize_text(p) for p in plurales])
+
+    if encontrados and numeros_sin_match == 0:
+        return encontrados, 0.9
+    if encontrados:
+        # Algunas rutas numericas no existen en el indice
+        return encontrados, 0.5
+    if menciona_seccion or numeros:
+        # Se piden secciones pero no se reconocio ninguna
+        return [], 0.3
+    return [], 0.8
+
+
+def route(query: str, titulos: list[str] = None, threshold: float = DEFAULT_THRESHOLD,
+          fallback_compare=None, fallback_indexes=None) -> dict:
+    """
+    Decide si la pregunta es de comparacion y que secciones pide, sin LLM salvo que la
+    confianza local sea menor que 'threshold'.
+
+    Args:
+        query (str): Pregunta del usuario.
+        titulos (list[str]): Titulos de las secciones (por defecto, index.txt).
+        threshold (float): Confianza minima para aceptar la decision local.
+        fallback_compare: Funcion query -> bool usada si la clasificacion local no es confiable.
+        fallback_indexes: Funcion query -> list[str] usada si la busqueda local de secciones no es confiable.
+
+    Returns:
+        dict: compare (bool), indexes (list[str]), source ("local" | "llm" | "mixed"),
+              confidence (dict) y latency (segundos).
+    """
+    inicio = time.perf_counter()
+    if titulos is None:
+        titulos = load_index_titles()
+
+    compare, conf_compare = classify_comparison(query)
+    indexes, conf_indexes = match_sections(query, titulos)
+
+    fuentes = []
+    if conf_compare < threshold and fallback_compare is not None:
+        compare = fallback_compare(query)
+        fuentes.append("compare")
+    if conf_indexes < threshold and fallback_indexes is not None:
+        indexes = fallback_indexes(query)
+        fuentes.append("indexes")
+
+    return {
+        "compare": compare,
+        "indexes": indexes,
+        "source": "local" if not fuentes else ("llm" if len(fuentes) == 2 else "mixed"),
+        "confidence": {"compare": conf_compare, "indexes": conf_indexes},
+        "latency": time.perf_counter() - inicio,
+    }
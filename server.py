@@ -0,0 +1,364 @@
+"""
+Servicio HTTP de consultas (asyncio, sin dependencias externas).
+
+Mantiene en memoria durante toda la vida del proceso el proveedor de embeddings, el
+normalizador de texto (parser/normalizer.py), el cliente de Bedrock y el pool de conexiones,
+de modo que cada pregunta solo paga la recuperacion y las llamadas al LLM. Las preguntas se
+atienden de forma concurrente en un pool de hilos (las funciones de rag.py son bloqueantes) y
+cada hilo toma una conexion del pool.
+
+Endpoints:
+    POST /ask       {"question": "..."}                 -> rag.answer_question (cache, enrutamiento, RAG)
+    POST /compare   {"question": "...", "indexes": [..]} -> diferencias entre versiones
+                    (sin "indexes" las secciones se obtienen con el enrutador)
+    GET  /health    estado, preguntas en curso y metricas del pool (503 mientras se detiene)
+    GET  /metrics   metricas en formato de texto de Prometheus (telemetry.metrics_text)
+
+Con SIGINT/SIGTERM el servicio deja de aceptar conexiones, responde 503 a las preguntas
+nuevas, espera (hasta --shutdown-timeout) a que terminen las que estan en curso y cierra el
+pool de conexiones.
+
+Para probarlo sin AWS ni modelos: --fake-llm (Bedrock simulado, ver benchmarks/fakes.py) y
+--fake-embeddings (FakeEncoder), con VECTOR_BACKEND=numpy.
+
+Uso:
+    python server.py --port 8080 --workers 8
+    python server.py --unix /tmp/rag.sock
+    VECTOR_BACKEND=numpy python server.py --fake-llm --fake-embeddings
+    curl -s localhost:8080/ask -d '{"question": "¿Cual es la motivacion del documento?"}'
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_cache
+import rag
+import resources
+import telemetry
+from answer_cache import get_answer_cache
+from db.connection import create_pool, pooled_conn
+from parser.Parser_pdf2 import remove_connector_words, normalize_text
+
+DEFAULT_HOST = os.getenv("RAG_SERVER_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.getenv("RAG_SERVER_PORT", "8080"))
+DEFAULT_WORKERS = int(os.getenv("RAG_SERVER_WORKERS", "8"))
+# Segundos que se espera a las preguntas en curso al detener el servicio
+SHUTDOWN_TIMEOUT = float(os.getenv("RAG_SERVER_SHUTDOWN_TIMEOUT", "30"))
+# Segundos que una conexion keep-alive puede quedar inactiva
+KEEP_ALIVE = 5.0
+MAX_BODY = 1024 * 1024
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class RagService:
+    """
+    Estado del servicio: pool de conexiones, pool de hilos y contadores.
+
+    Args:
+        pool: Pool de conexiones (ver db.connection.create_pool).
+        workers (int): Preguntas atendidas a la vez.
+        local_router (bool): Usar el enrutador local (ver rag.route_query).
+    """
+    def __init__(self, pool, workers: int = DEFAULT_WORKERS, local_router: bool = True):
+        self.pool = pool
+        self.workers = workers
+        self.local_router = local_router
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag")
+        self.started = time.time()
+        self.in_flight = 0
+        self.requests = 0
+        self.draining = False
+        self._connections = set()
+        # Conexiones esperando la siguiente peticion (se pueden cerrar al detenerse)
+        self._idle = set()
+
+    def warm_up(self) -> None:
+        """
+        Carga los recursos pesados antes de aceptar preguntas.
+        """
+        inicio = time.perf_counter()
+        resources.get_embedding_provider().encode_query("precalentamiento")
+        resources.get_bedrock()
+        normalize_text(remove_connector_words("precalentamiento del normalizador"))
+        with pooled_conn(self.pool):
+            pass
+        print(f"Recursos cargados en {time.perf_counter() - inicio:.2f}s")
+
+    # Handlers bloqueantes (se ejecutan en el pool de hilos)
+
+    def _ask(self, question: str) -> dict:
+        with pooled_conn(self.pool) as conn:
+            return {"answer": rag.answer_question(question, conn, self.local_router)}
+
+    def _compare(self, question: str, indexes) -> dict:
+        with pooled_conn(self.pool) as conn:
+            if indexes is None:
+                _, indexes = rag.route_query(question, self.local_router)
+            return {"answer": rag.rag_call_differences(question, conn, indexes), "indexes": indexes}
+
+    def health(self) -> dict:
+        estado = {
+            "status": "draining" if self.draining else "ok",
+            "uptime_s": round(time.time() - self.started, 3),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "workers": self.workers,
+        }
+        if hasattr(self.pool, "metrics"):
+            estado["pool"] = self.pool.metrics()
+        cache = get_answer_cache()
+        if cache.enabled:
+            estado["answer_cache"] = cache.stats()
+        return estado
+
+    def metrics(self) -> str:
+        lineas = [
+            "# TYPE rag_server_in_flight gauge", f"rag_server_in_flight {self.in_flight}",
+            "# TYPE rag_server_uptime_seconds gauge", f"rag_server_uptime_seconds {time.time() - self.started:.3f}",
+        ]
+        cache = get_answer_cache()
+        if cache.enabled:
+            lineas += ["# TYPE rag_answer_cache_hit_rate gauge", f"rag_answer_cache_hit_rate {cache.stats()['hit_rate']:g}"]
+        return telemetry.metrics_text() + "\n".join(lineas) + "\n"
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> tuple[int, bytes, str]:
+        """
+        Atiende una peticion y devuelve (status, cuerpo, content-type).
+        """
+        if path == "/health":
+            if method != "GET":
+                raise HttpError(405, "Use GET")
+            return 503 if self.draining else 200, _json(self.health()), "application/json"
+        if path == "/metrics":
+            if method != "GET":
+                raise HttpError(405, "Use GET")
+            return 200, self.metrics().encode("utf-8"), "text/plain; version=0.0.4"
+        if path not in ("/ask", "/compare"):
+            raise HttpError(404, f"Ruta desconocida: {path}")
+        if method != "POST":
+            raise HttpError(405, "Use POST")
+        if self.draining:
+            raise HttpError(503, "El servicio se esta deteniendo")
+        try:
+            datos = json.loads(body or b"{}")
+        except ValueError:
+            raise HttpError(400, "El cuerpo debe ser JSON")
+        question = datos.get("question") if isinstance(datos, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            raise HttpError(400, "Falta 'question'")
+        indexes = datos.get("indexes")
+        if indexes is not None and not (isinstance(indexes, list) and all(isinstance(i, str) for i in indexes)):
+            raise HttpError(400, "'indexes' debe ser una lista de textos")
+
+        if path == "/ask":
+            handler = functools.partial(self._ask, question)
+        else:
+            handler = functools.partial(self._compare, question, indexes)
+        self.in_flight += 1
+        inicio = time.perf_counter()
+        try:
+            resultado = await asyncio.get_running_loop().run_in_executor(self.executor, handler)
+        finally:
+            self.in_flight -= 1
+        resultado.update(question=question, latency_s=round(time.perf_counter() - inicio, 4))
+        return 200, _json(resultado), "application/json"
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Atiende las peticiones HTTP/1.1 de una conexion (con keep-alive).
+        """
+        tarea = asyncio.current_task()
+        self._connections.add(tarea)
+        try:
+            while True:
+                self._idle.add(tarea)
+                try:
+                    peticion = await asyncio.wait_for(_read_request(reader), KEEP_ALIVE)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HttpError as e:
+                    await _write_response(writer, e.status, _json({"error": str(e)}), "application/json", False)
+                    break
+                finally:
+                    self._idle.discard(tarea)
+                if peticion is None:
+                    break
+                method, path, body, keep_alive = peticion
+                inicio = time.perf_counter()
+                try:
+                    status, cuerpo, content_type = await self.dispatch(method, path, body)
+                except HttpError as e:
+                    status, cuerpo, content_type = e.status, _json({"error": str(e)}), "application/json"
+                except Exception as e:
+                    status, cuerpo, content_type = 500, _json({"error": repr(e)}), "application/json"
+                self.requests += 1
+                endpoint = path if path in ("/ask", "/compare", "/health", "/metrics") else "otro"
+                telemetry.inc("http_requests_total", endpoint=endpoint, status=str(status))
+                telemetry.observe("http_request_seconds", time.perf_counter() - inicio, endpoint=endpoint)
+                keep_alive = keep_alive and not self.draining
+                await _write_response(writer, status, cuerpo, content_type, keep_alive)
+                if not keep_alive:
+                    break
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._connections.discard(tarea)
+            writer.close()
+
+    async def shutdown(self, server: asyncio.AbstractServer, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        """
+        Deja de aceptar conexiones, espera a las preguntas en curso y libera los recursos.
+        """
+        self.draining = True
+        server.close()
+        limite = time.monotonic() + timeout
+        # Las conexiones ocupadas terminan al enviar su respuesta (sin keep-alive)
+        while self._connections - self._idle and time.monotonic() < limite:
+            await asyncio.sleep(0.05)
+        if self.in_flight:
+            print(f"Tiempo de espera agotado con {self.in_flight} preguntas en curso")
+        # Conexiones keep-alive inactivas
+        for tarea in list(self._connections):
+            tarea.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await server.wait_closed()
+        self.executor.shutdown(wait=not self.in_flight, cancel_futures=True)
+        self.pool.closeall()
+        telemetry.flush()
+
+
+def _json(datos) -> bytes:
+    return json.dumps(datos, ensure_ascii=False, default=str).encode("utf-8")
+
+
+async def _read_request(reader: asyncio.StreamReader):
+    """
+    Lee una peticion HTTP/1.1: (method, path, body, keep_alive), o None si se cerro la conexion.
+    """
+    linea = await reader.readline()
+    if not linea:
+        return None
+    try:
+        method, path, version = linea.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "Linea de peticion invalida")
+    headers = {}
+    while True:
+        linea = await reader.readline()
+        if linea in (b"\r\n", b"\n", b""):
+            break
+        nombre, _, valor = linea.decode("latin-1").partition(":")
+        headers[nombre.strip().lower()] = valor.strip()
+    try:
+        largo = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HttpError(400, "Content-Length invalido")
+    if largo < 0:
+        raise HttpError(400, "Content-Length invalido")
+    if largo > MAX_BODY:
+        raise HttpError(413, f"El cuerpo supera {MAX_BODY} bytes")
+    body = await reader.readexactly(largo) if largo else b""
+    conexion = headers.get("connection", "").lower()
+    keep_alive = conexion == "keep-alive" if version == "HTTP/1.0" else conexion != "close"
+    return method.upper(), path.split("?", 1)[0], body, keep_alive
+
+
+async def _write_response(writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str,
+                          keep_alive: bool) -> None:
+    cabecera = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(cabecera.encode("latin-1") + body)
+    await writer.drain()
+
+
+async def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix: str = None, workers: int = DEFAULT_WORKERS,
+                local_router: bool = True, shutdown_timeout: float = SHUTDOWN_TIMEOUT, ready=None) -> None:
+    """
+    Levanta el servicio y lo atiende hasta recibir SIGINT o SIGTERM.
+
+    Args:
+        host (str): Direccion TCP.
+        port (int): Puerto TCP (0 = uno libre).
+        unix (str): Ruta de un socket Unix (en lugar de TCP).
+        workers (int): Preguntas atendidas a la vez (tamanho del pool de hilos y de conexiones).
+        local_router (bool): Usar el enrutador local (ver rag.route_query).
+        shutdown_timeout (float): Segundos de espera a las preguntas en curso al detenerse.
+        ready (asyncio.Future): Recibe la direccion cuando el servicio acepta conexiones.
+    """
+    pool = create_pool(1, workers)
+    service = RagService(pool, workers, local_router)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, service.warm_up)
+
+    if unix:
+        if os.path.exists(unix):
+            os.unlink(unix)
+        server = await asyncio.start_unix_server(service.handle_connection, path=unix)
+        direccion = unix
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+        direccion = "http://%s:%d" % server.sockets[0].getsockname()[:2]
+
+    detener = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, detener.set)
+    print(f"Servicio escuchando en {direccion} (workers={workers})")
+    if ready is not None:
+        ready.set_result(direccion)
+    try:
+        await detener.wait()
+    finally:
+        print("Deteniendo el servicio...")
+        await service.shutdown(server, shutdown_timeout)
+        if unix and os.path.exists(unix):
+            os.unlink(unix)
+        print(f"Servicio detenido ({service.requests} peticiones atendidas)")
+
+
+def use_fakes(fake_llm: bool = False, fake_embeddings: bool = False, llm_latency: float = 0.2) -> None:
+    """
+    Reemplaza Bedrock y/o el modelo de embeddings por los dobles de benchmarks/fakes.py. Con el
+    LLM simulado no se usan ni la cache persistente del LLM ni la cache semantica de respuestas.
+    """
+    from benchmarks.fakes import FakeBedrock, FakeEncoder
+    if fake_llm:
+        resources.set_resource("bedrock", FakeBedrock(latency=llm_latency))
+        llm_cache.ENABLED = False
+        get_answer_cache().enabled = False
+    if fake_embeddings:
+        resources.set_resource("embedding_model", FakeEncoder())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="Escuchar en un socket Unix en lugar de TCP")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Preguntas atendidas a la vez")
+    parser.add_argument("--llm-router", action="store_true", help="Usar el LLM para enrutar (sin router local)")
+    parser.add_argument("--shutdown-timeout", type=float, default=SHUTDOWN_TIMEOUT)
+    parser.add_argument("--fake-llm", action="store_true", help="Bedrock simulado (sin AWS)")
+    parser.add_argument("--fake-llm-latency", type=float, default=0.2, help="Segundos por llamada del LLM simulado")
+    parser.add_argument("--fake-embeddings", action="store_true", help="Embeddings simulados (sin modelo)")
+    args = parser.parse_args()
+    # /metrics necesita la telemetria activa aunque no haya archivos de salida
+    telemetry.configure(enabled=True)
+    if args.fake_llm or args.fake_embeddings:
+        use_fakes(args.fake_llm, args.fake_embeddings, args.fake_llm_latency)
+    asyncio.run(serve(args.host, args.port, args.unix, args.workers, local_router=not args.llm_router,
+                      shutdown_timeout=args.shutdown_timeout))
@@ -0,0 +1,304 @@
+"""
+Trazas y metricas livianas del pipeline.
+
+Cada operacion instrumentada abre un span con span(name, **atributos). Los spans se anidan
+con contextvars: los que se abren dentro de otro (en el mismo hilo, o en hilos lanzados con
+bind) son sus hijos, de modo que cada pregunta o cada ingesta forma una traza.
+
+Al cerrar cada span se actualizan las metricas (histograma de duracion por nombre de span y
+los contadores de tokens, filas y textos) y, si esta configurado, se agrega una linea JSON
+con el span. Las metricas se exportan en formato de texto de Prometheus (compatible con el
+textfile collector de node_exporter) o con metrics_text().
+
+Sin exportacion configurada la telemetria esta desactivada: span() devuelve un objeto
+vacio y no se mide nada.
+
+Variables de entorno:
+    TELEMETRY          "1" activa la telemetria aunque no haya archivos de salida (metrics_text).
+    TELEMETRY_JSONL    Archivo donde se agregan los spans terminados (una linea JSON por span).
+    TELEMETRY_PROM     Archivo de metricas en formato de Prometheus (se reescribe al cerrar cada traza).
+"""
+import atexit
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+
+JSONL_PATH = os.getenv("TELEMETRY_JSONL")
+PROM_PATH = os.getenv("TELEMETRY_PROM")
+ENABLED = bool(JSONL_PATH or PROM_PATH) or os.getenv("TELEMETRY", "0") == "1"
+
+# Limites (segundos) de los buckets del histograma de duracion de los spans
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Intervalo minimo (segundos) entre escrituras del archivo de Prometheus
+PROM_WRITE_INTERVAL = 1.0
+
+_current = contextvars.ContextVar("telemetry_span", default=None)
+_lock = threading.Lock()
+_pending = []
+_histograms = {}
+_counters = {}
+_last_prom_write = 0.0
+
+
+class Span:
+    """
+    Operacion medida. Se crea con span() (o start_span() si no debe ser el span actual).
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "start", "_inicio", "duration")
+
+    def __init__(self, name: str, parent: "Span" = None, **attrs):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attrs = attrs
+        self.start = time.time()
+        self._inicio = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def end(self) -> None:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._inicio
+            _finish(self)
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "name": self.name, "start": self.start, "duration_ms": 1000 * (self.duration or 0.0),
+                "attrs": self.attrs}
+
+
+class _NoopSpan:
+    """
+    Span vacio que se devuelve con la telemetria desactivada.
+    """
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _SpanContext:
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.span.set(error=exc_type.__name__)
+        _current.reset(self._token)
+        self.span.end()
+
+
+def configure(enabled: bool = None, jsonl: str = None, prom: str = None) -> None:
+    """
+    Cambia la configuracion en tiempo de ejecucion (por ejemplo desde un benchmark o un servicio).
+    """
+    global ENABLED, JSONL_PATH, PROM_PATH
+    if jsonl is not None:
+        JSONL_PATH = jsonl or None
+    if prom is not None:
+        PROM_PATH = prom or None
+    ENABLED = bool(JSONL_PATH or PROM_PATH) if enabled is None else enabled
+
+
+def span(name: str, **attrs):
+    """
+    Context manager que mide un bloque como hijo del span actual:
+
+        with telemetry.span("rag.retrieval", k=5) as s:
+            ...
+            s.set(rows=len(results))
+    """
+    if not ENABLED:
+        return _NOOP
+    return _SpanContext(Span(name, _current.get(), **attrs))
+
+
+def start_span(name: str, **attrs):
+    """
+    Span hijo del actual que no pasa a ser el span actual; se cierra con end(). Sirve para
+    medir generadores, donde un 'with' alrededor de los yield alteraria el contexto del llamador.
+    """
+    if not ENABLED:
+        return _NOOP
+    return Span(name, _current.get(), **attrs)
+
+
+def annotate(**attrs) -> None:
+    """
+    Agrega atributos al span actual (si hay uno).
+    """
+    if ENABLED:
+        actual = _current.get()
+        if actual is not None:
+            actual.set(**attrs)
+
+
+def traced(name: str = None):
+    """
+    Decorador: cada llamada a la funcion se mide como un span.
+    """
+    def decorador(fn):
+        nombre = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with span(nombre):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorador
+
+
+def bind(fn):
+    """
+    Devuelve fn ejecutandose en una copia del contexto actual, para que los spans abiertos en
+    otro hilo (ThreadPoolExecutor) queden dentro de la traza que lanzo el trabajo.
+    """
+    if not ENABLED:
+        return fn
+    contexto = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return contexto.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    """
+    Suma 'value' al contador 'name' con las etiquetas dadas.
+    """
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """
+    Registra 'value' en el histograma 'name' con las etiquetas dadas.
+    """
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _observe(key, value)
+
+
+def _observe(key, value: float) -> None:
+    histograma = _histograms.get(key)
+    if histograma is None:
+        histograma = _histograms[key] = {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0}
+    for i, limite in enumerate(BUCKETS):
+        if value <= limite:
+            histograma["buckets"][i] += 1
+    histograma["count"] += 1
+    histograma["sum"] += value
+
+
+def _finish(span: Span) -> None:
+    with _lock:
+        _observe(("span_duration_seconds", (("span", span.name),)), span.duration)
+        if JSONL_PATH:
+            _pending.append(span.to_dict())
+    if span.parent_id is None:
+        # Fin de una traza (pregunta, ingesta): se escriben los spans acumulados
+        flush(force=False)
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pares = list(labels) + list(extra)
+    if not pares:
+        return ""
+    escapar = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in pares) + "}"
+
+
+def metrics_text() -> str:
+    """
+    Metricas acumuladas en el formato de texto de Prometheus.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: {"buckets": list(h["buckets"]), "count": h["count"], "sum": h["sum"]}
+                      for key, h in _histograms.items()}
+    lineas = []
+    for nombre in sorted({name for name, _ in counters}):
+        lineas.append(f"# TYPE {nombre} counter")
+        for (name, labels), value in sorted(counters.items()):
+            if name == nombre:
+                lineas.append(f"{nombre}{_format_labels(labels)} {value:g}")
+    for nombre in sorted({name for name, _ in histograms}):
+        lineas.append(f"# TYPE {nombre} histogram")
+        for (name, labels), h in sorted(histograms.items()):
+            if name != nombre:
+                continue
+            for limite, cantidad in zip(BUCKETS, h["buckets"]):
+                lineas.append(f"{nombre}_bucket{_format_labels(labels, (('le', f'{limite:g}'),))} {cantidad}")
+            lineas.append(f"{nombre}_bucket{_format_labels(labels, (('le', '+Inf'),))} {h['count']}")
+            lineas.append(f"{nombre}_sum{_format_labels(labels)} {h['sum']:.6f}")
+            lineas.append(f"{nombre}_count{_format_labels(labels)} {h['count']}")
+    return "\n".join(lineas) + "\n"
+
+
+def flush(force: bool = True) -> None:
+    """
+    Escribe los spans pendientes en TELEMETRY_JSONL y las metricas en TELEMETRY_PROM (este
+    ultimo como maximo una vez por PROM_WRITE_INTERVAL, salvo con force).
+    """
+    global _last_prom_write
+    with _lock:
+        pendientes = _pending[:]
+        _pending.clear()
+    if pendientes and JSONL_PATH:
+        with open(JSONL_PATH, "a", encoding="utf-8") as f:
+            for registro in pendientes:
+                f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+    if PROM_PATH and (force or time.monotonic() - _last_prom_write >= PROM_WRITE_INTERVAL):
+        _last_prom_write = time.monotonic()
+        # Escritura atomica: el collector nunca lee un archivo a medio escribir
+        temporal = f"{PROM_PATH}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(metrics_text())
+        os.replace(temporal, PROM_PATH)
+
+
+def reset() -> None:
+    """
+    Descarta las metricas y los spans pendientes.
+    """
+    with _lock:
+        _pending.clear()
+        _histograms.clear()
+        _counters.clear()
+
+
+atexit.register(lambda: flush() if ENABLED else None)
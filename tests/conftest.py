@@ -0,0 +1,31 @@
+"""
+Fixtures comunes: las pruebas usan los dobles de benchmarks/fakes.py (sin AWS ni modelos) y
+el store local (VECTOR_BACKEND=numpy) en un directorio temporal.
+"""
+import pytest
+
+import llm_cache
+import resources
+from benchmarks.fakes import FakeBedrock, FakeEncoder
+from db.numpy_store import NumpyVectorStore
+
+
+@pytest.fixture
+def encoder():
+    resources.set_resource("embedding_model", FakeEncoder())
+    yield resources.get("embedding_model")
+    resources.reset()
+
+
+@pytest.fixture
+def bedrock(monkeypatch, encoder):
+    # Sin la cache persistente del LLM: cada llamada llega al cliente simulado
+    monkeypatch.setattr(llm_cache, "ENABLED", False)
+    fake = FakeBedrock(latency=0.0)
+    resources.set_resource("bedrock", fake)
+    return fake
+
+
+@pytest.fixture
+def store(tmp_path):
+    return NumpyVectorStore(str(tmp_path / "vector_store"))
@@ -0,0 +1,51 @@
+from answer_cache import SemanticCache, normalize_question, question_numbers
+
+PREGUNTA = "¿Que diferencias hay en la seccion 5.1 de antecedentes?"
+
+
+def _guardar(cache, store, pregunta, respuesta):
+    clave = cache.lookup(store, pregunta)
+    assert clave["answer"] is None
+    cache.store(store, pregunta, clave, respuesta, True, {"tdr_v4", "tdr_v6"}, 1.5)
+
+
+def test_question_numbers():
+    assert question_numbers(normalize_question("¿Y las secciones 7 y 5.1.2?")) == "5.1.2,7"
+    assert question_numbers(normalize_question("¿Cual es la motivacion?")) == ""
+
+
+def test_reuses_answer_for_same_section(encoder, store):
+    cache = SemanticCache(threshold=0.9, enabled=True)
+    _guardar(cache, store, PREGUNTA, "respuesta 5.1")
+
+    clave = cache.lookup(store, "Que diferencias hay en la seccion 5.1 de antecedentes")
+    assert clave["answer"] == "respuesta 5.1"
+    assert cache.stats()["hits"] == 1
+
+
+def test_section_numbers_must_match(encoder, store):
+    # Umbral bajo: los embeddings de ambas preguntas bastarian para reutilizar la respuesta
+    cache = SemanticCache(threshold=0.1, enabled=True)
+    _guardar(cache, store, PREGUNTA, "respuesta 5.1")
+
+    clave = cache.lookup(store, "¿Que diferencias hay en la seccion 5.2 de antecedentes?")
+    assert clave["similarity"] is None
+    assert clave["answer"] is None
+
+    _guardar(cache, store, "¿Que diferencias hay en la seccion 5.2 de antecedentes?", "respuesta 5.2")
+    assert cache.lookup(store, "¿Que diferencias hay en la seccion 5.2 de antecedentes?")["answer"] == "respuesta 5.2"
+    assert cache.lookup(store, PREGUNTA)["answer"] == "respuesta 5.1"
+
+
+def test_question_without_numbers_matches_any_entry(encoder, store):
+    cache = SemanticCache(threshold=0.5, enabled=True)
+    _guardar(cache, store, PREGUNTA, "respuesta 5.1")
+
+    assert cache.lookup(store, "¿Que diferencias hay en la seccion de antecedentes?")["answer"] == "respuesta 5.1"
+
+
+def test_disabled_cache_never_stores(encoder, store):
+    cache = SemanticCache(enabled=False)
+    clave = cache.lookup(store, PREGUNTA)
+    cache.store(store, PREGUNTA, clave, "respuesta", False, None, 1.0)
+    assert store.answer_cache_totals()["entries"] == 0
@@ -0,0 +1,94 @@
+import pytest
+
+import LLM
+from benchmarks.fakes import FakeBedrock, FakeThrottlingError
+from LLM import call_with_backoff, call_differences, is_throttling_error
+from parser.Chunking_loading import diff_segments
+from parser.differences import NO_DIFFERENCES
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    """
+    Esperas pedidas por call_with_backoff (tope de cada una), sin dormir.
+    """
+    topes = []
+
+    def uniform(a, b):
+        topes.append(b)
+        return 0.0
+
+    monkeypatch.setattr(LLM.random, "uniform", uniform)
+    return topes
+
+
+def _falla(veces, error=FakeThrottlingError):
+    llamadas = []
+
+    def fn():
+        llamadas.append(1)
+        if len(llamadas) <= veces:
+            raise error()
+        return "ok"
+
+    return fn, llamadas
+
+
+def test_is_throttling_error():
+    assert is_throttling_error(FakeThrottlingError())
+    assert not is_throttling_error(ValueError("otro error"))
+
+
+def test_retries_throttling_until_success(esperas):
+    fn, llamadas = _falla(3)
+    assert call_with_backoff(fn, base_delay=0.5, max_delay=20.0) == "ok"
+    assert len(llamadas) == 4
+    # Backoff exponencial: el tope se duplica en cada reintento
+    assert esperas == [0.5, 1.0, 2.0]
+
+
+def test_backoff_is_capped_by_max_delay(esperas):
+    fn, _ = _falla(5)
+    call_with_backoff(fn, base_delay=1.0, max_delay=4.0)
+    assert esperas == [1.0, 2.0, 4.0, 4.0, 4.0]
+
+
+def test_gives_up_after_max_retries(esperas):
+    fn, llamadas = _falla(10)
+    with pytest.raises(FakeThrottlingError):
+        call_with_backoff(fn, max_retries=2)
+    assert len(llamadas) == 3
+
+
+def test_other_errors_are_not_retried(esperas):
+    fn, llamadas = _falla(1, error=ValueError)
+    with pytest.raises(ValueError):
+        call_with_backoff(fn)
+    assert len(llamadas) == 1
+    assert esperas == []
+
+
+def test_retries_fake_bedrock_throttling(bedrock, esperas):
+    fake = FakeBedrock(latency=0.0, throttle_rate=0.5, seed=3)
+    for _ in range(10):
+        respuesta = call_with_backoff(call_differences, fake, "prompt", "pregunta", use_cache=False)
+        assert respuesta["content"][0]["text"] == "Respuesta simulada."
+    assert fake.throttled > 0
+    assert fake.calls == 10 + fake.throttled
+
+
+def test_diff_segments_keeps_order_and_bounds_in_flight(bedrock, esperas):
+    # La respuesta repite la primera oracion cambiada del documento 2 para poder verificar el orden
+    fake = FakeBedrock(latency=0.02, throttle_rate=0.2, seed=1,
+                       responses=lambda body: body["system"].split("Texto 2:")[-1].split("\n")[0].strip())
+    pairs = [(f"Seccion {i}. Plazo de {i} dias.", f"Seccion {i}. Plazo de {i + 1} dias.") for i in range(12)]
+    pairs[5] = ("Sin cambios.", "Sin cambios.")
+
+    differences = diff_segments(pairs, max_in_flight=3, bedrock=fake)
+
+    assert differences[5] == NO_DIFFERENCES
+    for i, difference in enumerate(differences):
+        if i != 5:
+            assert f"{i + 1} dias" in difference
+    assert 1 < fake.max_in_flight <= 3
+    assert fake.calls - fake.throttled == 11
@@ -0,0 +1,122 @@
+"""
+Ingesta y consultas de extremo a extremo con los dobles (ver benchmarks/bench_e2e.py): los
+dos TDR de data/ se ingieren una vez por modulo en un NumpyVectorStore temporal.
+"""
+import os
+
+import pytest
+
+import llm_cache
+import rag
+import resources
+import router
+from benchmarks.bench_e2e import run_ingest, run_queries, TimedEncoder, QUERY_STAGES
+from benchmarks.fakes import FakeBedrock, FakeEncoder
+from db.numpy_store import NumpyVectorStore
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+RESUMEN = "Resumen de los cambios de la seccion."
+
+
+@pytest.fixture(scope="module")
+def ingesta(tmp_path_factory):
+    directorio = tmp_path_factory.mktemp("e2e")
+    fake = FakeBedrock(latency=0.0, responses=RESUMEN)
+    encoder = TimedEncoder(FakeEncoder())
+    resources.set_resource("bedrock", fake)
+    resources.set_resource("embedding_model", encoder)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(llm_cache, "ENABLED", False)
+        # run_ingest escribe index.txt en el directorio actual, como main.py
+        mp.chdir(directorio)
+        resultado = run_ingest(os.path.join(DATA, "tdr_v4.pdf"), os.path.join(DATA, "tdr_v6.pdf"),
+                               NumpyVectorStore(str(directorio / "store")), fake, encoder)
+    resources.reset()
+    return directorio, resultado
+
+
+@pytest.fixture
+def tdr_store(ingesta, monkeypatch, encoder):
+    directorio, _ = ingesta
+    monkeypatch.chdir(directorio)
+    # Los indices de index.txt se leen una vez por proceso
+    monkeypatch.setattr(rag, "_indexes", None)
+    monkeypatch.setattr(router, "_titulos", None)
+    return NumpyVectorStore(str(directorio / "store"))
+
+
+def _prompts(fake):
+    """
+    Registra el prompt de sistema de cada llamada a 'fake' y responde con RESUMEN.
+    """
+    prompts = []
+
+    def responder(body):
+        prompts.append(body["system"])
+        return RESUMEN
+
+    fake.responses = responder
+    return prompts
+
+
+def test_ingest_counts(ingesta):
+    directorio, resultado = ingesta
+    counts = resultado["counts"]
+    assert counts["chunks"] > 0 and counts["sections"] > 0
+    # Solo las secciones con cambios llegan al LLM
+    assert 0 < counts["llm_calls"] < counts["sections"]
+    store = NumpyVectorStore(str(directorio / "store"))
+    assert len(store.select("chunks")) == counts["chunks"]
+    assert len(store.select("differences")) == counts["sections"]
+
+
+def test_answer_question_uses_section_context(tdr_store, bedrock):
+    prompts = _prompts(bedrock)
+    answer = rag.answer_question("¿Que seguros se requieren en la seccion 5.3?", tdr_store, use_cache=False)
+
+    assert answer == RESUMEN
+    # Enrutamiento local: una sola llamada, la de la respuesta
+    assert bedrock.calls == 1
+    contexto = prompts[0].split("Context:\n")[1]
+    assert "segur" in contexto
+
+
+def test_comparison_question_uses_differences(tdr_store, bedrock):
+    prompts = _prompts(bedrock)
+    assert rag.answer_question("¿Cuales son las diferencias en la seccion 5.3?", tdr_store, use_cache=False) == RESUMEN
+    assert bedrock.calls == 1
+    assert prompts[0].startswith("Estas encargado de analizar, resumir texto")
+
+
+def test_stream_matches_answer(tdr_store, bedrock):
+    query = "¿Que seguros se requieren en la seccion 5.3?"
+    stats = {}
+    fragmentos = list(rag.answer_question_stream(query, tdr_store, stats=stats, use_cache=False))
+    assert "".join(fragmentos) == rag.answer_question(query, tdr_store, use_cache=False)
+    assert stats["output_tokens"] > 0
+
+
+def test_router_falls_back_to_llm_for_unknown_sections(tdr_store, bedrock):
+    bedrock.responses = "[5.3. seguros]"
+    # La seccion 99 no existe: la busqueda local no es confiable y se consulta al LLM
+    compare, indexes = rag.route_query("¿Que dice la seccion 99 del documento?")
+    assert bedrock.calls == 1
+    assert indexes == ["5.3. seguros"]
+    assert compare is False
+
+
+def test_router_answers_locally_when_confident(tdr_store, bedrock):
+    compare, indexes = rag.route_query("¿Cuales son las diferencias en la seccion 5.3?")
+    assert bedrock.calls == 0
+    assert compare is True
+    assert [index.split(" ")[0] for index in indexes] == ["5.3."]
+
+
+def test_run_queries_reports_stages(tdr_store, bedrock):
+    encoder = TimedEncoder(resources.get("embedding_model"))
+    resources.set_resource("embedding_model", encoder)
+    resultado = run_queries(["¿Que seguros se requieren en la seccion 5.3?", "¿Cual es la finalidad publica?"],
+                            tdr_store, bedrock, encoder)
+    assert set(resultado["stages"]) == set(QUERY_STAGES)
+    assert resultado["counts"]["queries"] == 2
+    assert bedrock.calls == 2
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import resources
+from benchmarks.fakes import FakeBedrock, FakeEncoder
+from db.embedding_providers import LocalEmbeddingProvider, TitanEmbeddingProvider, create_provider
+from db.encoding import encode_chunks, embedding_dimension
+
+TEXTOS = [f"seccion {i} plazo de entrega de {i} dias" for i in range(20)]
+
+
+class RecordingEncoder(FakeEncoder):
+    """
+    FakeEncoder que registra el tamanho de lote de cada llamada a encode.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_sizes = []
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs):
+        self.batch_sizes.append(batch_size)
+        return super().encode(sentences, batch_size=batch_size, **kwargs)
+
+
+def test_local_provider_encodes_in_one_batched_call():
+    encoder = RecordingEncoder(dim=32)
+    provider = LocalEmbeddingProvider(encoder)
+
+    embeddings = provider.encode(TEXTOS, batch_size=8)
+
+    assert embeddings.shape == (len(TEXTOS), 32) and embeddings.dtype == np.float32
+    assert encoder.batch_sizes == [8]
+    np.testing.assert_allclose(embeddings[3], encoder.encode(TEXTOS[3]), rtol=1e-6)
+    assert provider.encode([], batch_size=8).shape == (0, 32)
+
+
+def test_encode_chunks_uses_registered_provider(encoder):
+    resources.set_resource("embedding_provider", LocalEmbeddingProvider(RecordingEncoder(dim=48)))
+    assert embedding_dimension() == 48
+    assert encode_chunks(TEXTOS, batch_size=4).shape == (len(TEXTOS), 48)
+    assert resources.get("embedding_provider").model.batch_sizes == [4]
+
+
+@pytest.mark.parametrize("max_in_flight", [1, 4])
+def test_titan_keeps_order_and_bounds_in_flight(encoder, max_in_flight):
+    fake = FakeBedrock(latency=0.01)
+    provider = TitanEmbeddingProvider(fake, dimension=256, max_in_flight=max_in_flight)
+
+    embeddings = provider.encode(TEXTOS)
+
+    assert embeddings.shape == (len(TEXTOS), 256)
+    # Una peticion por texto, con la ventana llena mientras quedan textos
+    assert fake.calls == len(TEXTOS)
+    assert fake.max_in_flight == max_in_flight
+    esperado = FakeEncoder(256).encode(TEXTOS)
+    np.testing.assert_allclose(embeddings, esperado, rtol=1e-6)
+
+
+def test_titan_retries_throttling(encoder, monkeypatch):
+    monkeypatch.setattr("LLM.random.uniform", lambda a, b: 0.0)
+    fake = FakeBedrock(latency=0.0, throttle_rate=0.3, seed=2)
+    provider = TitanEmbeddingProvider(fake, dimension=256, max_in_flight=3)
+
+    embeddings = provider.encode(TEXTOS)
+
+    assert fake.throttled > 0
+    assert fake.calls == len(TEXTOS) + fake.throttled
+    np.testing.assert_allclose(embeddings, FakeEncoder(256).encode(TEXTOS), rtol=1e-6)
+
+
+def test_titan_query_uses_one_request(encoder):
+    fake = FakeBedrock(latency=0.0)
+    provider = TitanEmbeddingProvider(fake, dimension=512, max_in_flight=8)
+    assert provider.encode_query(TEXTOS[0]).shape == (512,)
+    assert fake.calls == 1
+
+
+def test_create_provider_rejects_unknown_name():
+    assert isinstance(create_provider("titan"), TitanEmbeddingProvider)
+    with pytest.raises(ValueError):
+        create_provider("openai")
@@ -0,0 +1,132 @@
+import asyncio
+import json
+
+import pytest
+
+import answer_cache
+import rag
+import router
+import server
+import telemetry
+from answer_cache import SemanticCache
+from db.embedding_db import insert_embedding_chunks
+from db.numpy_store import NumpyStorePool
+
+INDICES = ["5.3. seguros", "6. plazo de ejecucion"]
+
+
+@pytest.fixture
+def service(bedrock, store, tmp_path, monkeypatch):
+    with open(tmp_path / "index.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(INDICES) + "\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rag, "_indexes", None)
+    monkeypatch.setattr(router, "_titulos", None)
+    monkeypatch.setattr(answer_cache, "_cache", SemanticCache(enabled=False))
+    monkeypatch.setattr(telemetry, "ENABLED", True)
+    telemetry.reset()
+    insert_embedding_chunks(store, ["el contratista debe contar con seguro de responsabilidad civil",
+                                    "el plazo de ejecucion es de 45 dias calendario"],
+                            INDICES, "tdr_v6")
+    servicio = server.RagService(NumpyStorePool(store), workers=2)
+    yield servicio
+    servicio.executor.shutdown()
+    telemetry.reset()
+
+
+def _request(service, *peticiones) -> list:
+    """
+    Envia las peticiones (bytes crudos) al servicio, cada una en su conexion, y devuelve
+    (status, cabeceras, cuerpo) de cada respuesta.
+    """
+    async def enviar(datos):
+        reader, writer = await asyncio.open_connection(*direccion)
+        writer.write(datos)
+        await writer.drain()
+        respuesta = await reader.read()
+        writer.close()
+        cabecera, _, cuerpo = respuesta.partition(b"\r\n\r\n")
+        lineas = cabecera.decode("latin-1").split("\r\n")
+        headers = dict(linea.lower().split(": ", 1) for linea in lineas[1:])
+        return int(lineas[0].split()[1]), headers, cuerpo
+
+    async def main():
+        nonlocal direccion
+        srv = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+        direccion = srv.sockets[0].getsockname()[:2]
+        try:
+            return [await enviar(datos) for datos in peticiones]
+        finally:
+            srv.close()
+            await srv.wait_closed()
+
+    direccion = None
+    return asyncio.run(main())
+
+
+def _post(path: str, cuerpo: bytes, headers: str = None) -> bytes:
+    headers = headers if headers is not None else f"Content-Length: {len(cuerpo)}\r\n"
+    return f"POST {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n{headers}\r\n".encode() + cuerpo
+
+
+def _get(path: str) -> bytes:
+    return f"GET {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n".encode()
+
+
+def test_health(service):
+    [(status, headers, cuerpo)] = _request(service, _get("/health"))
+    assert status == 200
+    assert headers["content-type"] == "application/json"
+    estado = json.loads(cuerpo)
+    assert estado["status"] == "ok" and estado["in_flight"] == 0 and estado["workers"] == 2
+
+
+def test_health_reports_draining(service):
+    service.draining = True
+    [(status, _, cuerpo)] = _request(service, _get("/health"))
+    assert status == 503
+    assert json.loads(cuerpo)["status"] == "draining"
+
+
+def test_ask_and_metrics(service, bedrock):
+    pregunta = json.dumps({"question": "¿Que seguros se requieren en la seccion 5.3?"}).encode()
+    (status, _, cuerpo), (status_metricas, headers, metricas) = _request(service, _post("/ask", pregunta),
+                                                                          _get("/metrics"))
+    assert status == 200
+    respuesta = json.loads(cuerpo)
+    assert respuesta["answer"] == "Respuesta simulada."
+    assert respuesta["question"].startswith("¿Que seguros")
+    assert bedrock.calls == 1
+
+    assert status_metricas == 200
+    assert headers["content-type"].startswith("text/plain")
+    texto = metricas.decode()
+    assert 'http_requests_total{endpoint="/ask",status="200"} 1' in texto
+    assert "rag_server_in_flight 0" in texto
+
+
+def test_compare_with_explicit_indexes(service, bedrock):
+    cuerpo = json.dumps({"question": "¿Que cambio en los seguros?", "indexes": ["5.3. seguros"]}).encode()
+    [(status, _, respuesta)] = _request(service, _post("/compare", cuerpo))
+    assert status == 200
+    assert json.loads(respuesta)["indexes"] == ["5.3. seguros"]
+
+
+@pytest.mark.parametrize("peticion, status", [
+    (_post("/ask", b'{"question": "hola"}', "Content-Length: abc\r\n"), 400),
+    (_post("/ask", b'{"question": "hola"}', "Content-Length: -5\r\n"), 400),
+    (_post("/ask", b"", f"Content-Length: {server.MAX_BODY + 1}\r\n"), 413),
+    (_post("/ask", b"{no es json"), 400),
+    (_post("/ask", b'{"pregunta": "hola"}'), 400),
+    (_post("/compare", b'{"question": "hola", "indexes": "5.3"}'), 400),
+    (_get("/ask"), 405),
+    (_post("/health", b""), 405),
+    (_get("/desconocida"), 404),
+    (b"PETICION INVALIDA\r\n\r\n", 400),
+], ids=["content-length-texto", "content-length-negativo", "cuerpo-grande", "json-invalido", "sin-question",
+        "indexes-no-lista", "metodo-ask", "metodo-health", "ruta-desconocida", "linea-invalida"])
+def test_malformed_requests(service, bedrock, peticion, status):
+    [(recibido, _, cuerpo)] = _request(service, peticion)
+    assert recibido == status
+    assert "error" in json.loads(cuerpo)
+    assert bedrock.calls == 0
@@ -0,0 +1,50 @@
+import llm_cache
+from benchmarks.fakes import FakeBedrock
+from LLM import claude_stream, claude_call
+
+RESPUESTA = "La seccion 5.1 cambia el plazo de entrega de 30 a 45 dias."
+
+
+def test_stream_yields_words_and_stats(bedrock):
+    fake = FakeBedrock(latency=0.01, token_latency=0.002, responses=RESPUESTA)
+    stats = {}
+    fragmentos = list(claude_stream(fake, "prompt", "pregunta", use_cache=False, stats=stats))
+
+    assert len(fragmentos) == len(RESPUESTA.split(" "))
+    assert "".join(fragmentos) == RESPUESTA
+    assert 0 < stats["ttft"] < stats["duration"]
+    assert stats["output_tokens"] == len(RESPUESTA) // 4
+    assert stats["tokens_per_s"] > 0
+    assert stats["cached"] is False
+
+
+def test_stream_answer_matches_claude_call(bedrock):
+    fake = FakeBedrock(latency=0.0, responses=RESPUESTA)
+    completa = claude_call(fake, "prompt", "pregunta", use_cache=False)["content"][0]["text"]
+    assert "".join(claude_stream(fake, "prompt", "pregunta", use_cache=False)) == completa
+
+
+def test_stream_retries_throttling(bedrock, monkeypatch):
+    monkeypatch.setattr("LLM.random.uniform", lambda a, b: 0.0)
+    fake = FakeBedrock(latency=0.0, throttle_rate=0.5, seed=3, responses=RESPUESTA)
+    for _ in range(5):
+        assert "".join(claude_stream(fake, "prompt", "pregunta", use_cache=False)) == RESPUESTA
+    assert fake.throttled > 0
+
+
+def test_stream_stores_and_reuses_cached_answer(bedrock, monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_cache, "ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_cache", llm_cache.ResponseCache(str(tmp_path / "llm.sqlite3")))
+    fake = FakeBedrock(latency=0.0, responses=RESPUESTA)
+
+    assert "".join(claude_stream(fake, "prompt", "pregunta")) == RESPUESTA
+    stats = {}
+    fragmentos = list(claude_stream(fake, "prompt", "pregunta", stats=stats))
+
+    # La segunda vez la respuesta sale completa de la cache, sin llamar a Bedrock
+    assert fragmentos == [RESPUESTA]
+    assert stats["cached"] is True
+    assert fake.calls == 1
+    # claude_call reutiliza la misma entrada (mismo formato que invoke_model)
+    assert claude_call(fake, "prompt", "pregunta")["content"][0]["text"] == RESPUESTA
+    assert fake.calls == 1